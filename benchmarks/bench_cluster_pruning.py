@@ -0,0 +1,94 @@
+"""
+Точность и время поиска с отсечением кандидатов по кластерам ответов
+
+На синтетических данных (пользователи - зашумленные копии нескольких «архетипов»)
+сравнивает полный подсчет совместимости с подсчетом только по лучшим кластерам
+для разных COMPATIBILITY_CLUSTER_MIN_CANDIDATES. Recall@K учитывает равные оценки:
+доля top-K после отсечения, чья совместимость не ниже K-й оценки полного подсчета.
+
+Запуск: python -m benchmarks.bench_cluster_pruning --users 200000 --top-k 500
+"""
+import argparse
+import time
+
+import numpy as np
+
+from bot.services.clustering import (
+    AnswerClusters, answer_features, choose_k, cluster_affinity, fit_clusters
+)
+from bot.services.scoring import score_candidates
+
+
+def synthetic_answers(rng, users: int, questions: int, answers: int, archetypes: int, noise: float) -> np.ndarray:
+    """Матрица номеров ответов (1 - первый вариант), как в AnswerIndex"""
+    centers = rng.integers(0, answers, size=(archetypes, questions))
+    ordinals = centers[rng.integers(0, archetypes, size=users)]
+    noisy = rng.random((users, questions)) < noise
+    ordinals[noisy] = rng.integers(0, answers, size=int(noisy.sum()))
+    return (ordinals + 1).astype(np.int8)
+
+
+def top_k_scores(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    return np.sort(np.partition(scores, len(scores) - k)[len(scores) - k:])[::-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--answers", type=int, default=4)
+    parser.add_argument("--archetypes", type=int, default=12)
+    parser.add_argument("--noise", type=float, default=0.3)
+    parser.add_argument("--top-k", type=int, default=500)
+    parser.add_argument("--searchers", type=int, default=100)
+    parser.add_argument("--min-candidates", type=int, nargs="+", default=[2000, 5000, 20000, 50000])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    matrix = synthetic_answers(rng, args.users, args.questions, args.answers, args.archetypes, args.noise)
+    user_ids = np.arange(1, args.users + 1, dtype=np.int64)
+
+    start = time.perf_counter()
+    features = answer_features(matrix)
+    # Подбор k по подвыборке, как в офлайн-задаче на больших базах
+    sample = rng.choice(len(features), min(len(features), 20_000), replace=False)
+    k, _ = choose_k(features[sample], range(2, 21), args.seed)
+    labels = fit_clusters(features, k, args.seed)
+    affinity = cluster_affinity(matrix, labels, k, seed=args.seed)
+    clusters = AnswerClusters(dict(zip(user_ids.tolist(), labels.tolist())), affinity)
+    print(f"clustering: k={k}, {time.perf_counter() - start:.1f}s")
+
+    searchers = rng.choice(args.users, args.searchers, replace=False)
+    candidate_ids = user_ids
+
+    full_times = []
+    full_kth = []
+    for searcher in searchers:
+        start = time.perf_counter()
+        best = top_k_scores(score_candidates(matrix[searcher], matrix), args.top_k)
+        full_times.append(time.perf_counter() - start)
+        full_kth.append(best[-1])
+    print(f"{'min_candidates':>14} {'scored':>10} {'recall@K':>9} {'ms/search':>10}")
+    print(f"{'full':>14} {args.users:>10} {1.0:>9.3f} {np.mean(full_times) * 1000:>10.2f}")
+
+    for min_candidates in args.min_candidates:
+        times = []
+        recalls = []
+        scored = []
+        for searcher, kth in zip(searchers, full_kth):
+            start = time.perf_counter()
+            selected = clusters.select(int(user_ids[searcher]), candidate_ids, min_candidates)
+            best = top_k_scores(score_candidates(matrix[searcher], matrix[selected]), args.top_k)
+            times.append(time.perf_counter() - start)
+            recalls.append(float((best >= kth).sum()) / args.top_k)
+            scored.append(len(selected))
+        print(
+            f"{min_candidates:>14} {int(np.mean(scored)):>10} {np.mean(recalls):>9.3f} "
+            f"{np.mean(times) * 1000:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
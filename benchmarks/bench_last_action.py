@@ -0,0 +1,83 @@
+"""
+Запись users.lastactiondate при всплеске нажатий: UPDATE на каждое нажатие против LastActionBuffer
+
+Создает --users тестовых пользователей и имитирует --taps нажатий от случайных из них.
+Прямой путь выполняет UPDATE на каждое нажатие, буфер схлопывает отметки
+и пишет их пачками по --batch-size пользователей.
+
+Запуск: python -m benchmarks.bench_last_action --users 2000 --taps 20000
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime
+
+from bot.config import load_config
+from bot.services.database import Database
+from bot.services.last_action_buffer import LastActionBuffer
+
+SEED_ID_BASE = 9_100_000_000
+
+
+async def seed(db: Database, users: int) -> list:
+    user_ids = [SEED_ID_BASE + i for i in range(users)]
+    now = datetime.now()
+    async with db.pool.acquire() as conn:
+        await conn.executemany(
+            "INSERT INTO users (telegramid, name, age, gender, registrationdate, lastactiondate) VALUES ($1, $2, $3, $4, $5, $6)",
+            [(user_id, b"bench", 30, '0', now, now) for user_id in user_ids]
+        )
+    return user_ids
+
+
+async def cleanup(db: Database):
+    async with db.pool.acquire() as conn:
+        await conn.execute("DELETE FROM users WHERE telegramid >= $1 AND telegramid < $2", SEED_ID_BASE, SEED_ID_BASE + 10_000_000)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--taps", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    db = Database(load_config())
+    await db.connect()
+    try:
+        await cleanup(db)
+        user_ids = await seed(db, args.users)
+        rng = random.Random(args.seed)
+        taps = [rng.choice(user_ids) for _ in range(args.taps)]
+
+        start = time.perf_counter()
+        for user_id in taps:
+            async with db.pool.acquire() as conn:
+                await conn.execute("UPDATE users SET lastactiondate = NOW() WHERE telegramid = $1", user_id)
+        direct_time = time.perf_counter() - start
+
+        buffer = LastActionBuffer(db, flush_interval=3600, batch_size=args.batch_size)
+        start = time.perf_counter()
+        for user_id in taps:
+            buffer.touch(user_id)
+            if len(buffer) >= buffer.batch_size:
+                await buffer.flush()
+        await buffer.flush()
+        buffered_time = time.perf_counter() - start
+        stats = buffer.stats()
+
+        print(f"Нажатий: {args.taps}, пользователей: {args.users}")
+        print(f"  UPDATE на нажатие: {args.taps} запросов, {direct_time * 1000:.0f} мс")
+        print(
+            f"  LastActionBuffer:  {stats['flushes']} запросов, {buffered_time * 1000:.0f} мс "
+            f"(средняя пачка {stats['avg_flush_size']:.0f}, сброс {stats['avg_flush_ms']:.1f} мс)"
+        )
+    finally:
+        await cleanup(db)
+        await db.pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
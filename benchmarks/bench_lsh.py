@@ -0,0 +1,84 @@
+"""
+Полнота и время отбора кандидатов через LSH-индекс против полного перебора
+
+Для каждого размера базы строит MinHashLSH по синтетическим ответам и сравнивает
+top-K полного подсчета совместимости с top-K по LSH-кандидатам для разного
+числа опрашиваемых полос (COMPATIBILITY_LSH_PROBE_BANDS). Recall@K учитывает
+равные оценки, как в bench_cluster_pruning.
+
+Запуск: python -m benchmarks.bench_lsh --users 10000 100000 1000000 --top-k 500
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_cluster_pruning import synthetic_answers, top_k_scores
+from bot.services.lsh_index import MinHashLSH
+from bot.services.scoring import score_candidates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--answers", type=int, default=4)
+    parser.add_argument("--archetypes", type=int, default=12)
+    parser.add_argument("--noise", type=float, default=0.3)
+    parser.add_argument("--bands", type=int, default=32)
+    parser.add_argument("--rows", type=int, default=4)
+    parser.add_argument("--probe-bands", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--top-k", type=int, default=500)
+    parser.add_argument("--searchers", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    question_ids = list(range(1, args.questions + 1))
+    for users in args.users:
+        rng = np.random.default_rng(args.seed)
+        matrix = synthetic_answers(rng, users, args.questions, args.answers, args.archetypes, args.noise)
+        user_ids = np.arange(1, users + 1, dtype=np.int64)
+
+        lsh = MinHashLSH(args.bands, args.rows, args.seed)
+        start = time.perf_counter()
+        lsh.rebuild(user_ids, matrix, question_ids)
+        print(
+            f"\nusers={users}: build {time.perf_counter() - start:.1f}s, "
+            f"{lsh.memory_usage() / 1024 / 1024:.1f} MB"
+        )
+
+        searchers = rng.choice(users, min(args.searchers, users), replace=False)
+        full_times = []
+        full_kth = []
+        for searcher in searchers:
+            start = time.perf_counter()
+            best = top_k_scores(score_candidates(matrix[searcher], matrix), args.top_k)
+            full_times.append(time.perf_counter() - start)
+            full_kth.append(best[-1])
+        print(f"{'probe_bands':>11} {'scored':>10} {'recall@K':>9} {'ms/search':>10}")
+        print(f"{'full':>11} {users:>10} {1.0:>9.3f} {np.mean(full_times) * 1000:>10.2f}")
+
+        for probe_bands in args.probe_bands:
+            times = []
+            recalls = []
+            scored = []
+            for searcher, kth in zip(searchers, full_kth):
+                answers = {
+                    question_id: int(answer_id)
+                    for question_id, answer_id in zip(question_ids, matrix[searcher].tolist())
+                }
+                start = time.perf_counter()
+                # Идентификаторы совпадают с номером строки + 1
+                rows = lsh.candidates(answers, probe_bands) - 1
+                best = top_k_scores(score_candidates(matrix[searcher], matrix[rows]), args.top_k)
+                times.append(time.perf_counter() - start)
+                recalls.append(float((best >= kth).sum()) / min(args.top_k, users))
+                scored.append(len(rows))
+            print(
+                f"{probe_bands:>11} {int(np.mean(scored)):>10} {np.mean(recalls):>9.3f} "
+                f"{np.mean(times) * 1000:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
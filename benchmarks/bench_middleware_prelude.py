@@ -0,0 +1,121 @@
+"""
+Стоимость пролога middleware на один апдейт: отдельные запросы против touch_and_check
+
+Сравниваются три варианта:
+  - прежний пролог: UPDATE lastactiondate, SELECT услуг и UPDATE коэффициента
+    приоритета, SELECT блокировки - каждый на своем соединении из пула;
+  - Database.touch_and_check: один запрос с CTE на одном соединении;
+  - текущий пролог: LastActionBuffer и набор заблокированных в памяти, без запросов.
+
+Запуск: python -m benchmarks.bench_middleware_prelude --users 500 --updates 5000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime
+
+from bot.config import load_config
+from bot.services.database import Database
+
+SEED_ID_BASE = 9_300_000_000
+
+
+async def seed(db: Database, users: int) -> list:
+    user_ids = [SEED_ID_BASE + i for i in range(users)]
+    now = datetime.now()
+    async with db.pool.acquire() as conn:
+        await conn.executemany(
+            "INSERT INTO users (telegramid, name, age, gender, registrationdate, lastactiondate) VALUES ($1, $2, $3, $4, $5, $6)",
+            [(user_id, b"bench", 30, '0', now, now) for user_id in user_ids]
+        )
+        # У каждого третьего пользователя есть активная услуга
+        await conn.executemany(
+            """
+            INSERT INTO purchasedservices (usertelegramid, serviceid, serviceenddate, paymentstatus, paymentid)
+            VALUES ($1, 2, NOW() + interval '1 day', TRUE, $1)
+            """,
+            [(user_id,) for user_id in user_ids[::3]]
+        )
+    return user_ids
+
+
+async def cleanup(db: Database):
+    async with db.pool.acquire() as conn:
+        await conn.execute(
+            "DELETE FROM purchasedservices WHERE usertelegramid >= $1 AND usertelegramid < $2",
+            SEED_ID_BASE, SEED_ID_BASE + 10_000_000
+        )
+        await conn.execute("DELETE FROM users WHERE telegramid >= $1 AND telegramid < $2", SEED_ID_BASE, SEED_ID_BASE + 10_000_000)
+
+
+async def legacy_prelude(db: Database, user_id: int) -> bool:
+    async with db.pool.acquire() as conn:
+        await conn.execute("UPDATE users SET lastactiondate = NOW() WHERE telegramid = $1", user_id)
+    coefficient = await db.calculate_priority_coefficient(user_id)
+    async with db.pool.acquire() as conn:
+        await conn.execute(
+            "UPDATE users SET profileprioritycoefficient = $1 WHERE telegramid = $2", coefficient, user_id
+        )
+    async with db.pool.acquire() as conn:
+        return await conn.fetchval(
+            "SELECT EXISTS(SELECT 1 FROM users WHERE telegramid = $1 and accountstatus='blocked')", user_id
+        )
+
+
+async def touch_and_check_prelude(db: Database, user_id: int) -> bool:
+    blocked, _ = await db.touch_and_check(user_id)
+    return blocked
+
+
+async def in_memory_prelude(db: Database, user_id: int) -> bool:
+    await db.update_last_action(user_id)
+    return await db.is_user_blocked(user_id)
+
+
+async def measure(prelude, db: Database, updates: list) -> list:
+    latencies = []
+    for user_id in updates:
+        start = time.perf_counter()
+        await prelude(db, user_id)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name: str, latencies: list):
+    ordered = sorted(latencies)
+    p99 = ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)]
+    print(
+        f"  {name:<18} среднее {statistics.mean(latencies):.3f} мс, "
+        f"медиана {statistics.median(latencies):.3f} мс, p99 {p99:.3f} мс"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    db = Database(load_config())
+    await db.connect()
+    try:
+        await cleanup(db)
+        user_ids = await seed(db, args.users)
+        rng = random.Random(args.seed)
+        updates = [rng.choice(user_ids) for _ in range(args.updates)]
+
+        print(f"Апдейтов: {args.updates}, пользователей: {args.users}")
+        report("прежний пролог", await measure(legacy_prelude, db, updates))
+        report("touch_and_check", await measure(touch_and_check_prelude, db, updates))
+        report("в памяти", await measure(in_memory_prelude, db, updates))
+    finally:
+        await db.last_actions.stop()
+        await cleanup(db)
+        await db.pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""
+Сортировка выдачи: ключ-кортеж на каждого кандидата против lexsort по массивам признаков
+
+Прежний путь собирал словарь результата и кортеж (верификация, приоритет, совместимость)
+для каждого кандидата и сортировал список в Python, новый сортирует массивы
+RankingFeatures одним np.lexsort.
+
+Запуск: python -m benchmarks.bench_ranking --candidates 200000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from bot.services.ranking_features import RankingFeatures, rank_order
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidates", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    user_ids = np.arange(1, args.candidates + 1, dtype=np.int64)
+    features = RankingFeatures()
+    features.rebuild(
+        {'telegramid': user_id, 'profileprioritycoefficient': priority, 'is_verified': verified}
+        for user_id, priority, verified in zip(
+            user_ids.tolist(),
+            rng.choice([1.0, 1.0, 1.0, 1.5, 2.0], args.candidates).tolist(),
+            (rng.random(args.candidates) < 0.2).tolist()
+        )
+    )
+    scores = rng.random(args.candidates) * 100
+
+    start = time.perf_counter()
+    verified, priority = features.lookup(user_ids)
+    lookup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [
+        {'telegramid': user_id, 'is_verified': v, 'priority_coefficient': p, 'compatibility': round(s, 1)}
+        for user_id, v, p, s in zip(user_ids.tolist(), verified.tolist(), priority.tolist(), scores.tolist())
+    ]
+    results.sort(key=lambda r: (r['is_verified'], r['priority_coefficient'], r['compatibility']), reverse=True)
+    tuple_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    order = rank_order(verified, priority, scores)
+    lexsort_time = time.perf_counter() - start
+
+    assert [r['telegramid'] for r in results] == user_ids[order].tolist(), "Порядок выдачи не совпадает"
+    print(f"Кандидатов: {args.candidates}, признаки из памяти: {lookup_time * 1000:.1f} мс")
+    print(f"  Кортежи и list.sort: {tuple_time * 1000:.1f} мс")
+    print(f"  np.lexsort:          {lexsort_time * 1000:.1f} мс ({tuple_time / lexsort_time:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Подсчет совместимости через ScoringEngine: попарный цикл против пакетного подсчета
+
+Попарный score_answers соответствует прежним путям (цикл по пользователям),
+score_users - пакетный подсчет по матрице индекса ответов. Замер повторяется
+с весами ответов, отличными от 1.
+
+Запуск: python -m benchmarks.bench_scoring --users 50000 --questions 10
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from bot.services.answer_index import AnswerIndex
+from bot.services.answer_ordinals import AnswerOrdinals
+from bot.services.scoring_engine import ScoringEngine
+
+
+def generate_answers(users: int, questions: int, options: int, seed: int) -> list:
+    """Генерирует ответы в формате {questionid: answerid} со сквозной нумерацией ответов"""
+    rng = random.Random(seed)
+    return [
+        {q: q * options + rng.randint(1, options) for q in range(1, questions + 1)}
+        for _ in range(users)
+    ]
+
+
+def measure(engine: ScoringEngine, all_answers: list, label: str):
+    user_answers, *candidates = all_answers
+    candidate_ids = list(range(2, len(all_answers) + 1))
+
+    start = time.perf_counter()
+    loop_scores = [engine.score_answers(user_answers, answers) for answers in candidates]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, batch_scores = engine.score_users(1, candidate_ids)
+    batch_time = time.perf_counter() - start
+
+    assert np.allclose(np.asarray(loop_scores), batch_scores), "Результаты расчета не совпадают"
+    print(f"{label}:")
+    print(f"  Попарно score_answers: {loop_time * 1000:.1f} мс")
+    print(f"  Пакетно score_users:   {batch_time * 1000:.1f} мс ({loop_time / batch_time:.0f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    answers_table = [
+        {'questionid': q, 'answerid': q * args.options + option}
+        for q in range(1, args.questions + 1)
+        for option in range(1, args.options + 1)
+    ]
+    ordinals = AnswerOrdinals()
+    ordinals.rebuild(answers_table)
+
+    all_answers = generate_answers(args.users + 1, args.questions, args.options, args.seed)
+    answer_index = AnswerIndex(ordinals)
+    start = time.perf_counter()
+    answer_index.rebuild(
+        {'usertelegramid': user_id, 'questionid': q, 'answerid': a}
+        for user_id, answers in enumerate(all_answers, start=1)
+        for q, a in answers.items()
+    )
+    print(f"Кандидатов: {args.users}, вопросов: {args.questions}, "
+          f"загрузка индекса: {(time.perf_counter() - start) * 1000:.1f} мс")
+
+    engine = ScoringEngine(answer_index)
+    engine.load_weights({'answerid': row['answerid'], 'answerweight': None} for row in answers_table)
+    measure(engine, all_answers, "Без весов")
+
+    rng = random.Random(args.seed)
+    engine.load_weights(
+        {'answerid': row['answerid'], 'answerweight': rng.choice([0.5, 1.0, 1.5, 2.0])} for row in answers_table
+    )
+    measure(engine, all_answers, "С весами ответов")
+
+
+if __name__ == "__main__":
+    main()
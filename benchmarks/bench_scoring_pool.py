@@ -0,0 +1,83 @@
+"""
+Задержка цикла событий при подсчете совместимости в основном процессе и в пуле процессов
+
+Параллельно с подсчетом работает корутина-тикер; ее максимальная задержка показывает,
+насколько подсчет блокирует обработку сообщений других пользователей. Матрица ответов
+размещается в разделяемой памяти пула один раз, как после AnswerIndex.share,
+в воркер передаются только номера строк кандидатов.
+
+Запуск: python -m benchmarks.bench_scoring_pool --users 2000000 --workers 2
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from bot.services.scoring import score_candidates
+from bot.services.scoring_pool import ScoringPool
+
+TICK = 0.005
+
+
+async def ticker(stop: asyncio.Event) -> float:
+    """Возвращает максимальную задержку пробуждения корутины относительно TICK"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        worst = max(worst, time.perf_counter() - start - TICK)
+    return worst
+
+
+async def measure(coro_factory):
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(stop))
+    await asyncio.sleep(TICK * 2)
+    start = time.perf_counter()
+    result = await coro_factory()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return result, elapsed, await tick_task
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2_000_000)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    user_vector = rng.integers(1, 41, size=args.questions, dtype=np.int8)
+    rows = rng.permutation(args.users)
+
+    pool = ScoringPool(max_workers=args.workers, threshold=0)
+    matrix = None
+    try:
+        matrix = pool.matrix.allocate((args.users, args.questions), np.int8, 0)
+        matrix[:] = rng.integers(1, 41, size=(args.users, args.questions), dtype=np.int8)
+        # Прогрев: запуск процессов не должен попадать в замер
+        await pool.score_rows(user_vector, rows[:10])
+
+        async def inline():
+            return score_candidates(user_vector, matrix[rows])
+
+        inline_scores, inline_time, inline_lag = await measure(inline)
+        pool_scores, pool_time, pool_lag = await measure(lambda: pool.score_rows(user_vector, rows))
+    finally:
+        # Блок закрывается, только когда на него не осталось ссылок
+        matrix = None
+        pool.shutdown()
+
+    assert np.array_equal(inline_scores, pool_scores), "Результаты пула и основного процесса не совпадают"
+
+    print(f"Кандидатов: {args.users}, вопросов: {args.questions}")
+    print(f"В основном процессе: {inline_time * 1000:.1f} мс, задержка цикла событий {inline_lag * 1000:.1f} мс")
+    print(f"В пуле процессов:    {pool_time * 1000:.1f} мс, задержка цикла событий {pool_lag * 1000:.1f} мс")
+    print("✅ Результаты совпадают")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
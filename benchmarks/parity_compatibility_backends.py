@@ -0,0 +1,158 @@
+"""
+Проверка совпадения выдачи numpy-, SQL- и предрасчитанного подсчета совместимости
+
+Засевает локальную БД синтетическими пользователями (telegram id начиная с SEED_ID_BASE),
+сравнивает результаты бэкендов и удаляет созданные записи.
+Подключение берется из .env, как у бота. Не запускать на рабочей базе.
+
+Запуск: python -m benchmarks.parity_compatibility_backends --users 2000 --top-k 200
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime
+
+from bot.config import load_config
+from bot.services.algorithm_sovmest import CompatibilityService
+from bot.services.compatibility_refresher import CompatibilityRefresher
+from bot.services.database import Database
+from bot.services.encryption import CryptoService
+
+SEED_ID_BASE = 9_000_000_000
+SEED_CITY = "москва"
+
+
+async def seed(db: Database, crypto: CryptoService, users: int, rng: random.Random) -> list:
+    """Создает пользователей с ответами на все вопросы теста"""
+    _, answers_dict = await db.get_questions_and_answers()
+    if not answers_dict:
+        raise RuntimeError("В таблице answers нет вариантов ответов")
+
+    user_ids = [SEED_ID_BASE + i for i in range(users)]
+    now = datetime.now()
+    city = crypto.encrypt(SEED_CITY)
+    city_index = crypto.city_blind_index(SEED_CITY)
+    async with db.pool.acquire() as conn:
+        # Часть анкет без слепого индекса города, как до бэкфилла
+        await conn.executemany(
+            """
+            INSERT INTO users (telegramid, name, age, gender, city, profiledescription,
+                registrationdate, lastactiondate, profileprioritycoefficient, cityblindindex)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+            """,
+            [
+                (user_id, crypto.encrypt(f"user{user_id}"), rng.randint(18, 60),
+                 '0' if i % 2 == 0 else '1', city, crypto.encrypt("parity"),
+                 now, now, rng.choice([1.0, 1.0, 1.0, 1.5, 2.0]),
+                 city_index if rng.random() < 0.7 else None)
+                for i, user_id in enumerate(user_ids)
+            ]
+        )
+        await conn.executemany(
+            "INSERT INTO useranswers (usertelegramid, questionid, answerid) VALUES ($1, $2, $3)",
+            [
+                (user_id, question_id, rng.choice(list(options)))
+                for user_id in user_ids
+                for question_id, options in answers_dict.items()
+            ]
+        )
+        await conn.executemany(
+            "INSERT INTO verifications (usertelegramid, verificationvideofileid, processingstatus) VALUES ($1, $2, $3)",
+            [(user_id, "parity", 'approve') for user_id in user_ids if rng.random() < 0.2]
+        )
+        # Обновляем статистику, иначе планировщик недооценивает только что вставленные строки
+        await conn.execute("ANALYZE users, useranswers, verifications")
+    return user_ids
+
+
+async def cleanup(db: Database):
+    async with db.pool.acquire() as conn:
+        await conn.execute(
+            "DELETE FROM compatibility_scores WHERE user_a >= $1 OR user_b >= $1", SEED_ID_BASE
+        )
+        await conn.execute("DELETE FROM useranswers WHERE usertelegramid >= $1", SEED_ID_BASE)
+        await conn.execute("DELETE FROM verifications WHERE usertelegramid >= $1", SEED_ID_BASE)
+        await conn.execute("DELETE FROM users WHERE telegramid >= $1", SEED_ID_BASE)
+
+
+async def run_backend(service: CompatibilityService, backend: str, user_id: int, crypto, limit=None):
+    service.db.config.compatibility_backend = backend
+    start = time.perf_counter()
+    high, low = await service.find_compatible_users(
+        user_id=user_id, limit=limit, min_score=50.0, crypto=crypto
+    )
+    return high + low, time.perf_counter() - start
+
+
+def sort_key(result: dict) -> tuple:
+    return result['is_verified'], result['priority_coefficient'], result['compatibility']
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    config = load_config()
+    config.compatibility_top_k = args.top_k
+    db = Database(config)
+    await db.connect()
+    crypto = CryptoService(config.cryptography_key)
+    service = CompatibilityService(db)
+
+    try:
+        await cleanup(db)
+        user_ids = await seed(db, crypto, args.users, random.Random(args.seed))
+        await db.load_answer_index()
+        await db.load_ranking_features()
+        await db.load_profile_partitions()
+        searcher = user_ids[0]
+
+        numpy_results, numpy_time = await run_backend(service, 'numpy', searcher, crypto)
+        sql_results, sql_time = await run_backend(service, 'sql', searcher, crypto)
+
+        refresher = CompatibilityRefresher(db, crypto, batch_size=config.compatibility_refresh_batch_size, throttle=0)
+        start = time.perf_counter()
+        await refresher.refresh_user(searcher)
+        refresh_time = time.perf_counter() - start
+        precomputed_results, precomputed_time = await run_backend(service, 'precomputed', searcher, crypto)
+
+        expected = numpy_results[:args.top_k]
+        numpy_scores = {r['profile']['telegramid']: r['compatibility'] for r in numpy_results}
+
+        for backend, results in (('sql', sql_results), ('precomputed', precomputed_results)):
+            assert len(results) == len(expected), f"{backend} вернул {len(results)} строк, ожидалось {len(expected)}"
+            for result in results:
+                user_id = result['profile']['telegramid']
+                assert numpy_scores.get(user_id) == result['compatibility'], f"{backend}: совместимость с {user_id} не совпадает"
+            # При равных ключах порядок бэкендов может отличаться, поэтому сравниваем последовательность ключей
+            assert [sort_key(r) for r in results] == [sort_key(r) for r in expected], f"{backend}: порядок выдачи не совпадает"
+
+        # Обратная совместимость (кандидат -> пользователь) должна совпадать с подсчетом от лица кандидата
+        partner = expected[0]['profile']['telegramid']
+        partner_high, partner_low = await service.find_compatible_users(
+            user_id=partner, min_score=50.0, crypto=crypto
+        )
+        partner_scores = {r['profile']['telegramid']: r['compatibility'] for r in partner_high + partner_low}
+        config.compatibility_backend = 'numpy'
+        partner_high, partner_low = await service.find_compatible_users(
+            user_id=partner, min_score=50.0, crypto=crypto
+        )
+        numpy_partner_scores = {r['profile']['telegramid']: r['compatibility'] for r in partner_high + partner_low}
+        assert partner_scores[searcher] == numpy_partner_scores[searcher], "Обратная совместимость не совпадает"
+
+        print(f"Кандидатов: {len(numpy_results)}, top-K: {args.top_k}")
+        print(f"numpy:       {numpy_time * 1000:.1f} мс (все кандидаты)")
+        print(f"sql:         {sql_time * 1000:.1f} мс (top-{args.top_k})")
+        print(f"precomputed: {precomputed_time * 1000:.1f} мс (top-{args.top_k}), пересчет пользователя {refresh_time * 1000:.1f} мс")
+        print("✅ Результаты бэкендов совпадают")
+    finally:
+        await cleanup(db)
+        await db.pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -19,6 +19,68 @@ class Config(BaseSettings):
     s3_bucket: str = Field(..., alias="S3_BUCKET")
     s3_region: str = Field(..., alias="S3_REGION")
 
+    # Подсчет совместимости: 'numpy' - в памяти процесса, 'sql' - в PostgreSQL с top-K,
+    # 'precomputed' - чтение таблицы compatibility_scores, которую пересчитывает фоновый воркер
+    compatibility_backend: str = Field("numpy", alias="COMPATIBILITY_BACKEND")
+    compatibility_top_k: int = Field(500, alias="COMPATIBILITY_TOP_K")
+    # Размер пачки записи и пауза между пачками (сек) для фонового пересчета совместимости
+    compatibility_refresh_batch_size: int = Field(500, alias="COMPATIBILITY_REFRESH_BATCH_SIZE")
+    compatibility_refresh_throttle: float = Field(0.05, alias="COMPATIBILITY_REFRESH_THROTTLE")
+    # Пул процессов для подсчета совместимости (0 - считать в основном процессе)
+    # и число кандидатов, начиная с которого подсчет уходит в пул
+    compatibility_process_pool_workers: int = Field(0, alias="COMPATIBILITY_PROCESS_POOL_WORKERS")
+    compatibility_process_pool_threshold: int = Field(20000, alias="COMPATIBILITY_PROCESS_POOL_THRESHOLD")
+    # Отсечение по кластерам ответов (bot.jobs.cluster_answers): оцениваются только
+    # лучшие для пользователя кластеры, пока не наберется min_candidates кандидатов.
+    # Если среди них нет top-K с высокой совместимостью, оценивается весь пул.
+    # Выдача ограничена выбранными кандидатами, top-K приближенный (recall@K меньше 1)
+    compatibility_cluster_pruning: bool = Field(False, alias="COMPATIBILITY_CLUSTER_PRUNING")
+    compatibility_cluster_min_candidates: int = Field(2000, alias="COMPATIBILITY_CLUSTER_MIN_CANDIDATES")
+    # LSH-индекс по ответам (MinHash): поиск оценивает только пользователей из общих корзин.
+    # Полосы и строки в полосе задают индекс, probe_bands (0 - все) - полноту при поиске,
+    # min_users - размер базы, начиная с которого LSH используется
+    compatibility_lsh: bool = Field(False, alias="COMPATIBILITY_LSH")
+    compatibility_lsh_bands: int = Field(32, alias="COMPATIBILITY_LSH_BANDS")
+    compatibility_lsh_rows: int = Field(4, alias="COMPATIBILITY_LSH_ROWS")
+    compatibility_lsh_probe_bands: int = Field(0, alias="COMPATIBILITY_LSH_PROBE_BANDS")
+    compatibility_lsh_min_users: int = Field(100000, alias="COMPATIBILITY_LSH_MIN_USERS")
+    # Рекомендации по графу лайков (bot.jobs.train_like_recommender): сколько п.п. совместимости
+    # при сортировке добавляет лучшая рекомендация (0 - не учитывать, только бэкенд numpy)
+    compatibility_cf_weight: float = Field(0.0, alias="COMPATIBILITY_CF_WEIGHT")
+
+    # Кэш результатов поиска: максимум записей (0 - отключен) и время жизни записи (сек)
+    search_cache_size: int = Field(1000, alias="SEARCH_CACHE_SIZE")
+    search_cache_ttl: int = Field(300, alias="SEARCH_CACHE_TTL")
+    # Сколько кандидатов из верхних групп выдачи показать до окончания поиска
+    search_first_chunk_size: int = Field(20, alias="SEARCH_FIRST_CHUNK_SIZE")
+    # Не показывать в поиске анкеты, которые пользователь уже лайкнул, пропустил или на которые пожаловался
+    search_exclude_seen: bool = Field(True, alias="SEARCH_EXCLUDE_SEEN")
+    # Фильтры по полу, городу и возрасту по индексу анкет в памяти (бинарный поиск по возрасту)
+    # вместо условий в SQL-запросе кандидатов
+    search_profile_index: bool = Field(True, alias="SEARCH_PROFILE_INDEX")
+    # Отложенная запись просмотров в profile_views: интервал сброса (сек), размер пачки
+    # и сколько пользователей держать в памяти
+    seen_profiles_flush_interval: float = Field(5.0, alias="SEEN_PROFILES_FLUSH_INTERVAL")
+    seen_profiles_batch_size: int = Field(500, alias="SEEN_PROFILES_BATCH_SIZE")
+    seen_profiles_max_users: int = Field(10000, alias="SEEN_PROFILES_MAX_USERS")
+    # Отложенная запись users.lastactiondate: интервал сброса (сек) и размер пачки
+    last_action_flush_interval: float = Field(5.0, alias="LAST_ACTION_FLUSH_INTERVAL")
+    last_action_batch_size: int = Field(1000, alias="LAST_ACTION_BATCH_SIZE")
+    # Максимальный интервал (сек) между проверками окончания услуг для пересчета приоритета
+    priority_sweep_max_sleep: float = Field(3600, alias="PRIORITY_SWEEP_MAX_SLEEP")
+    # Получать блокировки пользователей из других процессов бота через LISTEN/NOTIFY
+    blocked_users_listen: bool = Field(True, alias="BLOCKED_USERS_LISTEN")
+    # Одно соединение с БД на апдейт для всех запросов обработчика (берется при первом запросе
+    # и удерживается до конца обработчика, поэтому нужен пул больше числа одновременных апдейтов)
+    db_unit_of_work: bool = Field(False, alias="DB_UNIT_OF_WORK")
+    # Фоновый расчет ленты после теста и при показе главного меню: число воркеров (0 - отключен),
+    # время жизни посчитанной ленты в кэше (сек), размер очереди и сколько секунд
+    # обработчик поиска ждет уже идущего расчета
+    feed_prewarm_workers: int = Field(2, alias="FEED_PREWARM_WORKERS")
+    feed_prewarm_ttl: int = Field(120, alias="FEED_PREWARM_TTL")
+    feed_prewarm_queue_size: int = Field(1000, alias="FEED_PREWARM_QUEUE_SIZE")
+    feed_prewarm_wait_timeout: float = Field(3.0, alias="FEED_PREWARM_WAIT_TIMEOUT")
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -6,6 +6,7 @@ from bot.services.database import Database
 from bot.handlers.algorithm import delete_message_safely
 from bot.keyboards.menus import back_to_menu_button, main_menu, complaint_categories
 from bot.services.profile_service import show_like_profile
+from bot.services.search_feed import SearchFeed
 from bot.services.notifications import send_like_notification, send_match_notification
 import logging
 
@@ -47,8 +48,9 @@ async def complaint_user_handler(callback: CallbackQuery, state: FSMContext, db:
 async def complaint_category_handler(callback: CallbackQuery, state: FSMContext, db:Database, crypto=None):
     try:
         state_data = await state.get_data()
-        compatible_users = state_data.get("compatible_users", [])
         current_index = state_data.get("current_compatible_index", 0)
+        # Если лента еще дозаполняется, ждем следующую анкету
+        feed_length = await SearchFeed(state, db).length(min_length=current_index + 2)
         view_history = state_data.get("view_history", [])
         rep_user = state_data.get("reported_user")
         
@@ -73,7 +75,7 @@ async def complaint_category_handler(callback: CallbackQuery, state: FSMContext,
             view_history.append(current_index)
         
         # ДОБАВЛЕНО: Переходим к следующей анкете, если она есть
-        if compatible_users and current_index < len(compatible_users) - 1:
+        if current_index < feed_length - 1:
             # Увеличиваем индекс
             next_index = current_index + 1
             await state.update_data(
@@ -126,8 +128,9 @@ async def like_user_handler(callback: CallbackQuery, state: FSMContext, db: Data
         
         # ДОБАВЛЕНО: Получаем текущие данные из состояния
         state_data = await state.get_data()
-        compatible_users = state_data.get("compatible_users", [])
         current_index = state_data.get("current_compatible_index", 0)
+        # Если лента еще дозаполняется, ждем следующую анкету
+        feed_length = await SearchFeed(state, db).length(min_length=current_index + 2)
         view_history = state_data.get("view_history", [])
         
         # ИСПРАВЛЕНО: Добавляем текущий индекс в историю просмотров
@@ -135,7 +138,7 @@ async def like_user_handler(callback: CallbackQuery, state: FSMContext, db: Data
             view_history.append(current_index)
         
         # ДОБАВЛЕНО: Переходим к следующей анкете, если она есть
-        if compatible_users and current_index < len(compatible_users) - 1:
+        if current_index < feed_length - 1:
             # Увеличиваем индекс
             next_index = current_index + 1
             await state.update_data(
@@ -226,6 +229,8 @@ async def dislike_user_handler(callback: CallbackQuery, state: FSMContext, db: D
         
         # Отмечаем лайк как просмотренный
         await db.mark_likes_as_viewed(user_id, current_user_id)
+        # Отклоненная анкета не показывается в поиске
+        db.seen_profiles.mark(current_user_id, user_id, 'dislike')
         
         # Удаляем лайки между пользователями
         await db.delete_mutual_likes(user_id, current_user_id)
@@ -6,7 +6,10 @@ from bot.services.database import Database
 from bot.services.algorithm_sovmest import CompatibilityService
 from bot.keyboards.menus import back_to_menu_button
 from bot.handlers.filtres import show_filters_menu
-from bot.services.profile_service import show_compatible_user, decrypt_city
+from bot.services.profile_service import show_compatible_user
+from bot.services.search_feed import SearchFeed
+from bot.services.search_cache import filters_fingerprint
+from bot.services.feed_prewarmer import build_search_filters
 from bot.services.encryption import CryptoService
 from bot.handlers.profile_edit import remove_keyboard_if_exists
 import logging
@@ -64,7 +67,8 @@ async def next_compatible_handler(callback: CallbackQuery, state: FSMContext, db
     # Получаем текущий индекс и данные
     state_data = await state.get_data()
     current_index = state_data.get("current_compatible_index", 0)
-    compatible_users = state_data.get("compatible_users", [])
+    # Если лента еще дозаполняется, ждем следующую анкету
+    feed_length = await SearchFeed(state, db).length(min_length=current_index + 2)
     
     # Получаем историю просмотров (если её нет, создаем пустой список)
     view_history = state_data.get("view_history", [])
@@ -80,7 +84,7 @@ async def next_compatible_handler(callback: CallbackQuery, state: FSMContext, db
     await delete_message_safely(callback.message)
     
     # ИЗМЕНЕНО: Проверяем, есть ли еще анкеты
-    if current_index < len(compatible_users) - 1:
+    if current_index < feed_length - 1:
         # Увеличиваем индекс
         next_index = current_index + 1
         
@@ -110,40 +114,17 @@ async def start_search_handler(callback: CallbackQuery, state: FSMContext, db: D
         await callback.answer()
         search_msg = await callback.message.edit_text("🔍 Ищем пользователей...")
         
-        # Получаем фильтры из состояния
+        # Получаем фильтры из состояния: город дешифруется (None, если 'Не задан'),
+        # выбранные интересы переводятся в пары (вопрос, ответ) и применяются одновременно
         filters = await state.get_data()
-        
-        # Дешифруем город - теперь функция вернет None, если город 'Не задан'
-        city = decrypt_city(crypto, filters.get('filter_city'))
-        logger.info(f"Дешифрованный город для поиска: {city}")
+        search_filters = build_search_filters(filters, crypto)
+        logger.info(f"Дешифрованный город для поиска: {search_filters['city']}")
+        logger.info(f"Выбранные интересы: {filters.get('filter_interests', [])}")
+        if search_filters['filter_interests']:
+            logger.info(f"Фильтр по интересам (вопрос, ответ): {search_filters['filter_interests']}")
         
         compatibility_service = CompatibilityService(db)
         
-        # Получаем список интересов для фильтрации
-        selected_interests = filters.get('filter_interests', [])
-        logger.info(f"Выбранные интересы: {selected_interests}")
-        
-        interests_mapping = {
-            "active": {"question": 2, "answer": 1},
-            "travel": {"question": 3, "answer": 1},
-            "sport": {"question": 4, "answer": 1},
-            "animals": {"question": 5, "answer": 1},
-            "art": {"question": 6, "answer": 1},
-            "parties": {"question": 8, "answer": 2},
-            "space": {"question": 9, "answer": 1},
-            "serious": {"question": 1, "answer": 1}
-        }
-        
-        filter_test_question = None
-        filter_test_answer = None
-        
-        if selected_interests:
-            first_interest = selected_interests[0]
-            if first_interest in interests_mapping:
-                filter_test_question = interests_mapping[first_interest]["question"]
-                filter_test_answer = interests_mapping[first_interest]["answer"]
-                logger.info(f"Фильтр по интересу: вопрос {filter_test_question}, ответ {filter_test_answer}")
-        
         # Проверяем, есть ли у пользователя ответы на тест
         has_answers = await db.check_existing_answers(callback.from_user.id)
         logger.info(f"Пользователь {callback.from_user.id} имеет ответы на тест: {has_answers}")
@@ -155,26 +136,47 @@ async def start_search_handler(callback: CallbackQuery, state: FSMContext, db: D
         else:
             logger.warning(f"Профиль пользователя {callback.from_user.id} не найден")
         
-        # Ищем пользователей - убираем параметр limit, чтобы получить всех пользователей
-        logger.info("Начинаем поиск совместимых пользователей...")
-        high_compatible_users, low_compatible_users = await compatibility_service.find_compatible_users(
-            user_id=callback.from_user.id,
-            city=city,  # Теперь здесь будет None, если город не задан
-            age_min=filters.get('filter_age_min'),
-            age_max=filters.get('filter_age_max'),
-            gender=filters.get('filter_gender'),
-            occupation=filters.get('filter_occupation'),
-            goals=filters.get('filter_goals'),
-            filter_test_question=filter_test_question,
-            filter_test_answer=filter_test_answer,
-            limit=None,
-            min_score=50.0,
-            crypto=crypto
-        )
-        
-        logger.info(f"Найдено пользователей: {len(high_compatible_users)} с высокой совместимостью, {len(low_compatible_users)} с низкой")
-        
-        all_compatible_users = high_compatible_users + low_compatible_users
+        # Повторный поиск с теми же фильтрами берем из кэша, туда же попадает
+        # лента, заранее посчитанная в фоне (FeedPrewarmer)
+        user_id = callback.from_user.id
+        fingerprint = filters_fingerprint(**search_filters)
+        prewarmer = db.feed_prewarmer
+        if prewarmer is not None and not db.search_cache.contains(user_id, fingerprint):
+            # Фоновый расчет с этими фильтрами уже идет - дожидаемся его вместо нового поиска,
+            # соединение обработчика на время ожидания нужно фоновому расчету
+            await db.release_connection()
+            await prewarmer.wait(user_id, fingerprint, db.config.feed_prewarm_wait_timeout)
+        cached = db.search_cache.get(user_id, fingerprint)
+        chunks = None
+        if cached is not None:
+            feed_ids, feed_scores = cached
+            if db.config.search_exclude_seen:
+                # Анкеты, оцененные после попадания результата в кэш, не показываем
+                seen_ids = set((await db.seen_profiles.seen_ids(user_id)).tolist())
+                unseen = [(feed_id, score) for feed_id, score in zip(feed_ids, feed_scores) if feed_id not in seen_ids]
+                feed_ids = [feed_id for feed_id, _ in unseen]
+                feed_scores = [score for _, score in unseen]
+            logger.info(f"Результаты поиска для {user_id} взяты из кэша: {len(feed_ids)} пользователей")
+        else:
+            # Ищем пользователей частями: первую анкету показываем сразу,
+            # остальные дозаполняются в фоне - убираем параметр limit, чтобы получить всех пользователей
+            logger.info("Начинаем поиск совместимых пользователей...")
+            chunks = compatibility_service.iter_compatible_users(
+                user_id=user_id,
+                **search_filters,
+                limit=None,
+                min_score=50.0,
+                crypto=crypto,
+                first_chunk_size=db.config.search_first_chunk_size
+            )
+            first_chunk = await anext(chunks, [])
+            feed_ids = [user['profile']['telegramid'] for user in first_chunk]
+            feed_scores = [user['compatibility'] for user in first_chunk]
+            
+            if not first_chunk:
+                # Поиск завершился без результатов (ошибка поиска пробрасывается и в кэш не попадает)
+                chunks = None
+                db.search_cache.put(user_id, fingerprint, feed_ids, feed_scores)
         
         # Пытаемся удалить сообщение о поиске
         try:
@@ -182,7 +184,7 @@ async def start_search_handler(callback: CallbackQuery, state: FSMContext, db: D
         except Exception as e:
             logger.debug(f"Не удалось удалить сообщение о поиске: {e}")
         
-        if not all_compatible_users:
+        if not feed_ids:
             logger.warning(f"По фильтрам пользователей не найдено для {callback.from_user.id}")
             await callback.message.answer(
                 "😔 По вашим фильтрам пользователей не найдено.",
@@ -192,16 +194,23 @@ async def start_search_handler(callback: CallbackQuery, state: FSMContext, db: D
             )
             return
         
-        # Сохраняем результаты поиска
+        # Сохраняем курсор по результатам поиска, профили подгружаются постранично
+        feed = SearchFeed(state, db)
+        token = await feed.start_ids(feed_ids, feed_scores, complete=chunks is None)
+        if chunks is not None:
+            # Полный результат попадает в кэш, когда лента дозаполнена
+            feed.fill_in_background(
+                token,
+                chunks,
+                on_complete=lambda ids, scores: db.search_cache.put(user_id, fingerprint, ids, scores)
+            )
         await state.update_data(
-            compatible_users=all_compatible_users,
-            current_compatible_index=0,
             view_history=[],
             already_went_back=False,
             last_profile_messages=[]  # Очищаем предыдущие сообщения
         )
         
-        logger.info(f"START: Инициализирована пустая история просмотров, найдено {len(all_compatible_users)} пользователей")
+        logger.info(f"START: Инициализирована пустая история просмотров, найдено {len(feed_ids)} пользователей")
         
         # Показываем первого пользователя
         await show_compatible_user(callback.message, state, db, crypto)
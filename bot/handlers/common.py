@@ -175,6 +175,7 @@ async def back_to_menu_handler(callback: CallbackQuery, state: FSMContext, db: D
         
         # Сохраняем ID нового сообщения
         await state.update_data(message_ids=[res.message_id])
+        await prewarm_feed(callback.from_user.id, state, db)
         
     except Exception as e:
         logger.error(f"Ошибка в back_to_menu_handler: {e}")
@@ -190,6 +191,11 @@ async def back_to_menu_handler(callback: CallbackQuery, state: FSMContext, db: D
         )
         await state.update_data(message_ids=[res.message_id])
 
+async def prewarm_feed(user_id: int, state: FSMContext, db: Database):
+    """Ставит в очередь фоновый расчет ленты поиска с текущими фильтрами пользователя"""
+    if db.feed_prewarmer is not None:
+        db.feed_prewarmer.schedule(user_id, await state.get_data())
+
 # Общая функция показа главного меню
 async def show_main_menu(source: Message | CallbackQuery, state: FSMContext, likes_count: int = 0, db: Database = None):
     await delete_previous_messages(source, state)
@@ -218,6 +224,9 @@ async def show_main_menu(source: Message | CallbackQuery, state: FSMContext, lik
             await state.set_state(RegistrationStates.NAME)
             return
 
+        # Пока пользователь в меню, лента поиска считается в фоне
+        await prewarm_feed(user_id, state, db)
+
     # Если пользователь зарегистрирован или db не передан, показываем главное меню
     if isinstance(source, Message):
         menu_message = await source.answer(
@@ -14,6 +14,11 @@ from bot.handlers.common import show_filters_menu
 logger = logging.getLogger(__name__)
 router = Router()
 
+def cancel_feed_prewarm(user_id: int, db: Database):
+    """Фильтры изменились - заранее посчитанная в фоне лента больше не нужна"""
+    if db.feed_prewarmer is not None:
+        db.feed_prewarmer.cancel(user_id)
+
 # Обработчик для кнопки "Город"
 @router.callback_query(F.data == "filter_city")
 async def filter_city_handler(callback: CallbackQuery, state: FSMContext):
@@ -37,6 +42,7 @@ async def process_city_filter(message: Message, state: FSMContext, db: Database,
     # Шифруем город перед сохранением
     encrypted_city = crypto.encrypt(normalized_city) if crypto else normalized_city
     await state.update_data(filter_city=encrypted_city)
+    cancel_feed_prewarm(message.from_user.id, db)
     
     # Устанавливаем состояние FILTERS перед вызовом show_filters_menu
     await state.set_state(RegistrationStates.FILTERS)
@@ -58,6 +64,7 @@ async def process_age_filter(message: Message, state: FSMContext, db: Database,
         age_min, age_max = map(int, message.text.split('-'))
         if 18 <= age_min <= age_max <= 100:
             await state.update_data(filter_age_min=age_min, filter_age_max=age_max)
+            cancel_feed_prewarm(message.from_user.id, db)
             # Добавляем установку состояния FILTERS
             await state.set_state(RegistrationStates.FILTERS)
             await show_filters_menu(message, state, db, crypto)
@@ -138,7 +145,7 @@ async def filter_interests_handler(callback: CallbackQuery, state: FSMContext, d
 
 # Обработчик переключения интересов
 @router.callback_query(F.data.startswith("toggle_interest_"))
-async def toggle_interest_handler(callback: CallbackQuery, state: FSMContext):
+async def toggle_interest_handler(callback: CallbackQuery, state: FSMContext, db: Database):
     await callback.answer()
     
     # Извлекаем выбранный интерес из callback_data
@@ -156,6 +163,7 @@ async def toggle_interest_handler(callback: CallbackQuery, state: FSMContext):
     
     # Сохраняем обновленный список интересов
     await state.update_data(filter_interests=selected_interests)
+    cancel_feed_prewarm(callback.from_user.id, db)
     
     # Обновляем клавиатуру с отметками выбранных интересов
     builder = InlineKeyboardBuilder()
@@ -219,6 +227,7 @@ async def reset_filters_handler(callback: CallbackQuery, state: FSMContext, db:
         filter_test_question=None,
         filter_test_answer=None
     )
+    cancel_feed_prewarm(callback.from_user.id, db)
         
     # Показываем обновленное меню фильтров
     try:
@@ -269,7 +269,9 @@ async def process_edit_location(message: Message, state: FSMContext, crypto: Cry
 
     encrypted_location = crypto.encrypt(normalized_city)
 
-    if await db.update_user_field(message.from_user.id, city=encrypted_location):
+    city_index = crypto.city_blind_index(normalized_city)
+
+    if await db.update_user_field(message.from_user.id, city=encrypted_location, cityblindindex=city_index):
         await message.answer(f"✅ Местоположение изменено на {normalized_city}!")
     else:
         await message.answer("❌ Ошибка при обновлении местоположения")
@@ -687,6 +689,9 @@ async def finish_test(message: Message, state: FSMContext, db: Database):
         success = await db.save_user_answers(message.chat.id, user_answers)
 
         if success:
+            # Ленту поиска с новыми ответами считаем в фоне, пока пользователь читает результат
+            if db.feed_prewarmer is not None:
+                db.feed_prewarmer.schedule(message.chat.id, data)
             # отобрж сообщение об успешном завершении теста
             try:
                 await message.edit_text("✅ Тест успешно пройден! Спасибо за ваши ответы.", reply_markup=back_to_menu_button())
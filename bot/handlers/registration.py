@@ -35,7 +35,7 @@ async def cmd_start(message: Message, state: FSMContext, db: Database):
             policy_accept = await db.check_actual_policy(user_id, policyid)
             likes_count = await db.get_unviewed_likes_count(user_id)
             if policy_accept:
-                await show_main_menu(message, state, likes_count)
+                await show_main_menu(message, state, likes_count, db)
             else:
                 await message.answer(POLICY_TEXT, reply_markup=policy_keyboard())
                 await state.set_state(RegistrationStates.POLICY_SECOND_TIME)
@@ -153,7 +153,10 @@ async def location_handler(message: Message, state: FSMContext, crypto: CryptoSe
         if not is_valid:
             await message.answer(error_msg)
             return
-        await state.update_data(location=crypto.encrypt(normalized_city))
+        await state.update_data(
+            location=crypto.encrypt(normalized_city),
+            city_index=crypto.city_blind_index(normalized_city)
+        )
         await message.answer("📸 Отправьте 1-3 фотографии")
         await state.set_state(RegistrationStates.PHOTOS)
     except TelegramForbiddenError:
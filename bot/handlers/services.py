@@ -143,17 +143,18 @@ async def service_details(callback: CallbackQuery, db: Database, state: FSMConte
         await db.fix_priority_coefficient(user_id)
 
         if service_id in [2, 3]:
-            active_boost = await db.pool.fetchrow(
-                """
-                SELECT * FROM purchasedservices
-                WHERE usertelegramid = $1
-                AND serviceid IN (2, 3)
-                AND serviceenddate > NOW()
-                AND paymentstatus = TRUE
-                LIMIT 1
-                """,
-                user_id
-            )
+            async with db.acquire() as conn:
+                active_boost = await conn.fetchrow(
+                    """
+                    SELECT * FROM purchasedservices
+                    WHERE usertelegramid = $1
+                    AND serviceid IN (2, 3)
+                    AND serviceenddate > NOW()
+                    AND paymentstatus = TRUE
+                    LIMIT 1
+                    """,
+                    user_id
+                )
 
             if active_boost:
                 end_date = (utc_to_local(active_boost['serviceenddate']).strftime("%d.%m.%Y %H:%M")
@@ -180,16 +181,17 @@ async def service_details(callback: CallbackQuery, db: Database, state: FSMConte
             return
 
         service = service_info[service_id]
-        active_service = await db.pool.fetchrow(
-            """
-            SELECT * FROM purchasedservices
-            WHERE usertelegramid = $1
-            AND serviceid = $2
-            AND serviceenddate > NOW()
-            AND paymentstatus = TRUE
-            """,
-            user_id, service_id
-        )
+        async with db.acquire() as conn:
+            active_service = await conn.fetchrow(
+                """
+                SELECT * FROM purchasedservices
+                WHERE usertelegramid = $1
+                AND serviceid = $2
+                AND serviceenddate > NOW()
+                AND paymentstatus = TRUE
+                """,
+                user_id, service_id
+            )
 
         message_text = (
             f"<b>🔍 {service['description']}</b>\n\n"
@@ -251,17 +253,18 @@ async def buy_service(callback: CallbackQuery, db: Database, state: FSMContext,
 
         # Проверяем активные бусты перед покупкой
         if service_id in [2, 3]:
-            active_boost = await db.pool.fetchrow(
-                """
-                SELECT * FROM purchasedservices
-                WHERE usertelegramid = $1
-                AND serviceid IN (2, 3)
-                AND serviceenddate > NOW()
-                AND paymentstatus = TRUE
-                LIMIT 1
-                """,
-                user_id
-            )
+            async with db.acquire() as conn:
+                active_boost = await conn.fetchrow(
+                    """
+                    SELECT * FROM purchasedservices
+                    WHERE usertelegramid = $1
+                    AND serviceid IN (2, 3)
+                    AND serviceenddate > NOW()
+                    AND paymentstatus = TRUE
+                    LIMIT 1
+                    """,
+                    user_id
+                )
 
             if active_boost:
                 end_date = active_boost['serviceenddate'].strftime("%d.%m.%Y %H:%M")
@@ -324,16 +327,17 @@ async def buy_service(callback: CallbackQuery, db: Database, state: FSMContext,
             service_name = service['description'] if service else "эта услуга"
 
             # Проверяем, есть ли уже активная такая же услуга
-            active_services = await db.pool.fetch(
-                """
-                SELECT * FROM purchasedservices
-                WHERE usertelegramid = $1
-                AND serviceid = $2
-                AND serviceenddate > NOW()
-                AND paymentstatus = TRUE
-                """,
-                user_id, service_id
-            )
+            async with db.acquire() as conn:
+                active_services = await conn.fetch(
+                    """
+                    SELECT * FROM purchasedservices
+                    WHERE usertelegramid = $1
+                    AND serviceid = $2
+                    AND serviceenddate > NOW()
+                    AND paymentstatus = TRUE
+                    """,
+                    user_id, service_id
+                )
 
             if active_services:
                 end_date = utc_to_local(active_boost['serviceenddate']).strftime("%d.%m.%Y %H:%M") if active_boost and \
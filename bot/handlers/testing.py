@@ -117,9 +117,11 @@ async def finish_test(message: Message, state: FSMContext, db: Database):
     data = await state.get_data()
 
     if await db.save_user_answers(
-        user_id=message.from_user.id,
+        telegram_id=message.chat.id,
         answers=data['user_answers']
     ):
+        if db.feed_prewarmer is not None:
+            db.feed_prewarmer.schedule(message.chat.id, data)
         await message.edit_text(
             "✅ Тест успешно завершен!",
             reply_markup=back_to_menu_button()
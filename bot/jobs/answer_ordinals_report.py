@@ -0,0 +1,122 @@
+"""
+Отчет о переходе с answerid на номера ответов при подсчете совместимости
+
+Раньше соседним считался ответ с answerid, отличающимся на 1, теперь - ответ
+с соседним номером внутри вопроса (AnswerOrdinals). Отчет показывает вопросы,
+у которых answerid идут не подряд, и на реальных ответах сравнивает старую
+и новую совместимость для выборки пользователей: долю изменившихся оценок,
+пар, перешедших через порог min_score, и пересечение top-K.
+
+Запуск: python -m bot.jobs.answer_ordinals_report --sample-users 200 --top-k 100
+"""
+import argparse
+import asyncio
+import logging
+
+import numpy as np
+
+from bot.config import load_config
+from bot.services.database import Database
+from bot.services.scoring import NO_ANSWER, build_answer_matrix, score_candidates
+
+logger = logging.getLogger(__name__)
+
+
+async def build_report(db: Database, sample_users: int = 200, top_k: int = 100, min_score: float = 50.0, seed: int = 42) -> dict:
+    """Сравнивает совместимость по answerid и по номерам ответов, возвращает метрики отчета"""
+    ordinals = db.answer_ordinals
+    async with db.pool.acquire() as conn:
+        questions = await conn.fetch("SELECT DISTINCT questionid FROM answers ORDER BY questionid")
+        records = await conn.fetch("SELECT usertelegramid, questionid, answerid FROM useranswers")
+
+    # Вопросы, где старое правило давало другой результат: answerid вариантов идут не подряд
+    gapped_questions = []
+    for row in questions:
+        ids = ordinals.answer_ids(row['questionid'])
+        if ids and ids[-1] - ids[0] != len(ids) - 1:
+            gapped_questions.append(row['questionid'])
+
+    answers_by_user = {}
+    for record in records:
+        answers_by_user.setdefault(record['usertelegramid'], {})[record['questionid']] = record['answerid']
+    user_ids = list(answers_by_user)
+    question_ids = sorted({q for answers in answers_by_user.values() for q in answers})
+
+    report = {
+        'users': len(user_ids),
+        'questions': len(questions),
+        'gapped_questions': gapped_questions,
+        'sampled_users': 0,
+        'pairs': 0,
+        'changed_pairs': 0,
+        'mean_abs_delta': 0.0,
+        'max_abs_delta': 0.0,
+        'threshold_crossings': 0,
+        'top_k_overlap': 1.0
+    }
+    if len(user_ids) < 2:
+        return report
+
+    old_matrix = build_answer_matrix([answers_by_user[user_id] for user_id in user_ids], question_ids)
+    new_matrix = ordinals.ordinal_array(old_matrix).astype(np.int8)
+    # Ответы, которых нет в таблице answers, не учитываются ни в одном варианте
+    old_matrix[new_matrix == NO_ANSWER] = NO_ANSWER
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(user_ids), min(sample_users, len(user_ids)), replace=False)
+    deltas = []
+    crossings = 0
+    overlaps = []
+    for row in sample.tolist():
+        others = np.arange(len(user_ids)) != row
+        old_scores = score_candidates(old_matrix[row], old_matrix[others])
+        new_scores = score_candidates(new_matrix[row], new_matrix[others])
+        deltas.append(new_scores - old_scores)
+        crossings += int(((old_scores >= min_score) != (new_scores >= min_score)).sum())
+
+        k = min(top_k, len(old_scores))
+        old_top = set(np.argsort(-old_scores, kind='stable')[:k].tolist())
+        new_top = set(np.argsort(-new_scores, kind='stable')[:k].tolist())
+        overlaps.append(len(old_top & new_top) / k)
+
+    deltas = np.abs(np.concatenate(deltas))
+    report.update(
+        sampled_users=len(sample),
+        pairs=len(deltas),
+        changed_pairs=int((deltas > 0).sum()),
+        mean_abs_delta=float(deltas.mean()),
+        max_abs_delta=float(deltas.max()),
+        threshold_crossings=crossings,
+        top_k_overlap=float(np.mean(overlaps))
+    )
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sample-users", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=100)
+    parser.add_argument("--min-score", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    db = Database(load_config())
+    await db.connect()
+    try:
+        report = await build_report(db, args.sample_users, args.top_k, args.min_score, args.seed)
+    finally:
+        await db.pool.close()
+
+    print(f"Пользователей с ответами: {report['users']}, вопросов: {report['questions']}")
+    print(f"Вопросы с answerid не подряд: {report['gapped_questions'] or 'нет'}")
+    print(f"Пар в выборке: {report['pairs']} ({report['sampled_users']} пользователей)")
+    if report['pairs']:
+        print(f"Изменилась оценка: {report['changed_pairs']} ({report['changed_pairs'] / report['pairs']:.2%})")
+        print(f"Средний |Δ|: {report['mean_abs_delta']:.2f} п.п., максимальный: {report['max_abs_delta']:.2f} п.п.")
+        print(f"Переход через порог {args.min_score:g}%: {report['threshold_crossings']} пар")
+        print(f"Пересечение top-{args.top_k}: {report['top_k_overlap']:.2%}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
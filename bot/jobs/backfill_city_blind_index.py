@@ -0,0 +1,73 @@
+"""
+Заполнение слепого индекса города (users.cityblindindex) для существующих анкет
+
+Читает users пачками по возрастанию telegramid (keyset-пагинация), дешифрует город
+и записывает HMAC-индекс одним UPDATE на пачку. Повторный запуск продолжает
+с анкет, у которых индекса еще нет.
+
+Запуск: python -m bot.jobs.backfill_city_blind_index --batch-size 1000
+"""
+import argparse
+import asyncio
+import logging
+
+from bot.config import load_config
+from bot.services.database import Database
+from bot.services.encryption import CryptoService
+
+logger = logging.getLogger(__name__)
+
+
+async def backfill(db: Database, crypto: CryptoService, batch_size: int = 1000, pause: float = 0.0) -> int:
+    """Проставляет слепой индекс города всем анкетам без него, возвращает число обновленных"""
+    last_id = 0
+    updated = 0
+    while True:
+        rows = await db.get_users_without_city_blind_index(last_id, batch_size)
+        if not rows:
+            break
+        last_id = rows[-1]['telegramid']
+
+        user_ids = []
+        indexes = []
+        for row in rows:
+            try:
+                city = row['city']
+                if isinstance(city, bytes) or city.startswith(('b\'gAAAAA', 'gAAAAA')):
+                    city = crypto.decrypt(city)
+            except Exception as e:
+                logger.error(f"Не удалось дешифровать город пользователя {row['telegramid']}: {e}")
+                continue
+            user_ids.append(row['telegramid'])
+            indexes.append(crypto.city_blind_index(city))
+
+        if user_ids:
+            await db.update_city_blind_indexes(user_ids, indexes)
+            updated += len(user_ids)
+        logger.info(f"City blind index: {updated} users updated, last id {last_id}")
+        if pause:
+            await asyncio.sleep(pause)
+
+    return updated
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.0, help="Пауза между пачками, сек")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    config = load_config()
+    db = Database(config)
+    await db.connect()
+    crypto = CryptoService(config.cryptography_key)
+    try:
+        updated = await backfill(db, crypto, batch_size=args.batch_size, pause=args.pause)
+        logger.info(f"✅ City blind index backfill complete: {updated} users")
+    finally:
+        await db.pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
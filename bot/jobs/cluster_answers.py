@@ -0,0 +1,67 @@
+"""
+Кластеризация пользователей по ответам на тест совместимости
+
+Строит признаки из индекса ответов, подбирает число кластеров по точке излома
+кривой инерции k-means (kneed), сохраняет кластер каждого пользователя
+и ожидаемую совместимость между кластерами (answerclusters, clusteraffinity).
+Поиск использует результат при COMPATIBILITY_CLUSTER_PRUNING=true.
+
+Запуск: python -m bot.jobs.cluster_answers --k-min 2 --k-max 30
+"""
+import argparse
+import asyncio
+import logging
+
+from bot.config import load_config
+from bot.services.clustering import answer_features, choose_k, cluster_affinity, fit_clusters
+from bot.services.database import Database
+
+logger = logging.getLogger(__name__)
+
+
+async def cluster_answers(
+    db: Database,
+    k_min: int = 2,
+    k_max: int = 30,
+    sample_size: int = 100,
+    seed: int = 42
+) -> int:
+    """Кластеризует пользователей из индекса ответов и сохраняет результат, возвращает число кластеров"""
+    user_ids, answer_matrix = db.answer_index.matrix_for(db.answer_index.user_ids().tolist())
+    if not len(user_ids):
+        logger.warning("Нет пользователей с ответами на тест, кластеризация пропущена")
+        return 0
+
+    features = answer_features(answer_matrix)
+    # Подбор k и обучение - CPU-нагрузка, выполняем вне цикла событий
+    k, inertias = await asyncio.to_thread(choose_k, features, range(k_min, k_max + 1), seed)
+    for checked_k, inertia in inertias.items():
+        logger.info(f"k={checked_k}: inertia={inertia:.1f}")
+    labels = await asyncio.to_thread(fit_clusters, features, k, seed)
+    affinity = await asyncio.to_thread(cluster_affinity, answer_matrix, labels, k, sample_size, seed)
+
+    await db.save_answer_clusters(user_ids.tolist(), labels.tolist(), affinity)
+    return k
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k-min", type=int, default=2)
+    parser.add_argument("--k-max", type=int, default=30)
+    parser.add_argument("--sample-size", type=int, default=100,
+                        help="Пользователей из кластера для оценки совместимости кластеров")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    db = Database(load_config())
+    await db.connect()
+    try:
+        k = await cluster_answers(db, args.k_min, args.k_max, args.sample_size, args.seed)
+        logger.info(f"✅ Answer clustering complete: {k} clusters")
+    finally:
+        await db.pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+Обучение рекомендаций по графу лайков
+
+Строит разреженную матрицу лайков пользователь × пользователь (scipy), раскладывает
+ее усеченным SVD (scikit-learn) и сохраняет top-N рекомендованных анкет для каждого
+пользователя (likerecommendations). Поиск подмешивает оценку рекомендации
+к совместимости при сортировке, если COMPATIBILITY_CF_WEIGHT больше 0.
+
+Запуск: python -m bot.jobs.train_like_recommender --components 32 --top-n 100
+"""
+import argparse
+import asyncio
+import logging
+
+import numpy as np
+
+from bot.config import load_config
+from bot.services.database import Database
+from bot.services.like_recommender import fit_recommendations, like_matrix
+
+logger = logging.getLogger(__name__)
+
+
+async def train_like_recommender(db: Database, n_components: int = 32, top_n: int = 100, seed: int = 42) -> int:
+    """Обучает рекомендации по всем лайкам и сохраняет их, возвращает число пользователей с рекомендациями"""
+    pairs = await db.get_like_pairs()
+    if not pairs:
+        logger.warning("В таблице likes нет лайков, обучение пропущено")
+        return 0
+
+    user_ids, matrix = like_matrix(
+        [pair['sendertelegramid'] for pair in pairs],
+        [pair['receivertelegramid'] for pair in pairs]
+    )
+    logger.info(f"Like matrix: {len(user_ids)} users, {matrix.nnz} likes")
+    # Разложение - CPU-нагрузка, выполняем вне цикла событий
+    recommended, scores = await asyncio.to_thread(fit_recommendations, matrix, n_components, top_n, seed)
+
+    rows, columns = np.nonzero(recommended >= 0)
+    await db.save_like_recommendations(
+        user_ids[rows].tolist(),
+        user_ids[recommended[rows, columns]].tolist(),
+        scores[rows, columns].tolist()
+    )
+    return len(np.unique(rows))
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--components", type=int, default=32)
+    parser.add_argument("--top-n", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    db = Database(load_config())
+    await db.connect()
+    try:
+        users = await train_like_recommender(db, args.components, args.top_n, args.seed)
+        logger.info(f"✅ Like recommender trained: {users} users with recommendations")
+    finally:
+        await db.pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
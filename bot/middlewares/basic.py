@@ -16,8 +16,8 @@ class DependencyInjectionMiddleware(BaseMiddleware):
             db = data.get('db')  # Предполагаем, что экземпляр БД доступен через DI
 
             if db:
+                # Коэффициент приоритета пересчитывается по событиям (PriorityScheduler), а не здесь
                 await db.update_last_action(user_id)
-                await db.update_user_priority(user_id)
 
             if db and await db.is_user_blocked(user_id):
                 # Отправляем сообщение о блокировке
@@ -28,4 +28,10 @@ class DependencyInjectionMiddleware(BaseMiddleware):
                     await event.answer()
                 return
 
+            if db and db.config.db_unit_of_work:
+                # Все запросы обработчика выполняются на одном соединении из пула,
+                # транзакцию обработчик открывает сам (db.unit_of_work(transaction=True))
+                async with db.unit_of_work():
+                    return await handler(event, data)
+
         return await handler(event, data)
\ No newline at end of file
@@ -1,7 +1,9 @@
-from typing import List, Tuple, Dict
+from typing import AsyncIterator, List, Tuple, Dict, Optional
 import logging
+import numpy as np
 from bot.services.encryption import CryptoService
 from bot.services import Database
+from bot.services.ranking_features import rank_order, tier_stages
 
 logger = logging.getLogger(__name__)
 
@@ -10,10 +12,8 @@ class CompatibilityService:
         self.db = db
 
     async def get_user_answers(self, user_id: int) -> dict:
-        """Получает ответы пользователя на вопросы теста"""
-        query = "SELECT questionid, answerid FROM useranswers WHERE usertelegramid = $1"
-        records = await self.db.pool.fetch(query, user_id)
-        return {r['questionid']: r['answerid'] for r in records}
+        """Получает ответы пользователя на вопросы теста из индекса ответов"""
+        return self.db.answer_index.answers(user_id)
 
     async def get_all_users_with_answers(self, exclude_user_id: int) -> list:
         """Получает всех пользователей с ответами, кроме указанного"""
@@ -23,24 +23,12 @@ class CompatibilityService:
             JOIN user_answers ua ON u.telegramid = ua.user_id
             WHERE u.telegramid != $1
         """
-        return await self.db.pool.fetch(query, exclude_user_id)
+        async with self.db.acquire() as conn:
+            return await conn.fetch(query, exclude_user_id)
 
     def calculate_compatibility(self, user1_answers: dict, user2_answers: dict) -> float:
-        """Вычисляет процент совместимости"""
-        if not user1_answers or not user2_answers:
-            return 0.0
-
-        total_score = 0
-        max_score = len(user1_answers) * 3
-
-        for q_id, a_id in user1_answers.items():
-            if q_id in user2_answers:
-                if user2_answers[q_id] == a_id:
-                    total_score += 3
-                elif abs(user2_answers[q_id] - a_id) == 1:
-                    total_score += 1
-
-        return (total_score / max_score) * 100 if max_score > 0 else 0
+        """Вычисляет процент совместимости по ответам {questionid: answerid}"""
+        return self.db.scoring_engine.score_answers(user1_answers, user2_answers)
 
     async def find_compatible_users(
         self,
@@ -53,6 +41,7 @@ class CompatibilityService:
         goals: str = None,
         filter_test_question: int = None,
         filter_test_answer: int = None,
+        filter_interests: Optional[List[Tuple[int, int]]] = None,
         limit: int = None,
         min_score: float = 50.0,
         crypto=None
@@ -70,6 +59,7 @@ class CompatibilityService:
             goals: Фильтр по целям знакомства
             filter_test_question: ID вопроса для фильтрации по интересам
             filter_test_answer: ID ответа для фильтрации по интересам (1 - первый вариант, 2 - второй вариант и т.д.)
+            filter_interests: Список интересов (ID вопроса, номер ответа), применяются все одновременно
             limit: Максимальное количество результатов (None - без ограничений)
             min_score: Минимальный процент совместимости
             crypto: Сервис шифрования для дешифрования данных
@@ -77,26 +67,103 @@ class CompatibilityService:
         Returns:
             Tuple[List[Dict], List[Dict]]: Два списка пользователей -
             с высокой и низкой совместимостью
+
+        Ошибка БД или подсчета совместимости пробрасывается, а не обрезает выдачу.
+        """
+        high_compatible = []
+        low_compatible = []
+        async for high, chunk in self._iter_ranked(
+            user_id, city, age_min, age_max, gender, occupation, goals,
+            filter_test_question, filter_test_answer, filter_interests,
+            limit=limit, min_score=min_score, crypto=crypto
+        ):
+            if high:
+                high_compatible.extend(chunk)
+            else:
+                low_compatible.extend(chunk)
+
+        # Логируем статистику
+        logger.info(f"Найдено пользователей: {len(high_compatible)} с высокой совместимостью, {len(low_compatible)} с низкой")
+
+        # Применяем ограничение только если limit задан
+        if limit is not None:
+            return high_compatible[:limit], low_compatible[:limit]
+        else:
+            # Возвращаем все результаты без ограничений
+            return high_compatible, low_compatible
+
+    async def iter_compatible_users(
+        self,
+        user_id: int,
+        city: str = None,
+        age_min: int = None,
+        age_max: int = None,
+        gender: str = None,
+        occupation: str = None,
+        goals: str = None,
+        filter_interests: Optional[List[Tuple[int, int]]] = None,
+        limit: int = None,
+        min_score: float = 50.0,
+        crypto=None,
+        first_chunk_size: int = None
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Потоковый вариант find_compatible_users: отдает кандидатов частями в итоговом порядке
+
+        Первая часть - верифицированные анкеты и анкеты с наибольшим приоритетом
+        (не меньше first_chunk_size кандидатов), их можно показать, пока
+        остальные кандидаты еще оцениваются. Склейка всех частей совпадает
+        с high + low из find_compatible_users.
+        """
+        async for _, chunk in self._iter_ranked(
+            user_id, city, age_min, age_max, gender, occupation, goals,
+            None, None, filter_interests,
+            limit=limit, min_score=min_score, crypto=crypto, first_chunk_size=first_chunk_size
+        ):
+            yield chunk
+
+    async def _iter_ranked(
+        self,
+        user_id: int,
+        city: str = None,
+        age_min: int = None,
+        age_max: int = None,
+        gender: str = None,
+        occupation: str = None,
+        goals: str = None,
+        filter_test_question: int = None,
+        filter_test_answer: int = None,
+        filter_interests: Optional[List[Tuple[int, int]]] = None,
+        limit: int = None,
+        min_score: float = 50.0,
+        crypto=None,
+        first_chunk_size: int = None
+    ) -> AsyncIterator[Tuple[bool, List[Dict]]]:
         """
-        logger.info(f"Поиск пользователей для {user_id} с фильтрами: {{'city': {city}, 'age': {age_min}-{age_max}, 'gender': {gender}, 'occupation': {occupation}, 'goals': {goals}, 'test_question': {filter_test_question}, 'test_answer': {filter_test_answer}}}")
+        Отдает отсортированных кандидатов частями (высокая совместимость, список)
+
+        Все части с высокой совместимостью идут раньше частей с низкой,
+        внутри каждой группы порядок частей совпадает с итоговой сортировкой.
+        """
+        logger.info(f"Поиск пользователей для {user_id} с фильтрами: {{'city': {city}, 'age': {age_min}-{age_max}, 'gender': {gender}, 'occupation': {occupation}, 'goals': {goals}, 'test_question': {filter_test_question}, 'test_answer': {filter_test_answer}, 'interests': {filter_interests}}}")
         
-        # Преобразуем параметры фильтрации в целые числа, если они не None
-        if filter_test_question is not None:
-            filter_test_question = int(filter_test_question)
-        if filter_test_answer is not None:
-            filter_test_answer = int(filter_test_answer)
+        # Преобразуем параметры фильтрации в целые числа и собираем все интересы в один список
+        interests = [(int(question), int(answer)) for question, answer in (filter_interests or [])]
+        if filter_test_question is not None and filter_test_answer is not None:
+            interests.append((int(filter_test_question), int(filter_test_answer)))
         
-        # Получаем ответы текущего пользователя
-        user_answers = await self.get_user_answers(user_id)
-        if not user_answers:
+        # Получаем вектор ответов текущего пользователя из индекса
+        user_vector = self.db.answer_index.vector(user_id)
+        if user_vector is None:
             logger.info(f"Пользователь {user_id} не имеет ответов на тест")
-            return [], []
+            return
         
         # Получаем профиль текущего пользователя для определения пола и предпочтений
+        # get_user_profile возвращает None и при ошибке БД: такой поиск не должен
+        # выглядеть завершенным без результатов, иначе пустая лента попадет в кэш
         current_user_profile = await self.db.get_user_profile(user_id)
         if not current_user_profile:
-            logger.warning(f"Не удалось получить профиль пользователя {user_id}")
-            return [], []
+            raise LookupError(f"Не удалось получить профиль пользователя {user_id}")
         
         # Определяем пол текущего пользователя
         current_user_gender = current_user_profile.get('gender')
@@ -125,24 +192,28 @@ class CompatibilityService:
         
         logger.info(f"Дешифрованный город для поиска: {user_city}")
         
+        # Пол, город и возраст выбираются по индексу анкет в памяти, а не условиями в SQL
+        partitions = self.db.profile_partitions if self.db.config.search_profile_index else None
+        
         # Вспомогательная функция для добавления фильтров к запросу
         def add_filters_to_query(query, params, param_index):
-            # Добавляем фильтр по полу - показываем только противоположный пол
-            if current_user_gender == '0':  # Мужчина ищет женщин
-                query += f" AND u.gender = '1'"
-            elif current_user_gender == '1':  # Женщина ищет мужчин
-                query += f" AND u.gender = '0'"
-            
-            # Добавляем остальные фильтры
-            if age_min is not None and age_max is not None:
-                query += f" AND u.age BETWEEN ${param_index} AND ${param_index + 1}"
-                params.extend([age_min, age_max])
-                param_index += 2
-            
-            if gender is not None:
-                query += f" AND u.gender = ${param_index}"
-                params.append(gender)
-                param_index += 1
+            if partitions is None:
+                # Добавляем фильтр по полу - показываем только противоположный пол
+                if current_user_gender == '0':  # Мужчина ищет женщин
+                    query += f" AND u.gender = '1'"
+                elif current_user_gender == '1':  # Женщина ищет мужчин
+                    query += f" AND u.gender = '0'"
+                
+                # Добавляем остальные фильтры
+                if age_min is not None and age_max is not None:
+                    query += f" AND u.age BETWEEN ${param_index} AND ${param_index + 1}"
+                    params.extend([age_min, age_max])
+                    param_index += 2
+                
+                if gender is not None:
+                    query += f" AND u.gender = ${param_index}"
+                    params.append(gender)
+                    param_index += 1
             
             if occupation is not None:
                 query += f" AND u.occupation = ${param_index}"
@@ -159,7 +230,7 @@ class CompatibilityService:
         # Строим базовый запрос для получения пользователей
         query = """
             SELECT DISTINCT u.telegramid, u.name, u.age, u.gender, u.city as location,
-                u.profiledescription as description, u.profileprioritycoefficient
+                u.profiledescription as description, u.profileprioritycoefficient, u.cityblindindex
             FROM users u
             WHERE u.telegramid != $1
             AND (u.accountstatus IS NULL OR u.accountstatus != 'blocked')
@@ -167,163 +238,449 @@ class CompatibilityService:
         params = [user_id]
         param_index = 2
         
-        # Если есть фильтр по интересам, модифицируем запрос
-        if filter_test_question is not None and filter_test_answer is not None:
-            # Получаем реальный ID ответа из таблицы answers
-            answers_query = """
-                SELECT answerid FROM answers 
-                WHERE questionid = $1
-                ORDER BY answerid
-            """
-            answers = await self.db.pool.fetch(answers_query, filter_test_question)
-            
-            if answers and 0 <= filter_test_answer - 1 < len(answers):
-                # Преобразуем порядковый номер ответа в его реальный ID
-                real_answer_id = answers[filter_test_answer - 1]['answerid']
-            else:
-                # Если не можем найти ответ по индексу, используем первый доступный
-                if answers:
-                    real_answer_id = answers[0]['answerid']
-                else:
-                    logger.warning(f"Не найдены ответы для вопроса {filter_test_question}")
-                    return [], []
-            
-            # Модифицируем запрос для фильтрации по интересам
-            query = """
-                SELECT DISTINCT u.telegramid, u.name, u.age, u.gender, u.city as location,
-                    u.profiledescription as description, u.profileprioritycoefficient
-                FROM users u
-                JOIN useranswers ua ON u.telegramid = ua.usertelegramid
-                WHERE u.telegramid != $1
-                AND (u.accountstatus IS NULL OR u.accountstatus != 'blocked')
-                AND ua.questionid = $2 AND ua.answerid = $3
-            """
-            params = [user_id, filter_test_question, real_answer_id]
-            param_index = 4
+        # Если есть фильтр по интересам, берем подходящих пользователей из инвертированного индекса
+        if interests:
+            interest_user_ids = await self._match_interests(interests)
+            if interest_user_ids is None or not len(interest_user_ids):
+                logger.info(f"Нет пользователей с выбранными интересами для {user_id}")
+                return
+            query += f" AND u.telegramid = ANY(${param_index}::bigint[])"
+            params.append(interest_user_ids.tolist())
+            param_index += 1
+        
+        # Исключаем анкеты, которые пользователь уже оценил, до подсчета совместимости
+        if self.db.config.search_exclude_seen:
+            seen_ids = await self.db.seen_profiles.seen_ids(user_id)
+            if len(seen_ids):
+                query += f" AND NOT (u.telegramid = ANY(${param_index}::bigint[]))"
+                params.append(seen_ids.tolist())
+                param_index += 1
         
         # Добавляем фильтры к запросу
         query, params, param_index = add_filters_to_query(query, params, param_index)
         
+        # Фильтр по городу по слепому индексу. Анкеты без индекса (до бэкфилла)
+        # пропускаются в выборку и проверяются дешифрованием в _filter_by_city
+        city_key = crypto.city_blind_index(user_city) if user_city and crypto else None
+        if partitions is not None:
+            # Противоположный пол и фильтр по полу, если он задан
+            genders = {'1' if current_user_gender == '0' else '0'} if current_user_gender in ('0', '1') else None
+            if gender is not None:
+                genders = {str(gender)} & genders if genders is not None else {str(gender)}
+            profile_ids = partitions.select(genders, city_key, age_min, age_max)
+            if not len(profile_ids):
+                logger.info(f"Нет анкет под фильтры пола, города и возраста для {user_id}")
+                return
+            query += f" AND u.telegramid = ANY(${param_index}::bigint[])"
+            params.append(profile_ids.tolist())
+            param_index += 1
+        elif city_key:
+            query += f" AND (u.cityblindindex = ${param_index} OR u.cityblindindex IS NULL)"
+            params.append(city_key)
+            param_index += 1
+        
+        # Считаем совместимость в PostgreSQL и получаем только top-K строк
+        if self.db.config.compatibility_backend == 'sql':
+            async for item in self._iter_ranked_sql(
+                user_id, query, params, user_city, crypto,
+                limit=limit, min_score=min_score, first_chunk_size=first_chunk_size
+            ):
+                yield item
+            return
+        
+        # Читаем готовую совместимость, если она рассчитана для города пользователя
+        if self.db.config.compatibility_backend == 'precomputed' and not city:
+            if await self.db.has_compatibility_scores(user_id):
+                async for item in self._iter_ranked_precomputed(
+                    user_id, query, params, limit=limit, min_score=min_score
+                ):
+                    yield item
+                return
+            # Строк еще нет - считаем на лету и ставим пользователя в очередь пересчета
+            logger.info(f"Совместимость для {user_id} еще не рассчитана, считаем на лету")
+            self.db.schedule_compatibility_refresh(user_id)
+        
+        # На большой базе оцениваем только пользователей из общих с ищущим LSH-корзин
+        lsh = self.db.answer_index.lsh
+        if lsh is not None and len(self.db.answer_index) >= self.db.config.compatibility_lsh_min_users:
+            lsh_user_ids = lsh.candidates(
+                self.db.answer_index.ordinal_answers(user_id),
+                probe_bands=self.db.config.compatibility_lsh_probe_bands
+            )
+            logger.info(f"LSH-кандидатов для {user_id}: {len(lsh_user_ids)} из {len(self.db.answer_index)}")
+            query += f" AND u.telegramid = ANY(${param_index}::bigint[])"
+            params.append(lsh_user_ids.tolist())
+            param_index += 1
+        
         # Выполняем запрос
         try:
-            candidates = await self.db.pool.fetch(query, *params)
+            async with self.db.acquire() as conn:
+                candidates = await conn.fetch(query, *params)
             logger.info(f"Найдено кандидатов: {len(candidates)}")
             
             if not candidates:
                 logger.warning(f"По фильтрам пользователей не найдено для {user_id}")
-                return [], []
+                return
             
-            # Фильтруем по городу после получения результатов, если указан город
-            filtered_candidates = []
-            if user_city and crypto:
-                for candidate in candidates:
-                    encrypted_location = candidate['location']
-                    if encrypted_location:
-                        try:
-                            # Проверяем, является ли город зашифрованным
-                            if isinstance(encrypted_location, bytes) or (
-                                    isinstance(encrypted_location, str) and 
-                                    (encrypted_location.startswith('b\'gAAAAA') or encrypted_location.startswith('gAAAAA'))):
-                                decrypted_location = crypto.decrypt(encrypted_location)
-                                if decrypted_location.lower() == user_city.lower():
-                                    filtered_candidates.append(candidate)
-                            else:
-                                # Если город не зашифрован, сравниваем напрямую
-                                if encrypted_location.lower() == user_city.lower():
-                                    filtered_candidates.append(candidate)
-                        except Exception as e:
-                            logger.error(f"Ошибка дешифрования города кандидата {candidate['telegramid']}: {e}")
-                
-                candidates = filtered_candidates
-            else:
-                # Если город не указан, используем всех кандидатов
-                filtered_candidates = candidates
+            # Берем строки кандидатов в индексе ответов, пропуская тех, кто не проходил тест
+            candidates_by_id = {c['telegramid']: c for c in candidates}
+            found_ids, candidate_rows = self.db.answer_index.rows_for(candidates_by_id)
             
-            if not candidates:
-                logger.warning(f"После фильтрации по городу не осталось кандидатов для {user_id}")
-                return [], []
+            if not len(found_ids):
+                logger.warning(f"У кандидатов для {user_id} нет ответов на тест")
+                return
+            
+            scored_candidates = [candidates_by_id[candidate_id] for candidate_id in found_ids.tolist()]
             
-            # Вычисляем совместимость для каждого кандидата
-            high_compatible = []
-            low_compatible = []
+            # Верификация и коэффициент приоритета кандидатов из памяти, без запросов к БД
+            verified, priority = self.db.ranking_features.lookup(found_ids)
+            # Уже посчитанная совместимость по позициям кандидатов (NaN - еще не считали)
+            known_scores = np.full(len(found_ids), np.nan)
             
-            # Счетчики для статистики
-            skipped_no_answers = 0
-            high_compat_count = 0
-            low_compat_count = 0
+            # Для большого пула оцениваем только кандидатов из лучших кластеров ответов
+            selected = None
+            if self.db.config.compatibility_cluster_pruning:
+                selected = await self._select_by_clusters(
+                    user_id, user_vector, found_ids, candidate_rows, known_scores,
+                    top_k=limit or self.db.config.compatibility_top_k, min_score=min_score
+                )
+            
+            # Делим кандидатов на группы по (верификация, коэффициент приоритета):
+            # первая часть - верхние группы, в которых набирается first_chunk_size кандидатов
+            if selected is None:
+                stages = tier_stages(verified, priority, first_chunk_size)
+            else:
+                # Кандидаты вне выбранных кластеров не оцениваются и в выдачу не попадают
+                stages = [
+                    selected[stage] for stage in tier_stages(verified[selected], priority[selected], first_chunk_size)
+                ]
             
-            for candidate in candidates:
-                # Получаем ответы кандидата
-                candidate_answers = await self.get_user_answers(candidate['telegramid'])
-                if not candidate_answers:
-                    skipped_no_answers += 1
+            low_stages = []
+            for stage in stages:
+                # Фильтруем по городу анкеты без слепого индекса, если указан город
+                if user_city and crypto:
+                    stage = np.asarray([
+                        position for position in stage.tolist()
+                        if self._matches_city(scored_candidates[position], user_city, crypto)
+                    ], dtype=np.int64)
+                if not len(stage):
                     continue
                 
-                # Вычисляем совместимость
-                compatibility = self.calculate_compatibility(user_answers, candidate_answers)
+                # Вычисляем совместимость со всеми кандидатами части за один проход,
+                # большие части считаются в пуле процессов по общей матрице, не блокируя цикл событий
+                missing = stage[np.isnan(known_scores[stage])]
+                if len(missing):
+                    known_scores[missing] = await self.db.scoring_engine.score_rows_async(user_vector, candidate_rows[missing])
+                scores = known_scores[stage]
                 
-                # Получаем фотографии пользователя
-                photos = await self.db.get_user_photos(candidate['telegramid'])
+                # Сортируем по верификации, коэффициенту приоритета и совместимости одним lexsort
+                order = rank_order(verified[stage], priority[stage], self._blend_recommendations(user_id, found_ids[stage], scores))
+                stage, scores = stage[order], scores[order]
+                is_high = scores >= min_score
                 
-                # Создаем полный профиль пользователя
-                user_profile = dict(candidate)
-                user_profile['photos'] = photos
-                
-                # Проверяем верификацию пользователя
-                is_verified, _, _ = await self.db.check_verify(candidate['telegramid'])
-                
-                # Получаем коэффициент приоритета (если не указан в профиле)
-                priority_coefficient = candidate.get('profileprioritycoefficient', 1.0)
-                
-                # Создаем результат с профилем и совместимостью
-                result = {
-                    'profile': user_profile,
-                    'compatibility': round(compatibility, 1),
-                    'is_verified': is_verified,
-                    'priority_coefficient': priority_coefficient
-                }
+                high_compatible = []
+                low_compatible = []
+                for position, compatibility, high in zip(stage.tolist(), scores.tolist(), is_high.tolist()):
+                    # Профиль без фотографий: они подгружаются лентой поиска постранично
+                    result = {
+                        'profile': dict(scored_candidates[position]),
+                        'compatibility': round(compatibility, 1),
+                        'is_verified': bool(verified[position]),
+                        'priority_coefficient': scored_candidates[position].get('profileprioritycoefficient', 1.0)
+                    }
+                    
+                    # Распределяем по категориям совместимости
+                    if high:
+                        high_compatible.append(result)
+                    else:
+                        low_compatible.append(result)
                 
-                # Распределяем по категориям совместимости
-                if compatibility >= min_score:
-                    high_compatible.append(result)
-                    high_compat_count += 1
-                else:
-                    low_compatible.append(result)
-                    low_compat_count += 1
+                if high_compatible:
+                    yield True, high_compatible
+                low_stages.append(low_compatible)
             
-            # Логируем статистику
-            logger.info(f"Найдено пользователей: {high_compat_count} с высокой совместимостью, {low_compat_count} с низкой")
+            # Низкая совместимость идет после всех кандидатов с высокой
+            for low_compatible in low_stages:
+                if low_compatible:
+                    yield False, low_compatible
             
-            # Сортируем по верификации, коэффициенту приоритета и совместимости
-            high_compatible.sort(
-                key=lambda x: (
-                    x['is_verified'],  # Сначала верифицированные (True > False)
-                    x['priority_coefficient'],  # Затем по коэффициенту приоритета
-                    x['compatibility']  # Затем по совместимости
-                ), 
-                reverse=True
+        except Exception as e:
+            # Пробрасываем ошибку: неполная выдача не должна попасть в кэш как готовая
+            logger.error(f"Ошибка при поиске совместимых пользователей: {e}")
+            logger.exception(e)
+            raise
+
+    async def _select_by_clusters(
+        self, user_id: int, user_vector, found_ids, candidate_rows, known_scores, top_k: int, min_score: float
+    ):
+        """
+        Позиции кандидатов из лучших для пользователя кластеров ответов
+
+        Выбранные кандидаты оцениваются сразу, их совместимость записывается
+        в known_scores и повторно не считается. Выбор применяется, только если
+        среди них набирается top_k с высокой совместимостью, иначе возвращается None
+        и оценивается весь пул. При выборе выдача состоит только из выбранных
+        кандидатов: остальные не оцениваются, поэтому часть настоящего top-K
+        из других кластеров может не попасть в выдачу (recall@K - в
+        benchmarks/bench_cluster_pruning.py), а низкосовместимый хвост короче.
+        """
+        clusters = self.db.answer_clusters
+        min_candidates = self.db.config.compatibility_cluster_min_candidates
+        if clusters is None or len(found_ids) <= min_candidates:
+            return None
+
+        selected = clusters.select(user_id, found_ids, min_candidates)
+        if selected is None or len(selected) == len(found_ids):
+            return None
+
+        known_scores[selected] = await self.db.scoring_engine.score_rows_async(user_vector, candidate_rows[selected])
+        high_count = int((known_scores[selected] >= min_score).sum())
+        if high_count < top_k:
+            logger.info(
+                f"Кластеры дали {high_count} совместимых из {len(selected)} кандидатов для {user_id}, "
+                f"оцениваем весь пул ({len(found_ids)})"
             )
-            
-            low_compatible.sort(
-                key=lambda x: (
-                    x['is_verified'],  # Сначала верифицированные (True > False)
-                    x['priority_coefficient'],  # Затем по коэффициенту приоритета
-                    x['compatibility']  # Затем по совместимости
-                ), 
-                reverse=True
+            return None
+
+        logger.info(f"Кластеры для {user_id}: сначала {len(selected)} из {len(found_ids)} кандидатов")
+        return selected
+
+    def _blend_recommendations(self, user_id: int, candidate_ids, scores):
+        """
+        Совместимость для сортировки с учетом рекомендаций по графу лайков
+
+        К совместимости кандидата добавляется COMPATIBILITY_CF_WEIGHT п.п., умноженные
+        на оценку рекомендации (0..1). Показываемая совместимость и деление
+        на высокую и низкую не меняются.
+        """
+        weight = self.db.config.compatibility_cf_weight
+        recommendations = self.db.like_recommendations
+        if weight <= 0 or recommendations is None:
+            return scores
+        return scores + weight * recommendations.scores_for(user_id, candidate_ids)
+
+    async def _match_interests(self, interests: List[Tuple[int, int]]):
+        """
+        Возвращает отсортированный массив пользователей, подходящих под все интересы
+
+        Номер ответа (1 - первый вариант) преобразуется в реальный answerid по таблице номеров ответов.
+        Возвращает None, если для вопроса нет вариантов ответа.
+        """
+        pairs = []
+        for question, answer in interests:
+            answers = self.db.answer_ordinals.answer_ids(question)
+            if not answers:
+                logger.warning(f"Не найдены ответы для вопроса {question}")
+                return None
+            # Если не можем найти ответ по номеру, используем первый доступный
+            real_answer_id = answers[answer - 1] if 0 <= answer - 1 < len(answers) else answers[0]
+            pairs.append((question, real_answer_id))
+
+        return self.db.answer_index.interests.match(pairs)
+
+    def _filter_by_city(self, candidates: list, user_city: str = None, crypto=None) -> list:
+        """Оставляет кандидатов из указанного города, дешифруя город анкет без слепого индекса"""
+        if not (user_city and crypto):
+            # Если город не указан, используем всех кандидатов
+            return candidates
+
+        return [candidate for candidate in candidates if self._matches_city(candidate, user_city, crypto)]
+
+    def _matches_city(self, candidate, user_city: str, crypto) -> bool:
+        """Проверяет, что кандидат из указанного города"""
+        # Совпадение по слепому индексу уже проверено в запросе
+        if candidate.get('cityblindindex') is not None:
+            return True
+
+        encrypted_location = candidate['location']
+        if not encrypted_location:
+            return False
+        try:
+            # Проверяем, является ли город зашифрованным
+            if isinstance(encrypted_location, bytes) or (
+                    isinstance(encrypted_location, str) and 
+                    (encrypted_location.startswith('b\'gAAAAA') or encrypted_location.startswith('gAAAAA'))):
+                decrypted_location = crypto.decrypt(encrypted_location)
+                return decrypted_location.lower() == user_city.lower()
+            # Если город не зашифрован, сравниваем напрямую
+            return encrypted_location.lower() == user_city.lower()
+        except Exception as e:
+            logger.error(f"Ошибка дешифрования города кандидата {candidate['telegramid']}: {e}")
+            return False
+
+    async def _iter_ranked_sql(
+        self,
+        user_id: int,
+        candidates_query: str,
+        params: list,
+        user_city: str = None,
+        crypto=None,
+        limit: int = None,
+        min_score: float = 50.0,
+        first_chunk_size: int = None
+    ) -> AsyncIterator[Tuple[bool, List[Dict]]]:
+        """
+        Поиск совместимых пользователей с подсчетом совместимости в PostgreSQL
+
+        Совместимость считается агрегатом SUM(CASE ...) по self-join таблицы useranswers
+        с номерами и весами ответов из представления answerordinals (как в ScoringEngine),
+        сортировка и LIMIT выполняются в запросе, поэтому по сети передаются только top-K строк.
+        Фильтр по городу применяется после дешифрования, поэтому при нехватке строк
+        запрашивается следующая страница. Первая страница - first_chunk_size строк,
+        каждая страница отдается сразу после получения.
+        """
+        top_k = limit or self.db.config.compatibility_top_k
+        param_index = len(params) + 1
+        query = f"""
+            WITH candidates AS ({candidates_query}),
+            me AS (
+                SELECT ua.questionid, ao.ordinal, ao.weight
+                FROM useranswers ua
+                JOIN answerordinals ao ON ao.answerid = ua.answerid
+                WHERE ua.usertelegramid = $1
+            ),
+            scores AS (
+                SELECT ua.usertelegramid,
+                    SUM(CASE
+                        WHEN ao.ordinal = me.ordinal THEN 3 * me.weight
+                        WHEN abs(ao.ordinal - me.ordinal) = 1 THEN me.weight
+                        ELSE 0
+                    END) AS total_score
+                FROM useranswers ua
+                JOIN answerordinals ao ON ao.answerid = ua.answerid
+                LEFT JOIN me ON me.questionid = ua.questionid
+                WHERE ua.usertelegramid IN (SELECT telegramid FROM candidates)
+                GROUP BY ua.usertelegramid
+            ),
+            ranked AS (
+                SELECT c.*,
+                    COALESCE((s.total_score::float8 / NULLIF(3 * (SELECT SUM(weight) FROM me), 0)) * 100, 0) AS compatibility,
+                    EXISTS(
+                        SELECT 1 FROM verifications v
+                        WHERE v.usertelegramid = c.telegramid
+                        AND v.processingstatus = 'approve'
+                    ) AS is_verified
+                FROM candidates c
+                JOIN scores s ON s.usertelegramid = c.telegramid
             )
-            
-            # Применяем ограничение только если limit задан
-            if limit is not None:
-                return high_compatible[:limit], low_compatible[:limit]
-            else:
-                # Возвращаем все результаты без ограничений
-                return high_compatible, low_compatible
-            
+            SELECT * FROM ranked
+            ORDER BY compatibility >= ${param_index}::float8 DESC,
+                is_verified DESC,
+                profileprioritycoefficient DESC NULLS LAST,
+                compatibility DESC,
+                telegramid
+            LIMIT ${param_index + 1} OFFSET ${param_index + 2}
+        """
+
+        try:
+            found = 0
+            offset = 0
+            page_size = min(first_chunk_size or top_k, top_k)
+            while found < top_k:
+                async with self.db.acquire() as conn:
+                    page = await conn.fetch(query, *params, float(min_score), page_size, offset)
+                offset += len(page)
+                rows = self._filter_by_city(page, user_city, crypto)[:top_k - found]
+                found += len(rows)
+
+                high_compatible, low_compatible = self._split_ranked_rows(rows, min_score)
+                if high_compatible:
+                    yield True, high_compatible
+                if low_compatible:
+                    yield False, low_compatible
+
+                if len(page) < page_size:
+                    break
+                page_size = top_k
+            logger.info(f"SQL-подсчет: получено {found} кандидатов (top-{top_k}, просмотрено {offset})")
+
+            if not found:
+                logger.warning(f"По фильтрам пользователей не найдено для {user_id}")
+
         except Exception as e:
-            logger.error(f"Ошибка при поиске совместимых пользователей: {e}")
+            logger.error(f"Ошибка при SQL-поиске совместимых пользователей: {e}")
             logger.exception(e)
-            return [], []
+            raise
+
+    async def _iter_ranked_precomputed(
+        self,
+        user_id: int,
+        candidates_query: str,
+        params: list,
+        limit: int = None,
+        min_score: float = 50.0
+    ) -> AsyncIterator[Tuple[bool, List[Dict]]]:
+        """
+        Поиск совместимых пользователей по предрасчитанной таблице compatibility_scores
+
+        Таблица содержит только пары из одного города, поэтому дешифровать города
+        не нужно: фильтры кандидатов применяются в запросе, совместимость читается
+        по индексу (user_a, score).
+        """
+        top_k = limit or self.db.config.compatibility_top_k
+        param_index = len(params) + 1
+        query = f"""
+            WITH candidates AS ({candidates_query})
+            SELECT c.*, cs.score AS compatibility,
+                EXISTS(
+                    SELECT 1 FROM verifications v
+                    WHERE v.usertelegramid = c.telegramid
+                    AND v.processingstatus = 'approve'
+                ) AS is_verified
+            FROM compatibility_scores cs
+            JOIN candidates c ON c.telegramid = cs.user_b
+            WHERE cs.user_a = $1
+            ORDER BY cs.score >= ${param_index}::float8 DESC,
+                is_verified DESC,
+                c.profileprioritycoefficient DESC NULLS LAST,
+                cs.score DESC,
+                c.telegramid
+            LIMIT ${param_index + 1}
+        """
+
+        try:
+            async with self.db.acquire() as conn:
+                rows = await conn.fetch(query, *params, float(min_score), top_k)
+            logger.info(f"Предрасчитанная совместимость: получено {len(rows)} кандидатов (top-{top_k})")
+
+            if not rows:
+                logger.warning(f"По фильтрам пользователей не найдено для {user_id}")
+                return
+
+            high_compatible, low_compatible = self._split_ranked_rows(rows, min_score)
+            if high_compatible:
+                yield True, high_compatible
+            if low_compatible:
+                yield False, low_compatible
+
+        except Exception as e:
+            logger.error(f"Ошибка при поиске по предрасчитанной совместимости: {e}")
+            logger.exception(e)
+            raise
+
+    def _split_ranked_rows(self, rows: list, min_score: float) -> Tuple[List[Dict], List[Dict]]:
+        """Разбивает отсортированные строки с совместимостью на высокую и низкую"""
+        high_compatible = []
+        low_compatible = []
+        for row in rows:
+            user_profile = dict(row)
+            compatibility = user_profile.pop('compatibility')
+            is_verified = user_profile.pop('is_verified')
+
+            result = {
+                'profile': user_profile,
+                'compatibility': round(compatibility, 1),
+                'is_verified': is_verified,
+                'priority_coefficient': row['profileprioritycoefficient']
+            }
+
+            # Строки уже отсортированы: сначала высокая совместимость, затем низкая
+            if compatibility >= min_score:
+                high_compatible.append(result)
+            else:
+                low_compatible.append(result)
+
+        return high_compatible, low_compatible
 
 # неактивная функция, идея для доработки бота в будущем
     # async def get_compatibility_explanation(self, user1_id: int, user2_id: int) -> str: 
@@ -0,0 +1,248 @@
+import sys
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from bot.services.answer_ordinals import AnswerOrdinals
+from bot.services.interest_index import InterestIndex
+from bot.services.lsh_index import MinHashLSH
+from bot.services.scoring import NO_ANSWER, answer_dtype
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerIndex:
+    """
+    Ответы всех пользователей в памяти процесса
+
+    Хранит компактную матрицу порядковых номеров ответов (строка - пользователь,
+    столбец - вопрос) и отображение telegram id -> строка. Номера берутся из ordinals,
+    поэтому соседние варианты ответа отличаются на 1 в любом бэкенде подсчета.
+    Обновляется инкрементально при сохранении и удалении ответов, поэтому поиск
+    не обращается к таблице useranswers.
+    Вместе с матрицей поддерживается инвертированный индекс interests (по answerid)
+    для фильтра по интересам и, если передан, LSH-индекс lsh (по номерам ответов)
+    для отбора похожих по ответам кандидатов.
+    После share матрица размещается в разделяемой памяти пула процессов подсчета.
+    """
+
+    def __init__(self, ordinals: AnswerOrdinals, initial_capacity: int = 1024, lsh: Optional[MinHashLSH] = None):
+        self.ordinals = ordinals
+        self.question_ids: List[int] = []
+        self._columns: Dict[int, int] = {}
+        self._rows: Dict[int, int] = {}
+        self._free_rows: List[int] = []
+        self._user_ids = np.zeros(initial_capacity, dtype=np.int64)
+        self._matrix = np.full((initial_capacity, 0), NO_ANSWER, dtype=np.int8)
+        self._shared = None
+        self.interests = InterestIndex()
+        self.lsh = lsh
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._rows
+
+    def rebuild(self, records: Iterable) -> None:
+        """Полностью пересобирает индекс из записей (usertelegramid, questionid, answerid)"""
+        answers_by_user: Dict[int, Dict[int, int]] = {}
+        for record in records:
+            answers_by_user.setdefault(record['usertelegramid'], {})[record['questionid']] = record['answerid']
+
+        question_ids = sorted({q for answers in answers_by_user.values() for q in answers})
+        ordinals_by_user = {
+            user_id: self.ordinals.to_ordinals(answers) for user_id, answers in answers_by_user.items()
+        }
+        max_ordinal = max(
+            (o for ordinals in ordinals_by_user.values() for o in ordinals.values()),
+            default=NO_ANSWER
+        )
+        capacity = max(len(answers_by_user), 1)
+
+        self.question_ids = question_ids
+        self._columns = {question_id: column for column, question_id in enumerate(question_ids)}
+        self._rows = {}
+        self._free_rows = []
+        self._user_ids = np.zeros(capacity, dtype=np.int64)
+        self._matrix = self._new_matrix((capacity, len(question_ids)), answer_dtype(max_ordinal))
+
+        for row, (user_id, ordinals) in enumerate(ordinals_by_user.items()):
+            self._rows[user_id] = row
+            self._user_ids[row] = user_id
+            self._write_row(row, ordinals)
+        # Ответы, которых нет в таблице answers, не попадают ни в матрицу, ни в индексы
+        self.interests.rebuild({
+            user_id: self.ordinals.to_answer_ids(ordinals) for user_id, ordinals in ordinals_by_user.items()
+        })
+        if self.lsh is not None:
+            count = len(answers_by_user)
+            self.lsh.rebuild(self._user_ids[:count], self._matrix[:count], self.question_ids)
+
+        logger.info(
+            f"Answer index loaded: {len(self._rows)} users, {len(question_ids)} questions, "
+            f"{self.memory_usage() / 1024 / 1024:.2f} MB"
+        )
+
+    def upsert(self, user_id: int, answers: Dict[int, int]) -> None:
+        """Добавляет или заменяет ответы пользователя ({questionid: answerid})"""
+        ordinals = self.ordinals.to_ordinals(answers)
+        if not ordinals:
+            self.remove(user_id)
+            return
+
+        self._ensure_columns(ordinals.keys())
+        self._ensure_dtype(max(ordinals.values()))
+
+        row = self._rows.get(user_id)
+        if row is None:
+            row = self._allocate_row()
+            self._rows[user_id] = row
+            self._user_ids[row] = user_id
+        else:
+            old_ordinals = self.ordinal_answers(user_id)
+            self.interests.discard(user_id, self.ordinals.to_answer_ids(old_ordinals))
+            if self.lsh is not None:
+                self.lsh.discard(user_id, old_ordinals)
+            self._matrix[row, :] = NO_ANSWER
+        self._write_row(row, ordinals)
+        self.interests.add(user_id, self.ordinals.to_answer_ids(ordinals))
+        if self.lsh is not None:
+            self.lsh.add(user_id, ordinals)
+
+    def remove(self, user_id: int) -> None:
+        """Удаляет пользователя из индекса, освобождая строку для повторного использования"""
+        if user_id not in self._rows:
+            return
+        old_ordinals = self.ordinal_answers(user_id)
+        self.interests.discard(user_id, self.ordinals.to_answer_ids(old_ordinals))
+        if self.lsh is not None:
+            self.lsh.discard(user_id, old_ordinals)
+        row = self._rows.pop(user_id)
+        self._matrix[row, :] = NO_ANSWER
+        self._user_ids[row] = 0
+        self._free_rows.append(row)
+
+    def answers(self, user_id: int) -> Dict[int, int]:
+        """Возвращает ответы пользователя в виде {questionid: answerid}"""
+        return self.ordinals.to_answer_ids(self.ordinal_answers(user_id))
+
+    def ordinal_answers(self, user_id: int) -> Dict[int, int]:
+        """Возвращает ответы пользователя в виде {questionid: номер ответа}"""
+        row = self._rows.get(user_id)
+        if row is None:
+            return {}
+        return {
+            question_id: int(ordinal)
+            for question_id, ordinal in zip(self.question_ids, self._matrix[row].tolist())
+            if ordinal != NO_ANSWER
+        }
+
+    def vector(self, user_id: int) -> Optional[np.ndarray]:
+        """Возвращает копию вектора номеров ответов пользователя в порядке question_ids"""
+        row = self._rows.get(user_id)
+        if row is None:
+            return None
+        return self._matrix[row].copy()
+
+    def user_ids(self) -> np.ndarray:
+        """Возвращает telegram id всех пользователей индекса"""
+        return np.fromiter(self._rows.keys(), dtype=np.int64, count=len(self._rows))
+
+    def matrix_for(self, user_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Возвращает матрицу номеров ответов для указанных пользователей
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: telegram id найденных в индексе пользователей
+            и их строки матрицы в том же порядке
+        """
+        found_ids, rows = self.rows_for(user_ids)
+        return found_ids, self._matrix[rows]
+
+    def rows_for(self, user_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Возвращает номера строк матрицы для указанных пользователей, не копируя ответы
+
+        Номера действительны до следующего изменения индекса (удаленная строка
+        может достаться другому пользователю).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: telegram id найденных в индексе пользователей
+            и номера их строк в том же порядке
+        """
+        found_ids = [user_id for user_id in user_ids if user_id in self._rows]
+        rows = np.fromiter((self._rows[user_id] for user_id in found_ids), dtype=np.int64, count=len(found_ids))
+        return np.asarray(found_ids, dtype=np.int64), rows
+
+    def matrix_rows(self, rows: np.ndarray) -> np.ndarray:
+        """Возвращает копию строк матрицы с номерами rows (из rows_for)"""
+        return self._matrix[rows]
+
+    def share(self, shared) -> None:
+        """
+        Переносит матрицу в разделяемую память shared (ScoringPool.matrix)
+
+        Дальше каждая новая матрица создается через shared.allocate. share(None)
+        возвращает матрицу в память процесса, например перед остановкой пула.
+        """
+        self._shared = shared
+        matrix = self._new_matrix(self._matrix.shape, self._matrix.dtype)
+        matrix[:] = self._matrix
+        self._matrix = matrix
+
+    def memory_usage(self) -> int:
+        """Оценка занимаемой индексом памяти в байтах"""
+        return (
+            self._matrix.nbytes
+            + self._user_ids.nbytes
+            + sys.getsizeof(self._rows)
+            + sys.getsizeof(self._columns)
+            + sys.getsizeof(self._free_rows)
+        )
+
+    def _new_matrix(self, shape: Tuple[int, int], dtype) -> np.ndarray:
+        """Матрица без ответов: в разделяемой памяти после share, иначе в памяти процесса"""
+        if self._shared is not None:
+            return self._shared.allocate(shape, dtype, NO_ANSWER)
+        return np.full(shape, NO_ANSWER, dtype=dtype)
+
+    def _write_row(self, row: int, ordinals: Dict[int, int]) -> None:
+        for question_id, ordinal in ordinals.items():
+            self._matrix[row, self._columns[question_id]] = ordinal
+
+    def _allocate_row(self) -> int:
+        if self._free_rows:
+            return self._free_rows.pop()
+
+        row = len(self._rows)
+        if row >= self._matrix.shape[0]:
+            # Увеличиваем емкость в два раза, чтобы вставки были амортизированно O(1)
+            capacity = max(self._matrix.shape[0] * 2, 1)
+            matrix = self._new_matrix((capacity, self._matrix.shape[1]), self._matrix.dtype)
+            matrix[:self._matrix.shape[0]] = self._matrix
+            user_ids = np.zeros(capacity, dtype=np.int64)
+            user_ids[:self._user_ids.shape[0]] = self._user_ids
+            self._matrix, self._user_ids = matrix, user_ids
+        return row
+
+    def _ensure_columns(self, question_ids: Iterable[int]) -> None:
+        new_questions = [q for q in question_ids if q not in self._columns]
+        if not new_questions:
+            return
+        # Новый вопрос в тесте - добавляем столбцы и сохраняем порядок по questionid
+        self.question_ids = sorted(set(self.question_ids) | set(new_questions))
+        old_columns = self._columns
+        self._columns = {question_id: column for column, question_id in enumerate(self.question_ids)}
+        matrix = self._new_matrix((self._matrix.shape[0], len(self.question_ids)), self._matrix.dtype)
+        for question_id, old_column in old_columns.items():
+            matrix[:, self._columns[question_id]] = self._matrix[:, old_column]
+        self._matrix = matrix
+
+    def _ensure_dtype(self, max_ordinal: int) -> None:
+        dtype = answer_dtype(max_ordinal)
+        if dtype.itemsize > self._matrix.dtype.itemsize:
+            matrix = self._new_matrix(self._matrix.shape, dtype)
+            matrix[:] = self._matrix
+            self._matrix = matrix
@@ -0,0 +1,83 @@
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from bot.services.scoring import NO_ANSWER
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerOrdinals:
+    """
+    Порядковые номера ответов внутри вопроса (1 - первый вариант)
+
+    Загружается один раз из таблицы answers: номер - позиция ответа среди ответов
+    его вопроса по возрастанию answerid. Соседние варианты ответа - это номера,
+    отличающиеся на 1, независимо от того, в каком порядке ответы добавлялись в таблицу.
+    """
+
+    def __init__(self):
+        self._ordinals: Dict[int, int] = {}
+        self._answer_ids: Dict[int, List[int]] = {}
+        # Плотная таблица answerid -> номер для векторного преобразования
+        self._lookup = np.zeros(1, dtype=np.int16)
+
+    def __len__(self) -> int:
+        return len(self._ordinals)
+
+    def rebuild(self, records: Iterable) -> None:
+        """Пересобирает таблицу из записей (answerid, questionid)"""
+        answer_ids: Dict[int, List[int]] = {}
+        for record in records:
+            answer_ids.setdefault(record['questionid'], []).append(record['answerid'])
+
+        self._answer_ids = {question_id: sorted(ids) for question_id, ids in answer_ids.items()}
+        self._ordinals = {
+            answer_id: ordinal
+            for ids in self._answer_ids.values()
+            for ordinal, answer_id in enumerate(ids, start=1)
+        }
+        self._lookup = np.zeros(max(self._ordinals, default=0) + 1, dtype=np.int16)
+        for answer_id, ordinal in self._ordinals.items():
+            self._lookup[answer_id] = ordinal
+        logger.info(f"Answer ordinals loaded: {len(self._ordinals)} answers, {len(self._answer_ids)} questions")
+
+    def ordinal(self, answer_id: int) -> Optional[int]:
+        """Номер ответа внутри его вопроса или None для неизвестного answerid"""
+        return self._ordinals.get(answer_id)
+
+    def answer_id(self, question_id: int, ordinal: int) -> Optional[int]:
+        """answerid варианта ordinal вопроса question_id или None"""
+        ids = self._answer_ids.get(question_id)
+        if not ids or not 1 <= ordinal <= len(ids):
+            return None
+        return ids[ordinal - 1]
+
+    def answer_ids(self, question_id: int) -> List[int]:
+        """answerid вариантов ответа на вопрос по порядку"""
+        return self._answer_ids.get(question_id, [])
+
+    def to_ordinals(self, answers: Dict[int, int]) -> Dict[int, int]:
+        """{questionid: answerid} -> {questionid: номер}, неизвестные ответы пропускаются"""
+        ordinals = {}
+        for question_id, answer_id in answers.items():
+            ordinal = self._ordinals.get(answer_id)
+            if ordinal is None:
+                logger.warning(f"Ответ {answer_id} на вопрос {question_id} отсутствует в таблице answers")
+                continue
+            ordinals[question_id] = ordinal
+        return ordinals
+
+    def to_answer_ids(self, ordinals: Dict[int, int]) -> Dict[int, int]:
+        """{questionid: номер} -> {questionid: answerid}"""
+        return {
+            question_id: self._answer_ids[question_id][ordinal - 1]
+            for question_id, ordinal in ordinals.items()
+        }
+
+    def ordinal_array(self, answer_ids: np.ndarray) -> np.ndarray:
+        """Векторно заменяет answerid на номера (NO_ANSWER и неизвестные ответы -> NO_ANSWER)"""
+        answer_ids = np.asarray(answer_ids)
+        known = (answer_ids > 0) & (answer_ids < len(self._lookup))
+        return np.where(known, self._lookup[np.where(known, answer_ids, 0)], NO_ANSWER)
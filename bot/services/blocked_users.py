@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Iterable, Optional, Set
+
+import asyncpg
+
+if TYPE_CHECKING:
+    from bot.services.database import Database
+
+logger = logging.getLogger(__name__)
+
+# Канал Postgres, в который триггер users_accountstatus_notify публикует блокировки и разблокировки
+CHANNEL = 'blocked_users'
+# Пауза между попытками восстановить соединение для LISTEN
+RECONNECT_DELAY = 5.0
+
+
+class BlockedUsers:
+    """
+    Заблокированные пользователи в памяти процесса для проверки в middleware
+
+    Загружается из users при подключении к БД и обновляется методами Database,
+    которые меняют accountstatus или удаляют пользователя. Любое изменение
+    accountstatus (в том числе из SQL администратора) триггер публикует в канал
+    blocked_users ('+id' - заблокирован, '-id' - нет). При запуске нескольких процессов
+    каждый слушает канал на отдельном соединении (start) и применяет чужие изменения,
+    после разблокировки анкета заново попадает в ProfilePartitions.
+    После потери соединения набор перечитывается целиком.
+    """
+
+    def __init__(self, db: "Database"):
+        self.db = db
+        self._ids: Set[int] = set()
+        self._conn: Optional[asyncpg.Connection] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        self._stopped = True
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def rebuild(self, user_ids: Iterable[int]):
+        self._ids = set(user_ids)
+        logger.info(f"Blocked users: {len(self._ids)}")
+
+    def set_blocked(self, user_id: int, blocked: bool) -> bool:
+        """Отмечает пользователя заблокированным или нет, возвращает True, если статус изменился"""
+        if blocked == (user_id in self._ids):
+            return False
+        if blocked:
+            self._ids.add(user_id)
+        else:
+            self._ids.discard(user_id)
+        return True
+
+    async def start(self):
+        """Подписывается на изменения из других процессов и перечитывает набор"""
+        self._stopped = False
+        await self._listen()
+
+    async def stop(self):
+        """Отписывается от канала и закрывает соединение"""
+        self._stopped = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            try:
+                await self._reconnect_task
+            except asyncio.CancelledError:
+                pass
+            self._reconnect_task = None
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
+
+    async def _listen(self):
+        self._conn = await self.db.open_connection()
+        self._conn.add_termination_listener(self._on_connection_lost)
+        await self._conn.add_listener(CHANNEL, self._on_notify)
+        # Изменения между загрузкой и подпиской пришли бы мимо, поэтому перечитываем после LISTEN
+        await self.db.load_blocked_users()
+        logger.info(f"Listening to {CHANNEL} notifications")
+
+    def _on_notify(self, connection, pid, channel, payload: str):
+        try:
+            user_id = int(payload[1:])
+        except ValueError:
+            logger.warning(f"Некорректное сообщение в канале {channel}: {payload!r}")
+            return
+        blocked = payload[0] == '+'
+        if self.set_blocked(user_id, blocked):
+            logger.debug(f"User {user_id} {'blocked' if blocked else 'unblocked'} by process {pid}")
+        if blocked:
+            self.db.profile_partitions.remove(user_id)
+            self.db.search_cache.invalidate_user(user_id)
+        else:
+            # Анкета снова участвует в поиске: перечитываем ее пол, возраст и город
+            task = asyncio.create_task(self._refresh_partition(user_id))
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _refresh_partition(self, user_id: int):
+        try:
+            await self.db.refresh_profile_partition(user_id)
+        except Exception as e:
+            logger.error(f"Ошибка обновления анкеты {user_id} после разблокировки: {e}")
+            logger.exception(e)
+
+    def _on_connection_lost(self, connection):
+        if self._stopped or self._reconnect_task is not None:
+            return
+        logger.warning(f"Connection listening to {CHANNEL} lost, reconnecting")
+        self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while not self._stopped:
+            await asyncio.sleep(RECONNECT_DELAY)
+            try:
+                await self._listen()
+                # Разблокировки за время обрыва не дошли, анкеты перечитываются целиком
+                await self.db.load_profile_partitions()
+                break
+            except Exception as e:
+                logger.error(f"Ошибка переподключения к каналу {CHANNEL}: {e}")
+        self._reconnect_task = None
@@ -0,0 +1,152 @@
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from kneed import KneeLocator
+from sklearn.cluster import KMeans
+
+from bot.services.scoring import NO_ANSWER, score_candidates
+
+logger = logging.getLogger(__name__)
+
+# Значение кластера для пользователей, которые не попали в последнюю кластеризацию
+NO_CLUSTER = -1
+
+
+def answer_features(answer_matrix: np.ndarray) -> np.ndarray:
+    """Признаки для k-means: номера ответов как порядковые значения, пропуски - среднее по вопросу"""
+    features = answer_matrix.astype(np.float32)
+    missing = answer_matrix == NO_ANSWER
+    if missing.any():
+        answered = np.where(missing, np.nan, features)
+        column_means = np.nan_to_num(np.nanmean(answered, axis=0))
+        features[missing] = np.take(column_means, np.nonzero(missing)[1])
+    return features
+
+
+def choose_k(features: np.ndarray, k_values: Sequence[int], seed: int = 42) -> Tuple[int, Dict[int, float]]:
+    """
+    Подбирает число кластеров по точке излома кривой инерции (kneed)
+
+    Returns:
+        Tuple[int, Dict[int, float]]: выбранное k и инерция для каждого проверенного k
+    """
+    k_values = [k for k in k_values if 1 < k <= len(features)]
+    if not k_values:
+        return 1, {}
+
+    inertias = {
+        k: float(KMeans(n_clusters=k, n_init=3, random_state=seed).fit(features).inertia_)
+        for k in k_values
+    }
+    knee = KneeLocator(
+        k_values, [inertias[k] for k in k_values],
+        curve='convex', direction='decreasing'
+    ).knee
+    k = int(knee) if knee is not None else k_values[-1]
+    logger.info(f"K-means elbow: k={k} (checked {k_values[0]}..{k_values[-1]})")
+    return k, inertias
+
+
+def fit_clusters(features: np.ndarray, k: int, seed: int = 42) -> np.ndarray:
+    """Разбивает пользователей на k кластеров, возвращает номер кластера для каждой строки"""
+    if k <= 1:
+        return np.zeros(len(features), dtype=np.int32)
+    return KMeans(n_clusters=k, n_init=10, random_state=seed).fit_predict(features).astype(np.int32)
+
+
+def cluster_affinity(
+    answer_matrix: np.ndarray,
+    labels: np.ndarray,
+    k: int,
+    sample_size: int = 100,
+    seed: int = 42
+) -> np.ndarray:
+    """
+    Ожидаемая совместимость между кластерами
+
+    affinity[a, b] - средняя совместимость пользователя из кластера a с пользователем
+    из кластера b (с точки зрения a), оценивается по случайной выборке sample_size
+    пользователей каждого кластера.
+    """
+    rng = np.random.default_rng(seed)
+    samples = []
+    for cluster in range(k):
+        members = np.flatnonzero(labels == cluster)
+        if len(members) > sample_size:
+            members = rng.choice(members, sample_size, replace=False)
+        samples.append(members)
+
+    affinity = np.zeros((k, k), dtype=np.float64)
+    for a in range(k):
+        for b in range(k):
+            if not len(samples[a]) or not len(samples[b]):
+                continue
+            candidates = answer_matrix[samples[b]]
+            affinity[a, b] = np.mean([
+                score_candidates(answer_matrix[row], candidates).mean()
+                for row in samples[a]
+            ])
+    return affinity
+
+
+class AnswerClusters:
+    """
+    Результат офлайн-кластеризации ответов: кластер пользователя и совместимость кластеров
+
+    Используется для отсечения кандидатов: сначала оцениваются пользователи
+    из кластеров с наибольшей ожидаемой совместимостью.
+    """
+
+    def __init__(self, clusters: Dict[int, int], affinity: np.ndarray):
+        # Отсортированные telegram id и их кластеры: поиск кластеров кандидатов через searchsorted
+        self._user_ids = np.fromiter(clusters.keys(), dtype=np.int64, count=len(clusters))
+        self._labels = np.fromiter(clusters.values(), dtype=np.int32, count=len(clusters))
+        order = np.argsort(self._user_ids)
+        self._user_ids = self._user_ids[order]
+        self._labels = self._labels[order]
+        self.affinity = affinity
+
+    def __len__(self) -> int:
+        return len(self._user_ids)
+
+    def cluster_of(self, user_id: int) -> int:
+        return int(self.clusters_of(np.asarray([user_id], dtype=np.int64))[0])
+
+    def clusters_of(self, user_ids: np.ndarray) -> np.ndarray:
+        """Кластеры пользователей (NO_CLUSTER для некластеризованных)"""
+        if not len(self._user_ids):
+            return np.full(len(user_ids), NO_CLUSTER, dtype=np.int32)
+        positions = np.minimum(np.searchsorted(self._user_ids, user_ids), len(self._user_ids) - 1)
+        return np.where(self._user_ids[positions] == user_ids, self._labels[positions], NO_CLUSTER)
+
+    def ranked_clusters(self, cluster: int) -> List[int]:
+        """Кластеры по убыванию ожидаемой совместимости с пользователем из cluster"""
+        return np.argsort(-self.affinity[cluster], kind='stable').tolist()
+
+    def select(self, user_id: int, candidate_ids: np.ndarray, min_candidates: int) -> Optional[np.ndarray]:
+        """
+        Выбирает кандидатов из лучших для пользователя кластеров
+
+        Кластеры добавляются по убыванию ожидаемой совместимости, пока не наберется
+        min_candidates кандидатов. Кандидаты вне кластеризации (новые пользователи)
+        включаются всегда.
+
+        Returns:
+            Optional[np.ndarray]: позиции выбранных кандидатов в candidate_ids или None,
+            если пользователь не кластеризован
+        """
+        cluster = self.cluster_of(user_id)
+        if cluster == NO_CLUSTER:
+            return None
+
+        candidate_clusters = self.clusters_of(np.asarray(candidate_ids, dtype=np.int64))
+        counts = np.bincount(candidate_clusters + 1, minlength=len(self.affinity) + 1)
+        chosen = [NO_CLUSTER]
+        total = counts[0]
+        for best in self.ranked_clusters(cluster):
+            if total >= min_candidates:
+                break
+            chosen.append(best)
+            total += counts[best + 1]
+        return np.flatnonzero(np.isin(candidate_clusters, chosen))
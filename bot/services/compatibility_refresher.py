@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from typing import Optional, Set
+
+import numpy as np
+
+from bot.services.database import Database
+from bot.services.encryption import CryptoService
+
+logger = logging.getLogger(__name__)
+
+
+class CompatibilityRefresher:
+    """
+    Фоновый пересчет таблицы compatibility_scores
+
+    Таблица хранит совместимость (user_a -> user_b) для пар из одного города
+    и противоположного пола. После изменения ответов, города или пола пользователя
+    пересчитываются только строки, в которых он участвует. Запись идет пачками
+    по batch_size строк с паузой throttle секунд, чтобы не занимать пул
+    подключений, нужный обработчикам сообщений.
+    """
+
+    def __init__(self, db: Database, crypto: CryptoService, batch_size: int = 500, throttle: float = 0.05):
+        self.db = db
+        self.crypto = crypto
+        self.batch_size = batch_size
+        self.throttle = throttle
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запускает фоновый воркер"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Compatibility refresher started")
+
+    async def stop(self):
+        """Останавливает воркер, не дожидаясь обработки очереди"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info(f"Compatibility refresher stopped, {len(self._pending)} users left in queue")
+
+    def enqueue(self, user_id: int):
+        """Ставит пользователя в очередь на пересчет (повторные запросы схлопываются)"""
+        if user_id in self._pending:
+            return
+        self._pending.add(user_id)
+        self._queue.put_nowait(user_id)
+
+    async def enqueue_missing(self):
+        """Ставит в очередь пользователей с ответами, для которых совместимость еще не пересчитывалась"""
+        user_ids = self.db.answer_index.user_ids().tolist()
+        missing = await self.db.get_users_without_compatibility_scores(user_ids)
+        for user_id in missing:
+            self.enqueue(user_id)
+        logger.info(f"Queued {len(missing)} users for compatibility precompute")
+
+    async def _run(self):
+        while True:
+            user_id = await self._queue.get()
+            self._pending.discard(user_id)
+            try:
+                await self.refresh_user(user_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка пересчета совместимости для {user_id}: {e}")
+                logger.exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def refresh_user(self, user_id: int):
+        """Пересчитывает все строки compatibility_scores, в которых участвует пользователь"""
+        user_vector = self.db.answer_index.vector(user_id)
+        profile = await self.db.get_user_profile(user_id) if user_vector is not None else None
+        if user_vector is not None and profile is None:
+            # get_user_profile возвращает None и при ошибке БД: не удаляем строки пользователя
+            raise LookupError(f"Не удалось получить профиль пользователя {user_id}")
+        partner_ids = np.zeros(0, dtype=np.int64)
+
+        if profile and profile.get('gender') in ('0', '1'):
+            city_index = profile.get('cityblindindex') or self._city_index(profile.get('city'))
+            if city_index:
+                opposite_gender = '1' if profile['gender'] == '0' else '0'
+                partners = await self.db.get_users_by_gender_and_city(opposite_gender, city_index, exclude_user_id=user_id)
+                # Город отобран по слепому индексу в запросе, дешифруются только анкеты без него
+                same_city = [
+                    partner['telegramid'] for partner in partners
+                    if (partner['cityblindindex'] or self._city_index(partner['city'])) == city_index
+                ]
+                partner_ids, partner_matrix = self.db.answer_index.matrix_for(same_city)
+
+        if len(partner_ids):
+            forward = self.db.scoring_engine.score(user_vector, partner_matrix)
+            reverse = self.db.scoring_engine.score_reverse(user_vector, partner_matrix)
+            partners_list = partner_ids.tolist()
+            user_a = [user_id] * len(partners_list) + partners_list
+            user_b = partners_list + [user_id] * len(partners_list)
+            scores = forward.tolist() + reverse.tolist()
+
+            for start in range(0, len(scores), self.batch_size):
+                end = start + self.batch_size
+                await self.db.upsert_compatibility_scores(user_a[start:end], user_b[start:end], scores[start:end])
+                # Отдаем пул подключений интерактивным запросам
+                await asyncio.sleep(self.throttle)
+
+        await self.db.delete_stale_compatibility_scores(user_id, partner_ids.tolist())
+        # Без пар в городе строк нет, поэтому поиск проверяет эту отметку, а не наличие строк
+        await self.db.mark_compatibility_computed(user_id)
+        logger.debug(f"Compatibility scores refreshed for {user_id}: {len(partner_ids)} partners")
+
+    def _city_index(self, encrypted_city) -> Optional[str]:
+        if not encrypted_city or encrypted_city == 'Не задан':
+            return None
+        try:
+            if isinstance(encrypted_city, bytes) or encrypted_city.startswith(('b\'gAAAAA', 'gAAAAA')):
+                encrypted_city = self.crypto.decrypt(encrypted_city)
+        except Exception as e:
+            logger.error(f"Ошибка дешифрования города: {e}")
+            return None
+        return self.crypto.city_blind_index(encrypted_city)
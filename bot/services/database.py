@@ -3,18 +3,78 @@ from decimal import Decimal
 import json
 import asyncpg
 import logging
+import numpy as np
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Union, Tuple
+from typing import AsyncIterator, List, Optional, Dict, Union, Tuple
 from bot.models.user import UserDB
+from bot.services.answer_index import AnswerIndex
+from bot.services.answer_ordinals import AnswerOrdinals
+from bot.services.blocked_users import CHANNEL as BLOCKED_USERS_CHANNEL, BlockedUsers
+from bot.services.clustering import AnswerClusters
+from bot.services.last_action_buffer import LastActionBuffer
+from bot.services.like_recommender import LikeRecommendations
+from bot.services.lsh_index import MinHashLSH
+from bot.services.profile_partitions import ProfilePartitions
+from bot.services.ranking_features import RankingFeatures
+from bot.services.scoring_engine import ScoringEngine
+from bot.services.search_cache import SearchCache
+from bot.services.seen_profiles import SeenProfiles
+from bot.services.unit_of_work import UnitOfWork, current_unit_of_work
 from bot.services.utils import standardize_gender
 from bot.services.notifications import send_match_notification
 
 logger = logging.getLogger(__name__)
 
+# Поля users, от которых зависит часть анкеты в ProfilePartitions
+PARTITION_FIELDS = {'gender', 'age', 'cityblindindex', 'accountstatus'}
+
 class Database:
     def __init__(self, config):
         self.config = config
         self.pool: Optional[asyncpg.Pool] = None
+        # Порядковые номера ответов внутри вопроса, общие для всех бэкендов подсчета
+        self.answer_ordinals = AnswerOrdinals()
+        self.answer_index = AnswerIndex(
+            self.answer_ordinals,
+            lsh=MinHashLSH(config.compatibility_lsh_bands, config.compatibility_lsh_rows)
+            if config.compatibility_lsh else None
+        )
+        self.search_cache = SearchCache(
+            max_entries=config.search_cache_size,
+            ttl=config.search_cache_ttl
+        )
+        # Фоновый пересчет compatibility_scores, задается при запуске бота
+        self.compatibility_refresher = None
+        # Пересчет коэффициента приоритета при окончании услуг, задается при запуске бота
+        self.priority_scheduler = None
+        # Фоновый расчет ленты поиска до нажатия «Поиск», задается при запуске бота
+        self.feed_prewarmer = None
+        # Подсчет совместимости для всех путей поиска, пул процессов подключается при запуске бота
+        self.scoring_engine = ScoringEngine(self.answer_index)
+        # Незаблокированные анкеты по полу и городу, отсортированные по возрасту, для фильтров поиска
+        self.profile_partitions = ProfilePartitions()
+        # Верификация и коэффициент приоритета всех пользователей для сортировки выдачи
+        self.ranking_features = RankingFeatures()
+        # Заблокированные пользователи для проверки в middleware, подписка на изменения при запуске бота
+        self.blocked_users = BlockedUsers(self)
+        # Кластеры ответов из офлайн-задачи bot.jobs.cluster_answers (None - кластеризации не было)
+        self.answer_clusters: Optional[AnswerClusters] = None
+        # Рекомендации по графу лайков из офлайн-задачи bot.jobs.train_like_recommender (None - обучения не было)
+        self.like_recommendations: Optional[LikeRecommendations] = None
+        # Уже оцененные в поиске анкеты, запись в profile_views запускается при старте бота
+        self.seen_profiles = SeenProfiles(
+            self,
+            flush_interval=config.seen_profiles_flush_interval,
+            batch_size=config.seen_profiles_batch_size,
+            max_users=config.seen_profiles_max_users
+        )
+        # Отложенная запись времени последнего действия, сброс запускается при старте бота
+        self.last_actions = LastActionBuffer(
+            self,
+            flush_interval=config.last_action_flush_interval,
+            batch_size=config.last_action_batch_size
+        )
 
     async def connect(self):
         """Установка пула подключений к базе данных"""
@@ -38,10 +98,427 @@ class Database:
             logger.exception(e)
             raise
 
+        await self.create_answer_weight_column()
+        await self.load_answer_ordinals()
+        await self.create_answer_ordinals_view()
+        await self.load_answer_index()
+        await self.load_ranking_features()
+        await self.load_profile_partitions()
+        await self.create_blocked_users_trigger()
+        await self.load_blocked_users()
+        await self.create_compatibility_scores_table()
+        await self.create_city_blind_index_column()
+        await self.create_answer_cluster_tables()
+        await self.load_answer_clusters()
+        await self.create_like_recommendations_table()
+        await self.load_like_recommendations()
+        await self.create_profile_views_table()
+
+    async def open_connection(self) -> asyncpg.Connection:
+        """Отдельное соединение вне пула (для LISTEN)"""
+        return await asyncpg.connect(
+            user=self.config.db_user,
+            password=self.config.db_pass,
+            database=self.config.db_name,
+            host=self.config.db_host,
+            port=self.config.db_port
+        )
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[asyncpg.Connection]:
+        """Соединение текущей единицы работы, а вне ее - соединение из пула"""
+        unit_of_work = current_unit_of_work.get()
+        if unit_of_work is None:
+            async with self.pool.acquire() as conn:
+                yield conn
+        else:
+            async with unit_of_work.acquire() as conn:
+                yield conn
+
+    @asynccontextmanager
+    async def unit_of_work(self, transaction: bool = False) -> AsyncIterator[UnitOfWork]:
+        """
+        Единица работы: все методы Database внутри блока используют одно соединение
+
+        Вложенный вызов в той же задаче присоединяется к уже открытой единице работы.
+        С transaction=True блок выполняется в транзакции (внутри другой - в точке сохранения).
+        """
+        unit_of_work = current_unit_of_work.get()
+        token = None
+        if unit_of_work is None or not unit_of_work.is_current():
+            unit_of_work = UnitOfWork(self.pool)
+            token = current_unit_of_work.set(unit_of_work)
+        try:
+            if transaction:
+                async with unit_of_work.transaction():
+                    yield unit_of_work
+            else:
+                yield unit_of_work
+        finally:
+            if token is not None:
+                current_unit_of_work.reset(token)
+                await unit_of_work.close()
+
+    async def release_connection(self):
+        """Возвращает соединение текущей единицы работы в пул перед долгим ожиданием"""
+        unit_of_work = current_unit_of_work.get()
+        if unit_of_work is not None and unit_of_work.is_current():
+            await unit_of_work.release()
+
+    async def create_answer_weight_column(self):
+        """Добавляет в answers колонку веса ответа (NULL - вес 1.0)"""
+        try:
+            async with self.acquire() as conn:
+                await conn.execute("ALTER TABLE answers ADD COLUMN IF NOT EXISTS answerweight DOUBLE PRECISION")
+        except Exception as e:
+            logger.error(f"Error adding answerweight column: {e}")
+            logger.exception(e)
+
+    async def load_answer_ordinals(self):
+        """Загрузка порядковых номеров и весов ответов"""
+        async with self.acquire() as conn:
+            records = await conn.fetch("SELECT answerid, questionid, answerweight FROM answers")
+        self.answer_ordinals.rebuild(records)
+        self.scoring_engine.load_weights(records)
+
+    async def create_answer_ordinals_view(self):
+        """Создает представление answerordinals с номерами и весами ответов для подсчета совместимости в SQL"""
+        try:
+            async with self.acquire() as conn:
+                await conn.execute("""
+                    CREATE OR REPLACE VIEW answerordinals AS
+                    SELECT answerid, questionid,
+                        ROW_NUMBER() OVER (PARTITION BY questionid ORDER BY answerid)::int AS ordinal,
+                        COALESCE(answerweight, 1.0)::float8 AS weight
+                    FROM answers
+                """)
+        except Exception as e:
+            logger.error(f"Error creating answerordinals view: {e}")
+            logger.exception(e)
+
+    async def load_answer_index(self):
+        """Загрузка ответов всех пользователей в индекс в памяти"""
+        logger.info("Loading answer index...")
+        async with self.acquire() as conn:
+            records = await conn.fetch(
+                "SELECT usertelegramid, questionid, answerid FROM useranswers"
+            )
+        self.answer_index.rebuild(records)
+
+    async def load_ranking_features(self):
+        """Загрузка верификации и коэффициентов приоритета всех пользователей в память"""
+        logger.info("Loading ranking features...")
+        async with self.acquire() as conn:
+            records = await conn.fetch("""
+                SELECT u.telegramid, u.profileprioritycoefficient,
+                    EXISTS(
+                        SELECT 1 FROM verifications v
+                        WHERE v.usertelegramid = u.telegramid
+                        AND v.processingstatus = 'approve'
+                    ) AS is_verified
+                FROM users u
+            """)
+        self.ranking_features.rebuild(records)
+
+    async def load_profile_partitions(self):
+        """Загрузка пола, возраста и слепого индекса города незаблокированных анкет в память"""
+        logger.info("Loading profile partitions...")
+        async with self.acquire() as conn:
+            records = await conn.fetch("""
+                SELECT telegramid, gender, age, cityblindindex
+                FROM users
+                WHERE accountstatus IS NULL OR accountstatus != 'blocked'
+            """)
+        self.profile_partitions.rebuild(records)
+
+    async def load_blocked_users(self):
+        """Загрузка заблокированных пользователей в память"""
+        async with self.acquire() as conn:
+            records = await conn.fetch("SELECT telegramid FROM users WHERE accountstatus = 'blocked'")
+        self.blocked_users.rebuild(record['telegramid'] for record in records)
+
+    async def create_blocked_users_trigger(self):
+        """
+        Триггер, публикующий блокировки и разблокировки в канал blocked_users
+
+        Срабатывает на любое изменение users.accountstatus и удаление заблокированного
+        пользователя, в том числе из SQL администратора, поэтому набор заблокированных
+        в памяти процессов не расходится с БД. Сообщение: '+id' - заблокирован, '-id' - нет.
+        """
+        try:
+            async with self.acquire() as conn:
+                await conn.execute(f"""
+                    CREATE OR REPLACE FUNCTION notify_blocked_users() RETURNS trigger AS $$
+                    BEGIN
+                        IF TG_OP = 'DELETE' THEN
+                            PERFORM pg_notify('{BLOCKED_USERS_CHANNEL}', '-' || OLD.telegramid);
+                            RETURN OLD;
+                        END IF;
+                        PERFORM pg_notify(
+                            '{BLOCKED_USERS_CHANNEL}',
+                            CASE WHEN NEW.accountstatus = 'blocked' THEN '+' ELSE '-' END || NEW.telegramid
+                        );
+                        RETURN NEW;
+                    END;
+                    $$ LANGUAGE plpgsql;
+
+                    DROP TRIGGER IF EXISTS users_accountstatus_notify ON users;
+                    CREATE TRIGGER users_accountstatus_notify
+                        AFTER UPDATE OF accountstatus ON users
+                        FOR EACH ROW
+                        WHEN (OLD.accountstatus IS DISTINCT FROM NEW.accountstatus)
+                        EXECUTE FUNCTION notify_blocked_users();
+
+                    DROP TRIGGER IF EXISTS users_blocked_delete_notify ON users;
+                    CREATE TRIGGER users_blocked_delete_notify
+                        AFTER DELETE ON users
+                        FOR EACH ROW
+                        WHEN (OLD.accountstatus = 'blocked')
+                        EXECUTE FUNCTION notify_blocked_users();
+                """)
+        except Exception as e:
+            logger.error(f"Error creating blocked users trigger: {e}")
+            logger.exception(e)
+
+    async def refresh_profile_partition(self, user_id: int):
+        """Перечитывает анкету пользователя в ProfilePartitions (после разблокировки в другом процессе)"""
+        async with self.acquire() as conn:
+            await self._refresh_profile_partition(conn, user_id)
+
+    async def _refresh_profile_partition(self, conn, user_id: int):
+        """Перечитывает пол, возраст и город анкеты после изменения полей в users"""
+        row = await conn.fetchrow(
+            "SELECT gender, age, cityblindindex, accountstatus FROM users WHERE telegramid = $1",
+            user_id
+        )
+        blocked = row is not None and row['accountstatus'] == 'blocked'
+        # Остальным процессам изменение accountstatus сообщает триггер users_accountstatus_notify
+        self.blocked_users.set_blocked(user_id, blocked)
+        if row is None or blocked:
+            self.profile_partitions.remove(user_id)
+        else:
+            self.profile_partitions.upsert(user_id, row['gender'], row['cityblindindex'], row['age'])
+
+    async def create_compatibility_scores_table(self):
+        """Создает таблицу предрасчитанной совместимости, если ее еще нет"""
+        try:
+            async with self.acquire() as conn:
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS compatibility_scores (
+                        user_a BIGINT NOT NULL,
+                        user_b BIGINT NOT NULL,
+                        score DOUBLE PRECISION NOT NULL,
+                        updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                        PRIMARY KEY (user_a, user_b)
+                    );
+                    CREATE INDEX IF NOT EXISTS compatibility_scores_user_a_score_idx
+                        ON compatibility_scores (user_a, score DESC);
+                    CREATE INDEX IF NOT EXISTS compatibility_scores_user_b_idx
+                        ON compatibility_scores (user_b);
+                    -- Время последнего пересчета: у пользователя без пар в городе строк нет
+                    ALTER TABLE users ADD COLUMN IF NOT EXISTS compatibilitycomputeddate TIMESTAMP;
+                """)
+        except Exception as e:
+            logger.error(f"Error creating compatibility_scores table: {e}")
+            logger.exception(e)
+
+    async def create_city_blind_index_column(self):
+        """Добавляет в users столбец слепого индекса города и индекс по нему"""
+        try:
+            async with self.acquire() as conn:
+                await conn.execute("""
+                    ALTER TABLE users ADD COLUMN IF NOT EXISTS cityblindindex TEXT;
+                    CREATE INDEX IF NOT EXISTS users_cityblindindex_idx ON users (cityblindindex);
+                """)
+        except Exception as e:
+            logger.error(f"Error creating cityblindindex column: {e}")
+            logger.exception(e)
+
+    async def create_answer_cluster_tables(self):
+        """Создает таблицы кластеров ответов и совместимости кластеров, если их еще нет"""
+        try:
+            async with self.acquire() as conn:
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS answerclusters (
+                        usertelegramid BIGINT PRIMARY KEY,
+                        clusterid INTEGER NOT NULL,
+                        updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+                    );
+                    CREATE TABLE IF NOT EXISTS clusteraffinity (
+                        clustera INTEGER NOT NULL,
+                        clusterb INTEGER NOT NULL,
+                        expectedscore DOUBLE PRECISION NOT NULL,
+                        PRIMARY KEY (clustera, clusterb)
+                    );
+                """)
+        except Exception as e:
+            logger.error(f"Error creating answer cluster tables: {e}")
+            logger.exception(e)
+
+    async def load_answer_clusters(self):
+        """Загружает результат последней кластеризации ответов в память"""
+        try:
+            async with self.acquire() as conn:
+                clusters = await conn.fetch("SELECT usertelegramid, clusterid FROM answerclusters")
+                affinity_rows = await conn.fetch("SELECT clustera, clusterb, expectedscore FROM clusteraffinity")
+        except Exception as e:
+            logger.error(f"Error loading answer clusters: {e}")
+            logger.exception(e)
+            return
+
+        if not clusters or not affinity_rows:
+            self.answer_clusters = None
+            return
+
+        k = max(max(row['clustera'], row['clusterb']) for row in affinity_rows) + 1
+        affinity = np.zeros((k, k), dtype=np.float64)
+        for row in affinity_rows:
+            affinity[row['clustera'], row['clusterb']] = row['expectedscore']
+        self.answer_clusters = AnswerClusters(
+            {row['usertelegramid']: row['clusterid'] for row in clusters},
+            affinity
+        )
+        logger.info(f"Answer clusters loaded: {len(clusters)} users, {k} clusters")
+
+    async def save_answer_clusters(self, user_ids: List[int], labels: List[int], affinity: np.ndarray):
+        """Заменяет результат кластеризации ответов одной транзакцией"""
+        k = affinity.shape[0]
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("TRUNCATE answerclusters, clusteraffinity")
+                await conn.execute("""
+                    INSERT INTO answerclusters (usertelegramid, clusterid)
+                    SELECT * FROM unnest($1::bigint[], $2::int[])
+                """, user_ids, labels)
+                await conn.execute("""
+                    INSERT INTO clusteraffinity (clustera, clusterb, expectedscore)
+                    SELECT * FROM unnest($1::int[], $2::int[], $3::float8[])
+                """,
+                    [a for a in range(k) for _ in range(k)],
+                    [b for _ in range(k) for b in range(k)],
+                    affinity.ravel().tolist())
+        logger.info(f"Saved answer clusters: {len(user_ids)} users, {k} clusters")
+
+    async def create_like_recommendations_table(self):
+        """Создает таблицу рекомендаций по графу лайков, если ее еще нет"""
+        try:
+            async with self.acquire() as conn:
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS likerecommendations (
+                        usertelegramid BIGINT NOT NULL,
+                        recommendedid BIGINT NOT NULL,
+                        score REAL NOT NULL,
+                        updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                        PRIMARY KEY (usertelegramid, recommendedid)
+                    );
+                """)
+        except Exception as e:
+            logger.error(f"Error creating like recommendations table: {e}")
+            logger.exception(e)
+
+    async def get_like_pairs(self) -> List[asyncpg.Record]:
+        """Все пары (кто лайкнул, кого) для обучения рекомендаций"""
+        async with self.acquire() as conn:
+            return await conn.fetch("SELECT sendertelegramid, receivertelegramid FROM likes")
+
+    async def load_like_recommendations(self):
+        """Загружает результат последнего обучения рекомендаций по лайкам в память"""
+        try:
+            async with self.acquire() as conn:
+                rows = await conn.fetch("""
+                    SELECT usertelegramid, recommendedid, score
+                    FROM likerecommendations
+                    ORDER BY usertelegramid, score DESC
+                """)
+        except Exception as e:
+            logger.error(f"Error loading like recommendations: {e}")
+            logger.exception(e)
+            return
+
+        if not rows:
+            self.like_recommendations = None
+            return
+
+        user_ids = np.fromiter((row['usertelegramid'] for row in rows), dtype=np.int64, count=len(rows))
+        users, starts, counts = np.unique(user_ids, return_index=True, return_counts=True)
+        recommended = np.full((len(users), int(counts.max())), -1, dtype=np.int64)
+        scores = np.zeros(recommended.shape, dtype=np.float32)
+        columns = np.arange(len(rows)) - np.repeat(starts, counts)
+        user_rows = np.repeat(np.arange(len(users)), counts)
+        recommended[user_rows, columns] = [row['recommendedid'] for row in rows]
+        scores[user_rows, columns] = [row['score'] for row in rows]
+        self.like_recommendations = LikeRecommendations(users, recommended, scores)
+        logger.info(f"Like recommendations loaded: {len(users)} users, {len(rows)} recommendations")
+
+    async def save_like_recommendations(self, user_ids: List[int], recommended_ids: List[int], scores: List[float]):
+        """Заменяет рекомендации по лайкам одной транзакцией"""
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("TRUNCATE likerecommendations")
+                await conn.execute("""
+                    INSERT INTO likerecommendations (usertelegramid, recommendedid, score)
+                    SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::real[])
+                """, user_ids, recommended_ids, scores)
+        logger.info(f"Saved like recommendations: {len(set(user_ids))} users, {len(user_ids)} rows")
+
+    async def create_profile_views_table(self):
+        """Создает таблицу просмотренных в поиске анкет, если ее еще нет"""
+        try:
+            async with self.acquire() as conn:
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS profile_views (
+                        viewer_id BIGINT NOT NULL,
+                        viewed_id BIGINT NOT NULL,
+                        action TEXT NOT NULL,
+                        viewed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                        PRIMARY KEY (viewer_id, viewed_id)
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_profile_views_viewed
+                        ON profile_views (viewed_id);
+                """)
+        except Exception as e:
+            logger.error(f"Error creating profile_views table: {e}")
+            logger.exception(e)
+
+    async def save_profile_views(self, viewer_ids: List[int], viewed_ids: List[int], actions: List[str]):
+        """Записывает пачку просмотров анкет одним запросом (повторный просмотр обновляет действие)"""
+        async with self.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO profile_views (viewer_id, viewed_id, action)
+                SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::text[])
+                ON CONFLICT (viewer_id, viewed_id)
+                DO UPDATE SET action = EXCLUDED.action, viewed_at = NOW()
+            """, viewer_ids, viewed_ids, actions)
+
+    async def get_seen_profile_ids(self, viewer_id: int) -> np.ndarray:
+        """Отсортированный массив анкет, которые пользователь уже оценил в поиске"""
+        try:
+            async with self.acquire() as conn:
+                # Пропуски, записанные прежними версиями, не исключают анкету из поиска
+                rows = await conn.fetch(
+                    "SELECT viewed_id FROM profile_views WHERE viewer_id = $1 AND action <> 'skip' ORDER BY viewed_id",
+                    viewer_id
+                )
+                return np.fromiter((row['viewed_id'] for row in rows), dtype=np.int64, count=len(rows))
+        except Exception as e:
+            logger.error(f"Error getting seen profiles for {viewer_id}: {e}")
+            logger.exception(e)
+            return np.zeros(0, dtype=np.int64)
+
+    def schedule_compatibility_refresh(self, user_id: int):
+        """Ставит пользователя в очередь пересчета compatibility_scores, если пересчет включен"""
+        if self.compatibility_refresher is not None:
+            self.compatibility_refresher.enqueue(user_id)
+
+    def schedule_priority_expiry(self, user_id: int, seconds_left: Optional[float]):
+        """Планирует пересчет приоритета через seconds_left секунд (окончание услуги), если планировщик запущен"""
+        if self.priority_scheduler is not None:
+            self.priority_scheduler.schedule(user_id, seconds_left)
+
     async def is_user_registered(self, telegram_id: int) -> bool:
         """Проверка регистрации пользователя"""
         logger.debug(f"Checking registration for user {telegram_id}")
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             try:
                 result = await conn.fetchrow(
                     "SELECT telegramid FROM users WHERE telegramid = $1",
@@ -58,7 +535,7 @@ class Database:
         """Сохранение нового пользователя"""
         logger.info(f"Saving user {telegram_id}")
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 # Логируем базовую информацию о пользователе
                 logger.debug(f"User data: { {k: v for k, v in user_data.items() if k != 'photos'} }")
                 logger.debug(f"Photos count: {len(user_data['photos'])}")
@@ -79,38 +556,50 @@ class Database:
                     standardized_gender = '1'  # Преобразуем в строку
                     logger.debug("Standardized to female ('1')")
 
-                # Сохранение основных данных
-                await conn.execute("""
-                    INSERT INTO users (
-                        telegramid, name, age, gender, city,
-                        profiledescription, registrationdate, lastactiondate
-                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-                """, telegram_id, user_data['name'], user_data['age'],
-                    standardized_gender, user_data['location'],
-                    user_data['description'], datetime.now(), datetime.now())
-
-                # Сохранение политики согласия с ПК
-                await conn.execute("""
-                    INSERT INTO consenttopdp (usertelegramid, policyversionid, consentstatus)
-                    VALUES ($1, $2, $3)
-                """, telegram_id, user_data['idpolicy'], user_data['policy'])
-
-                # Сохранение фотографий
-                for index, photo_info in enumerate(user_data['photos']):
-                    # Извлекаем file_id из словаря с информацией о фото
-                    photo_id = photo_info['file_id'] if isinstance(photo_info, dict) else photo_info
-                    logger.debug(f"Processing photo {index + 1}: {photo_info}")
-                    logger.debug(f"Extracted file_id: {photo_id}")
-
+                # Анкета, согласие и фото сохраняются вместе: при ошибке не остается неполного пользователя
+                async with conn.transaction():
+                    # Сохранение основных данных
+                    await conn.execute("""
+                        INSERT INTO users (
+                            telegramid, name, age, gender, city,
+                            profiledescription, registrationdate, lastactiondate,
+                            cityblindindex
+                        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+                    """, telegram_id, user_data['name'], user_data['age'],
+                        standardized_gender, user_data['location'],
+                        user_data['description'], datetime.now(), datetime.now(),
+                        user_data.get('city_index'))
+
+                    # Сохранение политики согласия с ПК
                     await conn.execute("""
-                        INSERT INTO photos
-                        (usertelegramid, photourl, photofileid, photodisplayorder)
-                         VALUES ($1, $2, $3, $4)
-                     """,
-                     telegram_id,
-                     photo_info['s3_url'],   # URL фото
-                     photo_info['file_id'],  # Telegram file ID
-                     index)                  # Порядковый номер фото)
+                        INSERT INTO consenttopdp (usertelegramid, policyversionid, consentstatus)
+                        VALUES ($1, $2, $3)
+                    """, telegram_id, user_data['idpolicy'], user_data['policy'])
+
+                    # Сохранение фотографий
+                    for index, photo_info in enumerate(user_data['photos']):
+                        # Извлекаем file_id из словаря с информацией о фото
+                        photo_id = photo_info['file_id'] if isinstance(photo_info, dict) else photo_info
+                        logger.debug(f"Processing photo {index + 1}: {photo_info}")
+                        logger.debug(f"Extracted file_id: {photo_id}")
+
+                        await conn.execute("""
+                            INSERT INTO photos
+                            (usertelegramid, photourl, photofileid, photodisplayorder)
+                             VALUES ($1, $2, $3, $4)
+                         """,
+                         telegram_id,
+                         photo_info['s3_url'],   # URL фото
+                         photo_info['file_id'],  # Telegram file ID
+                         index)                  # Порядковый номер фото)
+
+                # Индексы в памяти обновляем только после фиксации всех вставок
+                self.profile_partitions.upsert(
+                    telegram_id, standardized_gender, user_data.get('city_index'), user_data['age']
+                )
+                # Новая анкета: базовый коэффициент приоритета (значение по умолчанию в users), без верификации
+                self.ranking_features.set_priority(telegram_id, Decimal('1.0'))
+                self.ranking_features.set_verified(telegram_id, False)
 
                 logger.info(f"✅ User {telegram_id} saved successfully")
                 return True
@@ -122,7 +611,7 @@ class Database:
     async def get_user_data(self, telegram_id: int) -> Optional[Dict]:
         """Получение данных пользователя"""
         logger.debug(f"Fetching data for user {telegram_id}")
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             try:
                 user = await conn.fetchrow(
                     "SELECT * FROM users WHERE telegramid = $1",
@@ -153,7 +642,7 @@ class Database:
     async def save_policy_acception(self, telegram_id: int, user_data: Dict):
         """Сохранение согласия с ПК (при обновлении)"""
         logger.info(f"Updating user {telegram_id} policy acception")
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             try:
                 await conn.execute("""
                             INSERT INTO consenttopdp (usertelegramid, policyversionid, consentstatus)
@@ -168,7 +657,8 @@ class Database:
     async def update_user_field(self, telegram_id: int, **fields) -> bool:
         """Обновление полей пользователя"""
         logger.info(f"Updating user {telegram_id} fields: {', '.join(fields.keys())}")
-        async with self.pool.acquire() as conn:
+        # check_user_subscription и check_active_moders выполняются на этом же соединении
+        async with self.unit_of_work(), self.acquire() as conn:
             try:
                 updates = []
                 values = [telegram_id, datetime.now()]  # Начинаем с этих двух значений
@@ -186,6 +676,13 @@ class Database:
 
                 result = await conn.execute(query, *values)  # Передаем все значения
 
+                # Город и пол определяют пары в compatibility_scores
+                if 'city' in fields or 'gender' in fields:
+                    self.schedule_compatibility_refresh(telegram_id)
+                if PARTITION_FIELDS.intersection(fields):
+                    await self._refresh_profile_partition(conn, telegram_id)
+                self.search_cache.invalidate_user(telegram_id)
+
                 if await self.check_user_subscription(telegram_id) and not await self.check_active_moders(telegram_id):
                     await conn.execute(
                             "INSERT INTO moderations (usertelegramid) VALUES ($1)",
@@ -200,7 +697,7 @@ class Database:
 
     async def check_active_moders(self, user_id: int):
         """Проверка наличия активных запросов на модерацию пользователя"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             try:
                 query = """SELECT EXISTS (
                             SELECT 1
@@ -229,7 +726,8 @@ class Database:
         """Обновление фотографий пользователя с поддержкой S3"""
         logger.info(f"Updating photos for user {usertelegramid}")
 
-        async with self.pool.acquire() as conn:
+        # check_user_subscription и check_active_moders выполняются внутри этой же транзакции
+        async with self.unit_of_work(), self.acquire() as conn:
             async with conn.transaction():  # Добавляем транзакцию
                 try:
                     # Удаляем старые фото
@@ -266,7 +764,7 @@ class Database:
     async def get_questions_and_answers(self) -> tuple[Dict, Dict]:
         """Получение вопросов и ответов для теста"""
         logger.info("Fetching questions and answers")
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             try:
                 questions = await conn.fetch(
                     "SELECT questionid, questiontext FROM questions"
@@ -311,7 +809,7 @@ class Database:
             logger.error(f"Cannot save answers: User {telegram_id} is not registered")
             return False
 
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             try:
                 # Удаляем предыдущие ответы
                 await conn.execute(
@@ -328,6 +826,9 @@ class Database:
                         VALUES ($1, $2, $3)
                     """, telegram_id, question_id, answer_id)
 
+                self.answer_index.upsert(telegram_id, answers)
+                self.schedule_compatibility_refresh(telegram_id)
+                self.search_cache.invalidate_user(telegram_id)
                 logger.info(f"✅ Saved {len(answers)} answers for user {telegram_id}")
                 return True
             except Exception as e:
@@ -337,7 +838,7 @@ class Database:
 
     async def check_existing_answers(self, user_id: int) -> bool:
         logger.debug(f"Checking existing answers for user {user_id}")
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             try:
                 result = await conn.fetchval(
                     "SELECT EXISTS(SELECT 1 FROM useranswers WHERE usertelegramid = $1)",
@@ -351,7 +852,7 @@ class Database:
                 return False
 
     async def get_user(self, telegram_id: int) -> Optional[UserDB]:
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             return await conn.fetchrow(
                 "SELECT * FROM users WHERE telegramid = $1",
                 telegram_id
@@ -359,23 +860,32 @@ class Database:
 
     async def update_profile_field(self, user_id: int, field: str, value: Union[str, int, bytes]) -> bool:
             try:
-                async with self.pool.acquire() as conn:
+                async with self.acquire() as conn:
                     await conn.execute(
                         f"UPDATE users SET {field} = $1 WHERE telegramid = $2",
                         value, user_id
                     )
+                    # Город и пол определяют пары в compatibility_scores
+                    if field in ('city', 'gender'):
+                        self.schedule_compatibility_refresh(user_id)
+                    if field in PARTITION_FIELDS:
+                        await self._refresh_profile_partition(conn, user_id)
+                    self.search_cache.invalidate_user(user_id)
                     return True
             except Exception as e:
                 logger.error(f"Ошибка обновления поля: {e}")
                 return False
 
     async def del_user_answers(self, telegram_id: int) -> bool:
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             try:
                 await conn.execute(
                     "DELETE FROM useranswers WHERE usertelegramid = $1",
                     telegram_id
                 )
+                self.answer_index.remove(telegram_id)
+                self.schedule_compatibility_refresh(telegram_id)
+                self.search_cache.invalidate_user(telegram_id)
                 return True
             except Exception as e:
                 logger.error(f"Error deleting user answers: {e}")
@@ -385,7 +895,7 @@ class Database:
     async def get_user_answers(self, user_id: int) -> Dict[int, int]:
         """Получение ответов пользователя на тест"""
         logger.debug(f"Fetching answers for user {user_id}")
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             try:
                 rows = await conn.fetch(
                     "SELECT questionid, answerid FROM useranswers WHERE usertelegramid = $1",
@@ -399,26 +909,10 @@ class Database:
                 logger.error(f"Error getting answers for user {user_id}: {e}")
                 return {}
 
-    async def get_answer_weights(self):
-        """Получает веса ответов для вопросов (использует веса по умолчанию)"""
-        try:
-            # Получаем все ID вопросов
-            query = "SELECT questionid FROM questions"
-            result = await self.execute_query(query)
-
-            # Создаем словарь с весами по умолчанию (1.0) для всех вопросов
-            weights = {row[0]: 1.0 for row in result} if result else {}
-
-            logger.debug(f"Using default weights for {len(weights)} questions")
-            return weights
-        except Exception as e:
-            logger.error(f"Error getting question IDs: {e}")
-            return {}
-
     async def get_users_with_answers(self, exclude_user_id: int = None) -> List[int]:
         """Получение списка пользователей, прошедших тест"""
         logger.debug(f"Fetching users with test answers (excluding {exclude_user_id})")
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             try:
                 query = """
                     SELECT DISTINCT usertelegramid
@@ -442,7 +936,7 @@ class Database:
     async def check_user_has_test(self, user_id: int) -> bool:
         """Проверяет, прошел ли пользователь тест совместимости"""
         logger.debug(f"Checking if user {user_id} has completed the test")
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             try:
                 result = await conn.fetchval(
                     "SELECT COUNT(*) FROM useranswers WHERE usertelegramid = $1",
@@ -457,85 +951,29 @@ class Database:
         """Получает список совместимых пользователей"""
         logger.debug(f"Finding compatible users for user {user_id}")
         try:
-            # Получаем ответы текущего пользователя
-            user_answers = await self.get_user_answers(user_id)
-            if not user_answers:
-                logger.warning(f"User {user_id} has no answers")
+            # Считаем совместимость со всеми пользователями индекса за один проход
+            other_users = [other_id for other_id in self.answer_index.user_ids().tolist() if other_id != user_id]
+            found_ids, scores = self.scoring_engine.score_users(user_id, other_users)
+            if not len(found_ids):
+                logger.warning(f"No compatible users for {user_id}")
                 return []
 
-            # Получаем пользователей, прошедших тест
-            other_users = await self.get_users_with_answers(exclude_user_id=user_id)
-            logger.debug(f"Found {len(other_users)} other users with answers")
-            if not other_users:
-                logger.warning("No other users with answers found")
-                return []
-
-            # Получаем веса ответов
-            weights = await self.get_answer_weights()
-
-            # Рассчитываем совместимость с каждым пользователем
-            compatible_users = []
-            for other_id in other_users:
-                # Получаем ответы другого пользователя
-                other_answers = await self.get_user_answers(other_id)
-                if not other_answers:
-                    logger.warning(f"User {other_id} has no answers")
-                    continue
-
-                # Рассчитываем совместимость
-                compatibility = self._calculate_compatibility(user_answers, other_answers, weights)
-
-                # Добавляем пользователя в список, если совместимость выше порога
-                if compatibility > 30:  # Минимальный порог совместимости
-                    compatible_users.append((other_id, compatibility))
-
-            # Сортируем по совместимости (от высокой к низкой)
-            compatible_users.sort(key=lambda x: x[1], reverse=True)
-
-            # Возвращаем ограниченное количество пользователей
-            return compatible_users[:limit]
+            # Минимальный порог совместимости, сортировка от высокой к низкой
+            compatible = np.flatnonzero(scores > 30)
+            order = compatible[np.argsort(-scores[compatible], kind='stable')][:limit]
+            return list(zip(found_ids[order].tolist(), scores[order].tolist()))
 
         except Exception as e:
             logger.error(f"Error finding compatible users: {e}")
             logger.exception(e)
             return []
 
-    def _calculate_compatibility(self, user1_answers: Dict[int, int], user2_answers: Dict[int, int], weights: Dict[int, Dict[int, float]]) -> float:
-        """Рассчитывает процент совместимости между двумя пользователями"""
-        try:
-            total_questions = len(set(user1_answers.keys()) & set(user2_answers.keys()))
-            if total_questions == 0:
-                return 0.0
-
-            compatibility_score = 0.0
-
-            for question_id in set(user1_answers.keys()) & set(user2_answers.keys()):
-                answer1 = user1_answers[question_id]
-                answer2 = user2_answers[question_id]
-
-                # Если ответы совпадают, добавляем полный вес
-                if answer1 == answer2:
-                    weight = weights.get(question_id, {}).get(answer1, 1.0)
-                    compatibility_score += weight
-                else:
-                    # Если ответы разные, можно добавить частичную совместимость
-                    # в зависимости от близости ответов или других факторов
-                    pass
-
-            # Рассчитываем процент совместимости
-            compatibility_percent = (compatibility_score / total_questions) * 100
-            return compatibility_percent
-
-        except Exception as e:
-            logger.error(f"Error calculating compatibility: {e}")
-            return 0.0
-
     async def get_user_profile(self, user_id: int) -> Optional[Dict]:
         """Получает профиль пользователя"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 query = """
-                    SELECT u.telegramid, u.name, u.age, u.gender, u.city, u.profiledescription,
+                    SELECT u.telegramid, u.name, u.age, u.gender, u.city, u.cityblindindex, u.profiledescription,
                         EXISTS(
                             SELECT 1
                             FROM verifications v
@@ -556,7 +994,7 @@ class Database:
     async def get_user_photos(self, user_id):
         """Получает фотографии пользователя"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 query = """
                 SELECT photofileid, photourl
                 FROM photos
@@ -576,6 +1014,128 @@ class Database:
             logger.error(f"Ошибка при получении фотографий пользователя {user_id}: {e}")
             return []
 
+    async def get_profiles_by_ids(self, user_ids: List[int]) -> Dict[int, Dict]:
+        """Получает профили, фотографии и статус верификации для списка пользователей одним запросом"""
+        if not user_ids:
+            return {}
+        try:
+            async with self.acquire() as conn:
+                query = """
+                    SELECT u.telegramid, u.name, u.age, u.gender, u.city as location,
+                        u.profiledescription as description, u.profileprioritycoefficient,
+                        ARRAY(
+                            SELECT p.photofileid FROM photos p
+                            WHERE p.usertelegramid = u.telegramid
+                            ORDER BY p.photodisplayorder
+                        ) AS photos,
+                        EXISTS(
+                            SELECT 1 FROM verifications v
+                            WHERE v.usertelegramid = u.telegramid
+                            AND v.processingstatus = 'approve'
+                        ) AS is_verified
+                    FROM users u
+                    WHERE u.telegramid = ANY($1::bigint[])
+                """
+                rows = await conn.fetch(query, list(user_ids))
+
+            profiles = {}
+            for row in rows:
+                profile = dict(row)
+                profile['photos'] = list(profile['photos'])
+                profiles[row['telegramid']] = profile
+            return profiles
+        except Exception as e:
+            logger.error(f"Ошибка при получении профилей пользователей: {e}")
+            return {}
+
+    async def get_users_by_gender_and_city(self, gender: str, city_index: str, exclude_user_id: int = None) -> List[asyncpg.Record]:
+        """
+        Получает ID, зашифрованный город и его слепой индекс пользователей указанного пола из города city_index
+
+        Анкеты без слепого индекса (еще не заполненного миграцией) тоже возвращаются,
+        их город проверяется после дешифрования.
+        """
+        async with self.acquire() as conn:
+            return await conn.fetch("""
+                SELECT telegramid, city, cityblindindex FROM users
+                WHERE gender = $1 AND (cityblindindex = $2 OR cityblindindex IS NULL)
+                AND telegramid IS DISTINCT FROM $3
+            """, gender, city_index, exclude_user_id)
+
+    async def get_users_without_city_blind_index(self, after_id: int, limit: int) -> List[asyncpg.Record]:
+        """Получает следующую пачку пользователей без слепого индекса города (по возрастанию ID)"""
+        async with self.acquire() as conn:
+            return await conn.fetch("""
+                SELECT telegramid, city FROM users
+                WHERE telegramid > $1 AND cityblindindex IS NULL AND city IS NOT NULL
+                ORDER BY telegramid
+                LIMIT $2
+            """, after_id, limit)
+
+    async def update_city_blind_indexes(self, user_ids: List[int], indexes: List[str]) -> str:
+        """Записывает слепые индексы города для пачки пользователей одним запросом"""
+        async with self.acquire() as conn:
+            return await conn.execute("""
+                UPDATE users u SET cityblindindex = b.cityblindindex
+                FROM unnest($1::bigint[], $2::text[]) AS b(telegramid, cityblindindex)
+                WHERE u.telegramid = b.telegramid
+            """, user_ids, indexes)
+
+    async def upsert_compatibility_scores(self, user_a: List[int], user_b: List[int], scores: List[float]):
+        """Сохраняет пачку строк compatibility_scores одним запросом"""
+        async with self.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO compatibility_scores (user_a, user_b, score)
+                SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::float8[])
+                ON CONFLICT (user_a, user_b)
+                DO UPDATE SET score = EXCLUDED.score, updated_at = NOW()
+            """, user_a, user_b, scores)
+
+    async def delete_stale_compatibility_scores(self, user_id: int, partner_ids: List[int]):
+        """Удаляет строки пользователя с партнерами, которых больше нет в его списке пар"""
+        async with self.acquire() as conn:
+            await conn.execute("""
+                DELETE FROM compatibility_scores
+                WHERE (user_a = $1 AND NOT user_b = ANY($2::bigint[]))
+                OR (user_b = $1 AND NOT user_a = ANY($2::bigint[]))
+            """, user_id, partner_ids)
+
+    async def mark_compatibility_computed(self, user_id: int):
+        """Отмечает, что строки compatibility_scores пользователя пересчитаны (даже если пар нет)"""
+        async with self.acquire() as conn:
+            await conn.execute(
+                "UPDATE users SET compatibilitycomputeddate = NOW() WHERE telegramid = $1",
+                user_id
+            )
+
+    async def has_compatibility_scores(self, user_id: int) -> bool:
+        """Проверяет, рассчитана ли для пользователя совместимость в compatibility_scores"""
+        try:
+            async with self.acquire() as conn:
+                return bool(await conn.fetchval(
+                    "SELECT compatibilitycomputeddate IS NOT NULL FROM users WHERE telegramid = $1",
+                    user_id
+                ))
+        except Exception as e:
+            logger.error(f"Ошибка проверки предрасчета совместимости для {user_id}: {e}")
+            logger.exception(e)
+            return False
+
+    async def get_users_without_compatibility_scores(self, user_ids: List[int]) -> List[int]:
+        """Возвращает пользователей из списка, для которых совместимость еще не пересчитывалась"""
+        try:
+            async with self.acquire() as conn:
+                rows = await conn.fetch("""
+                    SELECT c.telegramid
+                    FROM unnest($1::bigint[]) AS c(telegramid)
+                    JOIN users u ON u.telegramid = c.telegramid
+                    WHERE u.compatibilitycomputeddate IS NULL
+                """, list(user_ids))
+            return [row['telegramid'] for row in rows]
+        except Exception as e:
+            logger.error(f"Ошибка при поиске пользователей без предрасчета совместимости: {e}")
+            return []
+
     async def add_like(self, from_user_id, to_user_id, bot=None, crypto=None):
         """Добавляет лайк в базу данных и проверяет взаимность"""
         try:
@@ -598,8 +1158,10 @@ class Database:
             VALUES ($1, $2, FALSE)
             RETURNING likeid
             """
-            like_id = await self.pool.fetchval(query, from_user_id, to_user_id)
+            async with self.acquire() as conn:
+                like_id = await conn.fetchval(query, from_user_id, to_user_id)
             logger.info(f"Добавлен лайк ID: {like_id}")
+            self.seen_profiles.mark(from_user_id, to_user_id, 'like')
 
             # Проверяем взаимность
             mutual_like = reverse_like_exists is not None
@@ -643,7 +1205,7 @@ class Database:
     async def get_mutual_likes(self, user_id):
         """Получает список пользователей, с которыми есть взаимные лайки"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 query = """
                 SELECT u.* FROM users u
                 WHERE u.telegramid IN (
@@ -663,7 +1225,7 @@ class Database:
         """Удаляет взаимные лайки между двумя пользователями после отправки уведомления"""
         try:
             logger.info(f"Удаление взаимных лайков между {user1_id} и {user2_id}")
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 # Удаляем лайки в обоих направлениях
                 await conn.execute("""
                     DELETE FROM likes
@@ -680,7 +1242,7 @@ class Database:
         """Проверяет, есть ли у пользователя активная подписка"""
         logger.debug(f"Checking subscription for user {user_id}")
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 # Проверяем наличие активной подписки
                 result = await conn.fetchval(
                     """
@@ -710,7 +1272,7 @@ class Database:
         logger.info(f"Активация подписки для пользователя {user_id} на {days} дней")
 
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 # Проверяем, есть ли уже активная подписка
                 has_active = await self.check_user_subscription(user_id)
 
@@ -726,15 +1288,18 @@ class Database:
                 logger.debug(f"Добавление записи: user_id={user_id}, service_id=1, end_date={end_date}, payment_id={payment_id}")
 
                 try:
-                    # Вставляем запись о подписке
-                    await conn.execute(
+                    # Вставляем запись о подписке, до окончания считаем по часам БД
+                    seconds_left = await conn.fetchval(
                         """
                         INSERT INTO purchasedservices
                         (usertelegramid, serviceid, serviceenddate, paymentstatus, paymentid)
                         VALUES ($1, $2, $3, $4, $5)
+                        RETURNING EXTRACT(EPOCH FROM serviceenddate - NOW())::float8
                         """,
                         user_id, 1, end_date, True, payment_id
                     )
+                    await self.update_user_priority(user_id)
+                    self.schedule_priority_expiry(user_id, seconds_left)
 
                 except Exception as e:
                     logger.error(f"Ошибка SQL при активации подписки: {e}")
@@ -747,7 +1312,7 @@ class Database:
 
     async def save_feedback(self, user_id: int, text: str) -> bool:
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 res = await conn.execute(
                     "INSERT INTO feedback (sendertelegramid, messagetext) "
                     "VALUES ($1, $2)",
@@ -766,7 +1331,7 @@ class Database:
 
     async def get_user_likes(self, user_id, only_unviewed=False):
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 if only_unviewed:
                     query = """
                         SELECT likeid, sendertelegramid as from_user_id, receivertelegramid as to_user_id,
@@ -793,7 +1358,7 @@ class Database:
     async def get_user_likes_count(self, user_id):
         """Получает количество лайков пользователя"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 query = """
                 SELECT COUNT(*) as count
                 FROM likes
@@ -809,7 +1374,7 @@ class Database:
     async def get_unviewed_likes_count(self, user_id):
         """Получает количество непросмотренных лайков пользователя"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 query = """
                 SELECT COUNT(*) as count
                 FROM likes
@@ -836,7 +1401,7 @@ class Database:
             bool: True в случае успеха, False в случае ошибки
         """
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 if receiver_id is None:
                     # Отмечаем все лайки, полученные пользователем
                     query = """
@@ -874,7 +1439,8 @@ class Database:
             SELECT likeid FROM likes
             WHERE sendertelegramid = $1 AND receivertelegramid = $2
             """
-            like_id = await self.pool.fetchval(query, from_user_id, to_user_id)
+            async with self.acquire() as conn:
+                like_id = await conn.fetchval(query, from_user_id, to_user_id)
             return like_id
         except Exception as e:
             logger.error(f"Ошибка при проверке существования лайка: {e}", exc_info=True)
@@ -883,7 +1449,7 @@ class Database:
     async def debug_likes_table(self, user_id: int = None, liked_user_id: int = None):
         """Отладочный метод для проверки таблицы лайков"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 if user_id and liked_user_id:
                     # Проверяем конкретную пару пользователей
                     query = """
@@ -918,7 +1484,7 @@ class Database:
         """Получает список всех доступных услуг"""
         logger.debug("Fetching all services")
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 query = """
                     SELECT
                         serviceid,
@@ -940,7 +1506,7 @@ class Database:
         """Получает информацию об услуге по ID"""
         logger.debug(f"Fetching service with ID {service_id}")
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 query = """
                     SELECT
                         serviceid,
@@ -962,7 +1528,7 @@ class Database:
         """Получает список активных услуг пользователя"""
         logger.debug(f"Fetching active services for user {user_id}")
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 query = """
                     SELECT
                         ps.recordid,
@@ -994,7 +1560,7 @@ class Database:
     async def calculate_priority_coefficient(self, user_id: int) -> float:
         """Рассчитывает общий коэффициент приоритета пользователя"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 # Базовый коэффициент
                 total_coefficient = 1.0
 
@@ -1026,20 +1592,77 @@ class Database:
             new_coefficient = await self.calculate_priority_coefficient(user_id)
 
             # Сохраняем в БД как целое число (например 150 вместо 1.5)
-            async with self.pool.acquire() as conn:
-                await conn.execute(
+            async with self.acquire() as conn:
+                result = await conn.execute(
                     "UPDATE users SET profileprioritycoefficient = $1 WHERE telegramid = $2",
                     new_coefficient, user_id
                 )
+            if result != "UPDATE 0":
+                self.ranking_features.set_priority(user_id, new_coefficient)
             return True
         except Exception as e:
             logger.error(f"Error updating priority for user {user_id}: {e}")
             return False
 
+    async def refresh_stale_priorities(self) -> int:
+        """
+        Пересчитывает коэффициенты приоритета всех пользователей одним запросом
+
+        Обновляются только строки, где сохраненный коэффициент отличается от рассчитанного
+        по активным услугам (например, услуга закончилась, пока бот был остановлен).
+        """
+        try:
+            async with self.acquire() as conn:
+                rows = await conn.fetch("""
+                    WITH computed AS (
+                        SELECT u.telegramid,
+                            ROUND(1.0 + COALESCE(SUM(st.priorityboostvalue - 1.0), 0), 2) AS coefficient
+                        FROM users u
+                        LEFT JOIN purchasedservices ps
+                            ON ps.usertelegramid = u.telegramid
+                            AND ps.paymentstatus = TRUE
+                            AND (ps.serviceenddate IS NULL OR ps.serviceenddate > NOW())
+                        LEFT JOIN servicetypes st ON ps.serviceid = st.serviceid
+                        GROUP BY u.telegramid
+                    )
+                    UPDATE users u
+                    SET profileprioritycoefficient = c.coefficient
+                    FROM computed c
+                    WHERE u.telegramid = c.telegramid
+                    AND u.profileprioritycoefficient IS DISTINCT FROM c.coefficient
+                    RETURNING u.telegramid, u.profileprioritycoefficient
+                """)
+        except Exception as e:
+            logger.error(f"Error refreshing priority coefficients: {e}")
+            logger.exception(e)
+            return 0
+
+        for row in rows:
+            self.ranking_features.set_priority(row['telegramid'], row['profileprioritycoefficient'])
+            self.search_cache.invalidate_user(row['telegramid'])
+        return len(rows)
+
+    async def get_service_expiry_delays(self, user_ids: Optional[List[int]] = None) -> List[asyncpg.Record]:
+        """
+        Сколько секунд (по часам БД) осталось до окончания ближайшей активной услуги
+
+        Возвращает строки usertelegramid, seconds_left для пользователей из user_ids
+        (None - для всех пользователей с активными оплаченными услугами).
+        """
+        async with self.acquire() as conn:
+            return await conn.fetch("""
+                SELECT usertelegramid,
+                    EXTRACT(EPOCH FROM MIN(serviceenddate) - NOW())::float8 AS seconds_left
+                FROM purchasedservices
+                WHERE paymentstatus = TRUE AND serviceenddate > NOW()
+                AND ($1::bigint[] IS NULL OR usertelegramid = ANY($1::bigint[]))
+                GROUP BY usertelegramid
+            """, user_ids)
+
     async def activate_service(self, user_id: int, service_id: int) -> bool:
         """Активирует услугу для пользователя, если она еще не активна"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 # Для бустов (услуги 2 и 3) проверяем наличие любого активного буста
                 if service_id in [2, 3]:
                     existing_boost = await conn.fetchrow(
@@ -1079,13 +1702,14 @@ class Database:
                         return False
 
                 # Добавляем запись о покупке услуги
-                await conn.execute(
+                seconds_left = await conn.fetchval(
                     """
                     INSERT INTO purchasedservices
                     (usertelegramid, serviceid, serviceenddate, paymentstatus, paymentid)
                     VALUES ($1, $2,
                         NOW() + (SELECT serviceduration FROM servicetypes WHERE serviceid = $2),
                         TRUE, $3)
+                    RETURNING EXTRACT(EPOCH FROM serviceenddate - NOW())::float8
                     """,
                     user_id, service_id, user_id
                 )
@@ -1101,8 +1725,9 @@ class Database:
                         user_id
                     )
 
-                # Обновляем коэффициент приоритета
+                # Обновляем коэффициент приоритета и планируем пересчет на окончание услуги
                 await self.update_user_priority(user_id)
+                self.schedule_priority_expiry(user_id, seconds_left)
                 return True
 
         except Exception as e:
@@ -1112,7 +1737,7 @@ class Database:
     async def update_subscription_status(self, user_id: int) -> bool:
         """Обновляет статус подписки пользователя"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 has_subscription = await conn.fetchval(
                     "SELECT EXISTS(SELECT 1 FROM purchasedservices "
                     "WHERE usertelegramid = $1 AND serviceid = 1 "
@@ -1137,7 +1762,7 @@ class Database:
         """Обновляет коэффициенты приоритета для всех пользователей"""
         logger.info("Updating priority coefficients for all users")
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 # Получаем всех пользователей
                 users = await conn.fetch("SELECT telegramid FROM users")
 
@@ -1159,7 +1784,7 @@ class Database:
         """Проверяет принял ли пользователь актуальную политику конфиденциальности"""
         logger.info("Проверка согласия на обработку персональных данных")
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 res = await conn.fetchval("""SELECT EXISTS (SELECT 1
                 FROM consenttopdp
                 WHERE usertelegramid = $1 AND policyversionid = $2 AND consentstatus = true)""", user_id, policyid)
@@ -1174,7 +1799,7 @@ class Database:
         """ Возвращает самую актуальную версию ПК"""
         logger.info('Поиск актуальной версии ПК')
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 vers, text = await conn.fetchrow("""SELECT policyversionid, consenttext
                     FROM privacypolicy
                     ORDER BY effectivedate DESC, policyversionid DESC
@@ -1190,7 +1815,7 @@ class Database:
         """ Возвращает пароль для активации режима админа"""
         logger.info('Получение пароля админа')
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 password = await conn.fetchval("""SELECT password
                     FROM administrators
                     WHERE telegramid = $1;""", user_id)
@@ -1204,7 +1829,7 @@ class Database:
         """ Возвращает все доступные отчеты"""
         logger.info('Запрос доступных отчетов')
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 reports = await conn.fetch("""
                     SELECT reporttypeid, reportsqlquery
                     FROM reports
@@ -1225,7 +1850,7 @@ class Database:
         """
         result = []
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 records = await conn.fetch(query, *args)
                 result = [dict(record) for record in records]
 
@@ -1244,7 +1869,7 @@ class Database:
         """Возвращает словарь {feedbackid: messageid} для необработанных обращений"""
         logger.info('Запрос необработанных обращений')
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 records = await conn.fetch("""
                     SELECT feedbackid, messagetext
                     FROM feedback
@@ -1262,7 +1887,7 @@ class Database:
     async def update_feedback_status(self, feedback_id, category, status, admin_id):
         """Обновляет статус и категорию обращения"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 await conn.execute(
                     """
                     UPDATE feedback
@@ -1283,7 +1908,7 @@ class Database:
         """Возвращает словарь необработанных жалоб"""
         logger.info('Запрос необработанных жалоб')
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 records = await conn.fetch("""
                     SELECT complaintid, reportedusertelegramid, complaintreason
                     FROM complaints
@@ -1307,7 +1932,7 @@ class Database:
     async def update_complaint_status(self, complaint_id, category, status, admin_id, user=None):
         """Обновляет статус и категорию жалобы"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 await conn.execute(
                     """
                     UPDATE complaints
@@ -1325,6 +1950,9 @@ class Database:
                     UPDATE users
                     SET accountstatus = 'blocked'
                     WHERE telegramid = $1""", user)
+                    self.blocked_users.set_blocked(user, True)
+                    self.profile_partitions.remove(user)
+                    self.search_cache.invalidate_user(user)
 
                 logger.info(f"Обновлен статус жалобы ID {complaint_id}")
         except Exception as e:
@@ -1335,7 +1963,7 @@ class Database:
         """Возвращает словарь необработанных верификаций"""
         logger.info('Запрос необработанных верификаций')
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 records = await conn.fetch("""
                     SELECT verificationid, verificationvideofileid, usertelegramid
                     FROM verifications
@@ -1361,7 +1989,7 @@ class Database:
     ):
         """Обновляет статус верификации и причину отказа"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 # Получаем user_id для отправки уведомления
                 user_query = """
                     SELECT usertelegramid
@@ -1387,6 +2015,9 @@ class Database:
                         WHERE telegramid = $1
                     """, user_id)
 
+                if status == 'approve':
+                    self.ranking_features.set_verified(user_id, True)
+                self.search_cache.invalidate_user(user_id)
                 return user_id
         except Exception as e:
             logger.error(f"Ошибка обновления верификации: {e}")
@@ -1397,7 +2028,7 @@ class Database:
         """Возвращает словарь необработанных модераций"""
         logger.info('Запрос необработанных модераций')
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 records = await conn.fetch("""
                     SELECT moderationid, usertelegramid
                     FROM moderations
@@ -1423,7 +2054,7 @@ class Database:
         rejection_reason: str = None
     ):
         """Обновляет статус модерации"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             await conn.execute("""
                 UPDATE moderations
                 SET admintelegramid = $1,
@@ -1443,7 +2074,7 @@ class Database:
         """Сохраняет в БД file_id видео для верификации пользователя"""
         logger.info(f'Сохранение в БД file_id видео для верификации пользователя {user_id}')
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 # Проверяем, есть ли уже запись с отклоненной верификацией
                 check_query = """
                     SELECT EXISTS(
@@ -1483,7 +2114,7 @@ class Database:
         """Проверяет, успешно ли пользователь прошел верификацию и возвращает статус и причину отклонения"""
         logger.info(f'Проверка активной верификации для пользователя {user_id}')
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 # Получаем статус верификации и причину отклонения (если есть)
                 status_query = """
                     SELECT processingstatus, rejectionreason
@@ -1524,11 +2155,21 @@ class Database:
         """Удаляет всю информацию о пользователе"""
         logger.info(f'Удаление данных о пользователе {user_id}')
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 query = """
                     DELETE FROM users WHERE telegramid=$1;
                 """
                 result = await conn.execute(query, user_id)
+                await conn.execute(
+                    "DELETE FROM profile_views WHERE viewer_id = $1 OR viewed_id = $1", user_id
+                )
+                self.blocked_users.set_blocked(user_id, False)
+                self.seen_profiles.forget(user_id)
+                self.answer_index.remove(user_id)
+                self.ranking_features.remove(user_id)
+                self.profile_partitions.remove(user_id)
+                self.schedule_compatibility_refresh(user_id)
+                self.search_cache.invalidate_user(user_id)
                 return bool(result)
 
         except Exception as e:
@@ -1537,36 +2178,77 @@ class Database:
             return False
 
     async def is_user_blocked(self, user_id: int) -> bool:
-        """Проверяет, заблокирован ли пользователь"""
-        async with self.pool.acquire() as conn:
-            query = "SELECT EXISTS(SELECT 1 FROM users WHERE telegramid = $1 and accountstatus='blocked')"
-            return await conn.fetchval(query, user_id)
+        """Проверяет, заблокирован ли пользователь (по набору в памяти, без запроса к БД)"""
+        return user_id in self.blocked_users
 
     async def save_complaint(self, sender: int, reporteduser: int, reason: str):
         """Сохраняет в БД жалобу на анкету пользователя"""
         logger.info(f'Сохранение в БД жалобы от {sender} на {reporteduser} за {reason}')
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 query = "INSERT INTO complaints (sendertelegramid, reportedusertelegramid, complaintreason) VALUES ($1, $2, $3)"
-                return await conn.execute(query, sender, reporteduser, reason)
+                result = await conn.execute(query, sender, reporteduser, reason)
+                self.seen_profiles.mark(sender, reporteduser, 'complaint')
+                return result
         except Exception as e:
             logger.error(f"Ошибка при сохранении жалобы на анкету {reporteduser}")
             logger.exception(e)
             return None
 
     async def update_last_action(self, user: int):
-        """Обновляет временную метку последнего действия пользователя"""
-        async with self.pool.acquire() as conn:
-            query = """UPDATE users
-                    SET lastactiondate = NOW()
-                    WHERE telegramid = $1"""
-            return await conn.execute(query, user)
+        """Отмечает действие пользователя, временная метка записывается в БД пачкой (LastActionBuffer)"""
+        self.last_actions.touch(user)
+
+    async def touch_and_check(self, user_id: int) -> Tuple[bool, Optional[Decimal]]:
+        """
+        Обновляет время последнего действия и коэффициент приоритета и проверяет блокировку одним запросом
+
+        Синхронный вариант пролога middleware для процессов без LastActionBuffer,
+        PriorityScheduler и подписки на blocked_users: один запрос вместо пяти.
+
+        Returns:
+            Tuple[bool, Optional[Decimal]]: заблокирован ли пользователь и его коэффициент
+            приоритета (None - пользователя нет в БД)
+        """
+        async with self.acquire() as conn:
+            row = await conn.fetchrow("""
+                WITH boost AS (
+                    SELECT ROUND(1.0 + COALESCE(SUM(st.priorityboostvalue - 1.0), 0), 2) AS coefficient
+                    FROM purchasedservices ps
+                    JOIN servicetypes st ON ps.serviceid = st.serviceid
+                    WHERE ps.usertelegramid = $1
+                    AND (ps.serviceenddate IS NULL OR ps.serviceenddate > NOW())
+                    AND ps.paymentstatus = TRUE
+                )
+                UPDATE users u
+                SET lastactiondate = NOW(),
+                    profileprioritycoefficient = boost.coefficient
+                FROM boost
+                WHERE u.telegramid = $1
+                RETURNING u.accountstatus = 'blocked' AS is_blocked, u.profileprioritycoefficient
+            """, user_id)
+        if row is None:
+            return False, None
+        blocked = bool(row['is_blocked'])
+        self.blocked_users.set_blocked(user_id, blocked)
+        self.ranking_features.set_priority(user_id, row['profileprioritycoefficient'])
+        return blocked, row['profileprioritycoefficient']
+
+    async def save_last_actions(self, user_ids: List[int], action_dates: List[datetime]):
+        """Записывает время последнего действия для пачки пользователей одним запросом"""
+        async with self.acquire() as conn:
+            await conn.execute("""
+                UPDATE users AS u
+                SET lastactiondate = a.actiondate
+                FROM unnest($1::bigint[], $2::timestamp[]) AS a(telegramid, actiondate)
+                WHERE u.telegramid = a.telegramid
+            """, user_ids, action_dates)
 
     async def get_user_services(self, user_id: int) -> List[Dict]:
         """Получает список активных услуг пользователя"""
         logger.debug(f"Fetching active services for user {user_id}")
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 query = """
                     SELECT
                         ps.recordid,
@@ -1,11 +1,23 @@
 from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+import hashlib
+import hmac
 import os
 import logging
 from typing import Union
+from bot.services.city_validator import city_validator
 
 class CryptoService:
     def __init__(self, secret_key: str):
         self.cipher = Fernet(secret_key.encode())
+        # Отдельный ключ для слепых индексов, чтобы не использовать ключ шифрования напрямую
+        self.blind_index_key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b"beatrice-blind-index"
+        ).derive(secret_key.encode())
 
     def encrypt(self, data: str) -> bytes:
         """Шифрование текстовых данных"""
@@ -29,6 +41,14 @@ class CryptoService:
             logging.error(f"Decryption error: {e}")
             raise
 
+    def blind_index(self, value: str) -> str:
+        """Детерминированный HMAC-SHA256 значения для поиска по зашифрованному полю"""
+        return hmac.new(self.blind_index_key, value.encode(), hashlib.sha256).hexdigest()
+
+    def city_blind_index(self, city: str) -> str:
+        """Слепой индекс нормализованного названия города"""
+        return self.blind_index(city_validator.normalize_name(city))
+
     @staticmethod
     def generate_key() -> str:
         """Генерация нового ключа (для первоначальной настройки)"""
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from bot.services.algorithm_sovmest import CompatibilityService
+from bot.services.database import Database
+from bot.services.encryption import CryptoService
+from bot.services.profile_service import decrypt_city
+from bot.services.search_cache import filters_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Интересы из фильтров поиска: ключ -> (ID вопроса, номер ответа)
+INTERESTS_MAPPING = {
+    "active": {"question": 2, "answer": 1},
+    "travel": {"question": 3, "answer": 1},
+    "sport": {"question": 4, "answer": 1},
+    "animals": {"question": 5, "answer": 1},
+    "art": {"question": 6, "answer": 1},
+    "parties": {"question": 8, "answer": 2},
+    "space": {"question": 9, "answer": 1},
+    "serious": {"question": 1, "answer": 1}
+}
+
+
+def build_search_filters(state_data: dict, crypto: Optional[CryptoService]) -> dict:
+    """Фильтры поиска из данных FSM в виде аргументов CompatibilityService"""
+    filter_interests = [
+        (INTERESTS_MAPPING[interest]["question"], INTERESTS_MAPPING[interest]["answer"])
+        for interest in state_data.get('filter_interests') or []
+        if interest in INTERESTS_MAPPING
+    ]
+    return {
+        'city': decrypt_city(crypto, state_data.get('filter_city')),
+        'age_min': state_data.get('filter_age_min'),
+        'age_max': state_data.get('filter_age_max'),
+        'gender': state_data.get('filter_gender'),
+        'occupation': state_data.get('filter_occupation'),
+        'goals': state_data.get('filter_goals'),
+        'filter_interests': filter_interests
+    }
+
+
+class FeedPrewarmer:
+    """
+    Фоновый расчет ленты поиска до нажатия кнопки «Поиск»
+
+    После прохождения теста и при показе главного меню поиск с текущими фильтрами
+    пользователя ставится в очередь, которую разбирают workers фоновых задач.
+    Результат кладется в SearchCache под тем же хэшем фильтров, что использует
+    обработчик поиска, с временем жизни ttl секунд - это и есть граница устаревания
+    заранее посчитанной ленты; изменения анкет и ответов сбрасывают запись через
+    invalidate_user. Если фильтры изменились, задача пользователя отменяется.
+    Очередь ограничена max_queue пользователями, лишние запросы отбрасываются.
+    """
+
+    def __init__(self, db: Database, crypto: CryptoService, workers: int = 2, ttl: float = 120, max_queue: int = 1000):
+        self.db = db
+        self.crypto = crypto
+        self.workers = workers
+        self.ttl = ttl
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        # Ожидающие расчета: пользователь -> (хэш фильтров, фильтры)
+        self._jobs: Dict[int, Tuple[str, dict]] = {}
+        # Выполняющиеся расчеты: пользователь -> (хэш фильтров, задача)
+        self._running: Dict[int, Tuple[str, asyncio.Task]] = {}
+        self._tasks = []
+        self.completed = 0
+        self.cancelled = 0
+        self.dropped = 0
+
+    def start(self):
+        """Запускает фоновые воркеры"""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+            logger.info(f"Feed prewarmer started with {self.workers} workers")
+
+    async def stop(self):
+        """Останавливает воркеры и отменяет незавершенные расчеты"""
+        for _, task in list(self._running.values()):
+            task.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._jobs.clear()
+        self._running.clear()
+        logger.info(
+            f"Feed prewarmer stopped: completed={self.completed}, "
+            f"cancelled={self.cancelled}, dropped={self.dropped}"
+        )
+
+    def schedule(self, user_id: int, state_data: dict):
+        """Ставит в очередь расчет ленты пользователя с фильтрами из данных FSM"""
+        search_filters = build_search_filters(state_data, self.crypto)
+        fingerprint = filters_fingerprint(**search_filters)
+        if self.db.search_cache.contains(user_id, fingerprint):
+            return
+
+        running = self._running.get(user_id)
+        if running is not None:
+            if running[0] == fingerprint:
+                return
+            self.cancel(user_id)
+
+        queued = user_id in self._jobs
+        self._jobs[user_id] = (fingerprint, search_filters)
+        if queued:
+            # Пользователь уже в очереди, расчет пойдет с новыми фильтрами
+            return
+        try:
+            self._queue.put_nowait(user_id)
+        except asyncio.QueueFull:
+            del self._jobs[user_id]
+            self.dropped += 1
+            logger.debug(f"Feed prewarm queue is full, user {user_id} skipped")
+
+    def cancel(self, user_id: int):
+        """Отменяет ожидающий и выполняющийся расчет ленты пользователя (фильтры изменились)"""
+        if self._jobs.pop(user_id, None) is not None:
+            self.cancelled += 1
+        running = self._running.pop(user_id, None)
+        if running is not None:
+            running[1].cancel()
+            self.cancelled += 1
+
+    async def wait(self, user_id: int, fingerprint: str, timeout: float) -> bool:
+        """
+        Ждет (не дольше timeout секунд) завершения расчета ленты с этими фильтрами
+
+        Returns:
+            bool: True, если расчет завершился и результат лежит в кэше
+        """
+        running = self._running.get(user_id)
+        if running is None or running[0] != fingerprint:
+            return False
+        try:
+            await asyncio.wait_for(asyncio.shield(running[1]), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            return False
+        except Exception:
+            return False
+        return self.db.search_cache.contains(user_id, fingerprint)
+
+    async def _run(self):
+        while True:
+            user_id = await self._queue.get()
+            try:
+                job = self._jobs.pop(user_id, None)
+                if job is None:
+                    # Расчет отменен, пока пользователь стоял в очереди
+                    continue
+                fingerprint, search_filters = job
+                task = asyncio.create_task(self._prewarm(user_id, fingerprint, search_filters))
+                self._running[user_id] = (fingerprint, task)
+                try:
+                    await asyncio.wait({task})
+                finally:
+                    if self._running.get(user_id, (None, None))[1] is task:
+                        del self._running[user_id]
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error(f"Ошибка предварительного расчета ленты для {user_id}: {task.exception()}")
+            finally:
+                self._queue.task_done()
+
+    async def _prewarm(self, user_id: int, fingerprint: str, search_filters: dict):
+        """Считает ленту с фильтрами пользователя и кладет ее в кэш поиска"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        high, low = await CompatibilityService(self.db).find_compatible_users(
+            user_id=user_id,
+            **search_filters,
+            limit=None,
+            min_score=50.0,
+            crypto=self.crypto
+        )
+        results = high + low
+        self.db.search_cache.put(
+            user_id,
+            fingerprint,
+            [result['profile']['telegramid'] for result in results],
+            [result['compatibility'] for result in results],
+            ttl=self.ttl
+        )
+        self.completed += 1
+        logger.debug(f"Feed prewarmed for {user_id}: {len(results)} users in {(loop.time() - started) * 1000:.0f} ms")
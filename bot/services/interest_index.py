@@ -0,0 +1,88 @@
+import logging
+from functools import reduce
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMPTY_IDS = np.zeros(0, dtype=np.int64)
+
+
+class InterestIndex:
+    """
+    Инвертированный индекс ответов: (questionid, answerid) -> отсортированный массив telegram id
+
+    Позволяет применять фильтр сразу по нескольким интересам пересечением
+    и объединением массивов, без JOIN по таблице useranswers.
+    """
+
+    def __init__(self):
+        self._postings: Dict[Tuple[int, int], np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def rebuild(self, answers_by_user: Dict[int, Dict[int, int]]) -> None:
+        """Полностью пересобирает индекс из {telegram id: {questionid: answerid}}"""
+        postings: Dict[Tuple[int, int], list] = {}
+        for user_id, answers in answers_by_user.items():
+            for question_id, answer_id in answers.items():
+                postings.setdefault((question_id, answer_id), []).append(user_id)
+        self._postings = {
+            key: np.unique(np.asarray(user_ids, dtype=np.int64))
+            for key, user_ids in postings.items()
+        }
+
+    def add(self, user_id: int, answers: Dict[int, int]) -> None:
+        """Добавляет ответы пользователя в индекс"""
+        for key in answers.items():
+            ids = self._postings.get(key, EMPTY_IDS)
+            position = np.searchsorted(ids, user_id)
+            if position < len(ids) and ids[position] == user_id:
+                continue
+            self._postings[key] = np.insert(ids, position, user_id)
+
+    def discard(self, user_id: int, answers: Dict[int, int]) -> None:
+        """Удаляет ответы пользователя из индекса"""
+        for key in answers.items():
+            ids = self._postings.get(key)
+            if ids is None:
+                continue
+            position = np.searchsorted(ids, user_id)
+            if position < len(ids) and ids[position] == user_id:
+                ids = np.delete(ids, position)
+                if len(ids):
+                    self._postings[key] = ids
+                else:
+                    del self._postings[key]
+
+    def users_with(self, question_id: int, answer_id: int) -> np.ndarray:
+        """Отсортированный массив пользователей, выбравших ответ answer_id на вопрос question_id"""
+        return self._postings.get((question_id, answer_id), EMPTY_IDS)
+
+    def union(self, pairs: Iterable[Tuple[int, int]]) -> np.ndarray:
+        """Пользователи, выбравшие хотя бы один из ответов"""
+        arrays = [self.users_with(question_id, answer_id) for question_id, answer_id in pairs]
+        if not arrays:
+            return EMPTY_IDS
+        return np.unique(np.concatenate(arrays))
+
+    def intersect(self, arrays: Iterable[np.ndarray]) -> np.ndarray:
+        """Пересечение отсортированных массивов, начиная с самого короткого"""
+        arrays = sorted(arrays, key=len)
+        if not arrays:
+            return EMPTY_IDS
+        return reduce(lambda left, right: np.intersect1d(left, right, assume_unique=True), arrays)
+
+    def match(self, pairs: Iterable[Tuple[int, int]]) -> np.ndarray:
+        """
+        Пользователи, подходящие под все выбранные интересы
+
+        Ответы на один вопрос объединяются (подходит любой из них),
+        разные вопросы пересекаются (нужно совпадение по каждому).
+        """
+        by_question: Dict[int, list] = {}
+        for question_id, answer_id in pairs:
+            by_question.setdefault(question_id, []).append((question_id, answer_id))
+        return self.intersect(self.union(question_pairs) for question_pairs in by_question.values())
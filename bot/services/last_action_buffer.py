@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    from bot.services.database import Database
+
+logger = logging.getLogger(__name__)
+
+# Как часто (в сбросах буфера) писать статистику в лог
+STATS_LOG_INTERVAL = 100
+
+
+class LastActionBuffer:
+    """
+    Отложенная запись users.lastactiondate
+
+    Middleware отмечает действие пользователя в памяти без обращения к БД, повторные
+    отметки одного пользователя схлопываются (остается последняя). Буфер сбрасывается
+    одним UPDATE ... FROM unnest раз в flush_interval секунд или при накоплении
+    batch_size пользователей и при остановке бота.
+    """
+
+    def __init__(self, db: "Database", flush_interval: float = 5.0, batch_size: int = 1000):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: Dict[int, datetime] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.touches = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.last_flush_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        """Запускает фоновый сброс буфера в БД"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info("Last action writer started")
+
+    async def stop(self):
+        """Останавливает фоновый сброс и записывает оставшийся буфер"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        logger.info(f"Last action writer stopped: {self._format_stats()}")
+
+    def touch(self, user_id: int):
+        """Отмечает действие пользователя текущим временем"""
+        self._pending[user_id] = datetime.now()
+        self.touches += 1
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Записывает накопленные отметки в БД одним запросом"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        started = time.perf_counter()
+        try:
+            await self.db.save_last_actions(list(batch.keys()), list(batch.values()))
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.error(f"Ошибка записи времени последнего действия: {e}")
+            logger.exception(e)
+            # Возвращаем строки в буфер, более новые отметки тех же пользователей важнее
+            for user_id, action_date in batch.items():
+                self._pending.setdefault(user_id, action_date)
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.flushed_rows += len(batch)
+        self.last_flush_size = len(batch)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+        logger.debug(f"Last actions: flushed {len(batch)} users in {elapsed_ms:.1f} ms")
+        if self.flushes % STATS_LOG_INTERVAL == 0:
+            logger.info(f"Last actions: {self._format_stats()}")
+
+    def stats(self) -> Dict[str, float]:
+        """Метрики буфера: размер и длительность сбросов, доля схлопнутых отметок"""
+        return {
+            'pending': len(self._pending),
+            'touches': self.touches,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'flushed_rows': self.flushed_rows,
+            'avg_flush_size': self.flushed_rows / self.flushes if self.flushes else 0.0,
+            'last_flush_size': self.last_flush_size,
+            'avg_flush_ms': self._total_flush_ms / self.flushes if self.flushes else 0.0,
+            'last_flush_ms': self.last_flush_ms,
+            'max_flush_ms': self.max_flush_ms,
+            'writes_per_touch': self.flushes / self.touches if self.touches else 0.0
+        }
+
+    def _format_stats(self) -> str:
+        stats = self.stats()
+        return (
+            f"touches={stats['touches']}, flushes={stats['flushes']}, "
+            f"avg_size={stats['avg_flush_size']:.1f}, avg={stats['avg_flush_ms']:.1f} ms, "
+            f"max={stats['max_flush_ms']:.1f} ms"
+        )
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
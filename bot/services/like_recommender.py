@@ -0,0 +1,131 @@
+import logging
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
+
+logger = logging.getLogger(__name__)
+
+
+def like_matrix(senders: Sequence[int], receivers: Sequence[int]) -> Tuple[np.ndarray, sparse.csr_matrix]:
+    """
+    Разреженная матрица лайков пользователь × пользователь
+
+    Returns:
+        Tuple[np.ndarray, sparse.csr_matrix]: отсортированные telegram id участников
+        и матрица, где строка - кто лайкнул, столбец - кого (1 - лайк был)
+    """
+    senders = np.asarray(senders, dtype=np.int64)
+    receivers = np.asarray(receivers, dtype=np.int64)
+    user_ids = np.union1d(senders, receivers)
+    rows = np.searchsorted(user_ids, senders)
+    columns = np.searchsorted(user_ids, receivers)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(len(user_ids), len(user_ids))
+    )
+    # Повторные лайки одной пары считаются одним
+    matrix.data[:] = 1.0
+    return user_ids, matrix
+
+
+def fit_recommendations(
+    matrix: sparse.csr_matrix,
+    n_components: int = 32,
+    top_n: int = 100,
+    seed: int = 42,
+    batch_size: int = 1024
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Раскладывает матрицу лайков усеченным SVD и выбирает top_n рекомендаций для каждой строки
+
+    Оценка пары (u, v) - восстановленное значение матрицы: насколько v похож на тех,
+    кого лайкали пользователи с похожими на u лайками. Уже лайкнутые анкеты
+    и сам пользователь исключаются.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: столбцы рекомендаций (строки × top_n, -1 - нет рекомендации)
+        и их оценки, нормированные на лучшую оценку строки (0..1)
+    """
+    n_users = matrix.shape[0]
+    top_n = min(top_n, max(n_users - 1, 0))
+    recommended = np.full((n_users, top_n), -1, dtype=np.int64)
+    scores = np.zeros((n_users, top_n), dtype=np.float32)
+    n_components = min(n_components, n_users - 1)
+    if top_n == 0 or n_components < 1:
+        return recommended, scores
+
+    svd = TruncatedSVD(n_components=n_components, random_state=seed)
+    user_factors = svd.fit_transform(matrix).astype(np.float32)
+    item_factors = svd.components_.astype(np.float32)
+    logger.info(f"Like matrix SVD: {n_components} components, explained variance {svd.explained_variance_ratio_.sum():.1%}")
+
+    for start in range(0, n_users, batch_size):
+        end = min(start + batch_size, n_users)
+        predicted = user_factors[start:end] @ item_factors
+        # Исключаем уже лайкнутые анкеты и самого пользователя
+        liked = matrix[start:end].nonzero()
+        predicted[liked] = -np.inf
+        predicted[np.arange(end - start), np.arange(start, end)] = -np.inf
+
+        top = np.argpartition(-predicted, top_n - 1, axis=1)[:, :top_n]
+        top_scores = np.take_along_axis(predicted, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        # Значимы только положительные оценки: отрицательные - анкеты, непохожие на лайкнутые
+        useful = top_scores > 0
+        best = np.where(useful[:, :1], top_scores[:, :1], 1.0)
+        recommended[start:end] = np.where(useful, top, -1)
+        scores[start:end] = np.where(useful, top_scores / best, 0.0)
+    return recommended, scores
+
+
+class LikeRecommendations:
+    """
+    Результат офлайн-обучения рекомендаций по графу лайков (bot.jobs.train_like_recommender)
+
+    Для каждого пользователя хранит до top_n рекомендованных telegram id с оценкой 0..1.
+    Поиск читает только эти массивы и подмешивает оценку к совместимости при сортировке.
+    """
+
+    def __init__(self, user_ids: np.ndarray, recommended_ids: np.ndarray, scores: np.ndarray):
+        # Строки по возрастанию telegram id пользователя, внутри строки - по возрастанию рекомендованного id
+        order = np.argsort(user_ids)
+        self._user_ids = np.asarray(user_ids, dtype=np.int64)[order]
+        recommended_ids = np.asarray(recommended_ids, dtype=np.int64)[order]
+        scores = np.asarray(scores, dtype=np.float32)[order]
+        row_order = np.argsort(recommended_ids, axis=1, kind='stable')
+        self._recommended = np.take_along_axis(recommended_ids, row_order, axis=1)
+        self._scores = np.take_along_axis(scores, row_order, axis=1)
+
+    def __len__(self) -> int:
+        return len(self._user_ids)
+
+    def _row(self, user_id: int) -> Optional[int]:
+        position = int(np.searchsorted(self._user_ids, user_id))
+        if position < len(self._user_ids) and self._user_ids[position] == user_id:
+            return position
+        return None
+
+    def recommended(self, user_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Рекомендованные telegram id пользователя и их оценки"""
+        row = self._row(user_id)
+        if row is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        known = self._recommended[row] >= 0
+        return self._recommended[row][known], self._scores[row][known]
+
+    def scores_for(self, user_id: int, candidate_ids: np.ndarray) -> np.ndarray:
+        """Оценка рекомендации для каждого кандидата (0 - кандидата нет в рекомендациях)"""
+        result = np.zeros(len(candidate_ids), dtype=np.float32)
+        row = self._row(user_id)
+        if row is None or not self._recommended.shape[1]:
+            return result
+        recommended = self._recommended[row]
+        positions = np.minimum(np.searchsorted(recommended, candidate_ids), len(recommended) - 1)
+        found = recommended[positions] == candidate_ids
+        result[found] = self._scores[row][positions[found]]
+        return result
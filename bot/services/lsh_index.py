@@ -0,0 +1,123 @@
+import logging
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from bot.services.scoring import NO_ANSWER
+
+logger = logging.getLogger(__name__)
+
+# Модуль универсального хэширования (простое число Мерсенна 2^31 - 1)
+MERSENNE_PRIME = (1 << 31) - 1
+# Токен ответа: questionid * TOKEN_BASE + номер ответа
+TOKEN_BASE = 1 << 16
+# Множитель для свертки значений MinHash внутри полосы в один ключ
+BAND_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+EMPTY_IDS = np.zeros(0, dtype=np.int64)
+EMPTY_KEYS = np.zeros(0, dtype=np.uint64)
+
+
+class MinHashLSH:
+    """
+    LSH-индекс по ответам на тест: MinHash над токенами (вопрос, номер ответа) с разбиением на полосы
+
+    Подпись пользователя - bands * rows значений MinHash. Каждая полоса из rows значений
+    сворачивается в ключ; пользователи с общим ключом хотя бы в одной полосе попадают
+    в кандидаты. Для каждой полосы хранится отсортированный массив ключей и telegram id
+    в том же порядке, корзина ищется через searchsorted.
+
+    Вероятность найти пользователя с долей общих ответов (Жаккар) s равна
+    1 - (1 - s^rows)^bands; при поиске можно опрашивать только часть полос (probe_bands),
+    уменьшая полноту ради скорости без перестроения индекса.
+    """
+
+    def __init__(self, bands: int = 32, rows: int = 4, seed: int = 42):
+        self.bands = bands
+        self.rows = rows
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MERSENNE_PRIME, size=bands * rows, dtype=np.int64)
+        self._b = rng.integers(0, MERSENNE_PRIME, size=bands * rows, dtype=np.int64)
+        self._keys: List[np.ndarray] = [EMPTY_KEYS] * bands
+        self._ids: List[np.ndarray] = [EMPTY_IDS] * bands
+
+    def __len__(self) -> int:
+        return len(self._ids[0]) if self.bands else 0
+
+    def rebuild(self, user_ids: np.ndarray, answer_matrix: np.ndarray, question_ids: Sequence[int]) -> None:
+        """Полностью пересобирает индекс по матрице ответов (строки в порядке user_ids)"""
+        question_tokens = np.asarray(question_ids, dtype=np.int64) * TOKEN_BASE
+        tokens = np.where(answer_matrix == NO_ANSWER, -1, answer_matrix.astype(np.int64) + question_tokens)
+        keys = self._band_keys(tokens)
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        for band in range(self.bands):
+            order = np.argsort(keys[:, band], kind='stable')
+            self._keys[band] = keys[order, band]
+            self._ids[band] = user_ids[order]
+        logger.info(f"LSH index built: {len(user_ids)} users, {self.bands} bands x {self.rows} rows")
+
+    def add(self, user_id: int, answers: Dict[int, int]) -> None:
+        """Добавляет пользователя в корзины по его ответам"""
+        for band, key in enumerate(self._user_keys(answers).tolist()):
+            position = np.searchsorted(self._keys[band], np.uint64(key), side='right')
+            self._keys[band] = np.insert(self._keys[band], position, np.uint64(key))
+            self._ids[band] = np.insert(self._ids[band], position, user_id)
+
+    def discard(self, user_id: int, answers: Dict[int, int]) -> None:
+        """Удаляет пользователя из корзин, в которые он попал с ответами answers"""
+        for band, key in enumerate(self._user_keys(answers).tolist()):
+            start, end = self._bucket(band, key)
+            matches = np.flatnonzero(self._ids[band][start:end] == user_id)
+            if len(matches):
+                position = start + matches[0]
+                self._keys[band] = np.delete(self._keys[band], position)
+                self._ids[band] = np.delete(self._ids[band], position)
+
+    def candidates(self, answers: Dict[int, int], probe_bands: Optional[int] = None) -> np.ndarray:
+        """
+        Отсортированный массив пользователей, разделяющих с ответами answers хотя бы одну корзину
+
+        Args:
+            answers: Ответы ищущего {questionid: номер ответа}
+            probe_bands: Сколько полос опрашивать (None или 0 - все), регулирует полноту
+        """
+        probe_bands = min(probe_bands or self.bands, self.bands)
+        buckets = []
+        for band, key in enumerate(self._user_keys(answers)[:probe_bands].tolist()):
+            start, end = self._bucket(band, key)
+            buckets.append(self._ids[band][start:end])
+        if not buckets:
+            return EMPTY_IDS
+        return np.unique(np.concatenate(buckets))
+
+    def memory_usage(self) -> int:
+        """Оценка занимаемой индексом памяти в байтах"""
+        return sum(keys.nbytes + ids.nbytes for keys, ids in zip(self._keys, self._ids))
+
+    def _bucket(self, band: int, key: int):
+        keys = self._keys[band]
+        key = np.uint64(key)
+        return np.searchsorted(keys, key, side='left'), np.searchsorted(keys, key, side='right')
+
+    def _user_keys(self, answers: Dict[int, int]) -> np.ndarray:
+        tokens = np.fromiter(
+            (question_id * TOKEN_BASE + answer_id for question_id, answer_id in answers.items()),
+            dtype=np.int64, count=len(answers)
+        )
+        return self._band_keys(tokens[np.newaxis, :])[0]
+
+    def _band_keys(self, tokens: np.ndarray) -> np.ndarray:
+        """Ключи полос для строк матрицы токенов (-1 - нет ответа), форма (пользователи, bands)"""
+        missing = tokens < 0
+        signature = np.empty((tokens.shape[0], self.bands * self.rows), dtype=np.uint64)
+        # По одной хэш-функции за проход: память O(пользователи x вопросы)
+        for column, (a, b) in enumerate(zip(self._a.tolist(), self._b.tolist())):
+            hashed = (tokens * a + b) % MERSENNE_PRIME
+            hashed[missing] = MERSENNE_PRIME
+            signature[:, column] = hashed.min(axis=1) if tokens.shape[1] else MERSENNE_PRIME
+
+        signature = signature.reshape(tokens.shape[0], self.bands, self.rows)
+        keys = signature[:, :, 0].copy()
+        for row in range(1, self.rows):
+            keys = keys * BAND_MULTIPLIER + signature[:, :, row]
+        return keys
@@ -0,0 +1,116 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from bot.services.database import Database
+
+logger = logging.getLogger(__name__)
+
+# Запас после окончания услуги, чтобы пересчет не опередил NOW() в БД
+EXPIRY_GRACE = 1.0
+# Через сколько секунд повторить пересчет, если не удалось узнать оставшиеся услуги
+RETRY_DELAY = 60.0
+
+
+class PriorityScheduler:
+    """
+    Пересчет коэффициента приоритета по событиям вместо каждого входящего апдейта
+
+    Коэффициент меняется только при покупке услуги (activate_service пересчитывает его
+    сразу) и при окончании услуги. Сколько секунд осталось до serviceenddate, считает
+    БД (serviceenddate - NOW()), поэтому расхождение часов хоста и БД не влияет
+    на срабатывание. Моменты срабатывания лежат в куче по монотонным часам процесса,
+    фоновая задача спит до ближайшего (не дольше max_sleep секунд) и пересчитывает
+    приоритет пользователей, чьи услуги закончились. Пользователи, у которых
+    после пересчета остались активные услуги, планируются снова.
+    При запуске исправляются коэффициенты услуг, закончившихся, пока бот был остановлен.
+    """
+
+    def __init__(self, db: "Database", max_sleep: float = 3600):
+        self.db = db
+        self.max_sleep = max_sleep
+        self._heap: List[Tuple[float, int]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    async def start(self):
+        """Исправляет устаревшие коэффициенты, загружает окончания услуг и запускает таймер"""
+        if self._task is not None:
+            return
+        fixed = await self.db.refresh_stale_priorities()
+        for row in await self.db.get_service_expiry_delays():
+            self.schedule(row['usertelegramid'], row['seconds_left'])
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Priority scheduler started: {len(self._heap)} users with active services, {fixed} coefficients fixed")
+
+    async def stop(self):
+        """Останавливает таймер"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info(f"Priority scheduler stopped, {self.expired} services expired")
+
+    def schedule(self, user_id: int, seconds_left: Optional[float]):
+        """Планирует пересчет приоритета пользователя через seconds_left секунд (по часам БД)"""
+        if seconds_left is None:
+            return
+        due = time.monotonic() + max(float(seconds_left), 0.0) + EXPIRY_GRACE
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (due, user_id))
+        if self._wakeup is not None and (earliest is None or due < earliest):
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            timeout = self.max_sleep
+            if self._heap:
+                timeout = min(timeout, max(self._heap[0][0] - time.monotonic(), 0))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            due = set()
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                due.add(heapq.heappop(self._heap)[1])
+            if not due:
+                continue
+
+            for user_id in due:
+                try:
+                    await self.db.update_user_priority(user_id)
+                    self.db.search_cache.invalidate_user(user_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Ошибка пересчета приоритета для {user_id}: {e}")
+                    logger.exception(e)
+            # У пользователя могли остаться другие услуги (или эта еще не закончилась по часам БД)
+            try:
+                for row in await self.db.get_service_expiry_delays(list(due)):
+                    self.schedule(row['usertelegramid'], row['seconds_left'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка планирования окончания услуг: {e}")
+                logger.exception(e)
+                # Повторяем пересчет позже, чтобы не потерять оставшиеся услуги
+                for user_id in due:
+                    self.schedule(user_id, RETRY_DELAY)
+            self.expired += len(due)
+            logger.info(f"Services expired: priority recalculated for {len(due)} users")
@@ -0,0 +1,151 @@
+import logging
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Возраст анкет без возраста: меньше любого допустимого, в фильтр по возрасту не попадает
+MISSING_AGE = -1
+
+# Ключ города, объединяющий все города пола (поиск без фильтра по городу)
+ALL_CITIES = '*'
+
+
+class _Partition:
+    """Telegram id анкет одной части индекса, отсортированные по возрасту"""
+
+    __slots__ = ('ages', 'ids')
+
+    def __init__(self, ages: np.ndarray = None, ids: np.ndarray = None):
+        self.ages = ages if ages is not None else np.zeros(0, dtype=np.int16)
+        self.ids = ids if ids is not None else np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, user_id: int, age: int):
+        position = int(np.searchsorted(self.ages, age, side='right'))
+        self.ages = np.insert(self.ages, position, age)
+        self.ids = np.insert(self.ids, position, user_id)
+
+    def discard(self, user_id: int, age: int):
+        start = int(np.searchsorted(self.ages, age, side='left'))
+        end = int(np.searchsorted(self.ages, age, side='right'))
+        matches = np.flatnonzero(self.ids[start:end] == user_id)
+        if len(matches):
+            position = start + int(matches[0])
+            self.ages = np.delete(self.ages, position)
+            self.ids = np.delete(self.ids, position)
+
+    def between(self, age_min: Optional[int], age_max: Optional[int]) -> np.ndarray:
+        if age_min is None or age_max is None:
+            return self.ids
+        start = np.searchsorted(self.ages, age_min, side='left')
+        end = np.searchsorted(self.ages, age_max, side='right')
+        return self.ids[start:end]
+
+
+class ProfilePartitions:
+    """
+    Индекс незаблокированных анкет для фильтров поиска по полу, городу и возрасту
+
+    Анкеты разбиты на части по (пол, слепой индекс города), внутри части telegram id
+    отсортированы по возрасту, поэтому диапазон возрастов находится двумя бинарными
+    поисками. Для поиска без города у каждого пола есть часть ALL_CITIES со всеми
+    анкетами. Анкеты без слепого индекса города (до бэкфилла) лежат в части с ключом
+    None и попадают в выборку по любому городу - город у них проверяется дешифрованием.
+    Индекс обновляется при сохранении и изменении анкеты, удалении и блокировке.
+    """
+
+    def __init__(self):
+        # telegram id -> (пол, ключ города, возраст)
+        self._profiles: Dict[int, Tuple[str, Optional[str], int]] = {}
+        self._partitions: Dict[Tuple[str, Optional[str]], _Partition] = {}
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._profiles
+
+    def rebuild(self, records: Iterable) -> None:
+        """Пересобирает индекс из записей (telegramid, gender, age, cityblindindex)"""
+        grouped: Dict[Tuple[str, Optional[str]], list] = {}
+        self._profiles = {}
+        for record in records:
+            profile = self._profile(record['gender'], record['cityblindindex'], record['age'])
+            self._profiles[record['telegramid']] = profile
+            gender, city_key, age = profile
+            grouped.setdefault((gender, city_key), []).append((age, record['telegramid']))
+            grouped.setdefault((gender, ALL_CITIES), []).append((age, record['telegramid']))
+
+        self._partitions = {}
+        for key, members in grouped.items():
+            ages = np.fromiter((age for age, _ in members), dtype=np.int16, count=len(members))
+            ids = np.fromiter((user_id for _, user_id in members), dtype=np.int64, count=len(members))
+            order = np.argsort(ages, kind='stable')
+            self._partitions[key] = _Partition(ages[order], ids[order])
+
+        logger.info(
+            f"Profile partitions loaded: {len(self._profiles)} users, "
+            f"{sum(1 for _, city_key in self._partitions if city_key != ALL_CITIES)} partitions"
+        )
+
+    def upsert(self, user_id: int, gender: str, city_key: Optional[str], age: Optional[int]) -> None:
+        """Добавляет анкету или переносит ее в нужную часть после изменения пола, города или возраста"""
+        profile = self._profile(gender, city_key, age)
+        if self._profiles.get(user_id) == profile:
+            return
+        self.remove(user_id)
+        self._profiles[user_id] = profile
+        gender, city_key, age = profile
+        for key in ((gender, city_key), (gender, ALL_CITIES)):
+            self._partitions.setdefault(key, _Partition()).add(user_id, age)
+
+    def remove(self, user_id: int) -> None:
+        """Удаляет анкету из индекса (удаление или блокировка)"""
+        profile = self._profiles.pop(user_id, None)
+        if profile is None:
+            return
+        gender, city_key, age = profile
+        for key in ((gender, city_key), (gender, ALL_CITIES)):
+            partition = self._partitions.get(key)
+            if partition is not None:
+                partition.discard(user_id, age)
+                if not len(partition):
+                    del self._partitions[key]
+
+    def select(
+        self,
+        genders: Optional[Set[str]],
+        city_key: Optional[str],
+        age_min: Optional[int] = None,
+        age_max: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Отсортированный массив telegram id анкет под фильтры
+
+        Args:
+            genders: Допустимые значения пола (None - любой)
+            city_key: Слепой индекс города (None - любой город)
+            age_min: Минимальный возраст (фильтр применяется, только если заданы обе границы)
+            age_max: Максимальный возраст
+        """
+        if genders is None:
+            genders = {gender for gender, _ in self._partitions}
+        city_keys = (ALL_CITIES,) if city_key is None else (city_key, None)
+
+        parts = []
+        for gender in genders:
+            for key in city_keys:
+                partition = self._partitions.get((gender, key))
+                if partition is not None:
+                    parts.append(partition.between(age_min, age_max))
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+    @staticmethod
+    def _profile(gender, city_key, age) -> Tuple[str, Optional[str], int]:
+        return str(gender) if gender is not None else None, city_key or None, MISSING_AGE if age is None else int(age)
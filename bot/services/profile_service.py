@@ -3,6 +3,7 @@ from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from bot.services.database import Database
 from bot.services.utils import format_profile_text
+from bot.services.search_feed import SearchFeed
 from bot.keyboards.menus import compatible_navigation_keyboard, back_to_menu_button, create_like_keyboard
 import logging
 
@@ -207,7 +208,8 @@ async def show_compatible_user(message: Message, state: FSMContext, db: Database
         # Получаем данные из состояния
         state_data = await state.get_data()
         current_index = state_data.get("current_compatible_index", 0)
-        compatible_users = state_data.get("compatible_users", [])
+        feed = SearchFeed(state, db)
+        feed_length = await feed.length()
         last_messages = state_data.get("last_profile_messages", [])
         
         # Очищаем предыдущие сообщения
@@ -217,8 +219,20 @@ async def show_compatible_user(message: Message, state: FSMContext, db: Database
             except Exception as e:
                 logger.error(f"Ошибка удаления сообщения {msg_id}: {e}")
         
+        # Корректируем индекс при выходе за границы
+        if current_index >= feed_length:
+            current_index = 0
+        elif current_index < 0:
+            current_index = feed_length - 1
+        
+        # Получаем текущую анкету, пропуская удаленные после поиска
+        current_user = await feed.get(current_index)
+        while current_user is None and current_index < feed_length - 1:
+            current_index += 1
+            current_user = await feed.get(current_index)
+        
         # Если список анкет пуст
-        if not compatible_users:
+        if current_user is None:
             no_profiles_msg = await message.answer(
                 "😔 Совместимых пользователей не найдено.\n"
                 "Попробуйте изменить фильтры или проверьте позже.",
@@ -227,22 +241,9 @@ async def show_compatible_user(message: Message, state: FSMContext, db: Database
             await state.update_data(last_profile_messages=[no_profiles_msg.message_id])
             return
         
-        # Корректируем индекс при выходе за границы
-        if current_index >= len(compatible_users):
-            current_index = 0
-        elif current_index < 0:
-            current_index = len(compatible_users) - 1
-        
-        # Получаем текущую анкету
-        current_user = compatible_users[current_index]
         user_profile = current_user['profile']
         compatibility = current_user['compatibility']
         
-        # Проверяем верификацию пользователя
-        user_id = user_profile['telegramid']
-        is_verified, _, _ = await db.check_verify(user_id)
-        user_profile['is_verified'] = is_verified
-        
         # Дешифруем город в профиле, если он зашифрован
         if 'location' in user_profile:
             user_profile['city'] = decrypt_city(crypto, user_profile['location'])
@@ -251,7 +252,7 @@ async def show_compatible_user(message: Message, state: FSMContext, db: Database
         keyboard = compatible_navigation_keyboard(
             user_id=user_profile['telegramid'],
             is_first=current_index == 0,
-            is_last=current_index == len(compatible_users) - 1,
+            is_last=current_index == feed_length - 1,
             is_initial=False  # Всегда передаем False
         )
         
@@ -0,0 +1,136 @@
+import sys
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Коэффициент приоритета анкет без значения в users: такие анкеты идут в конце своей группы
+MISSING_PRIORITY = float('-inf')
+
+
+def rank_order(verified: np.ndarray, priority: np.ndarray, scores: np.ndarray) -> np.ndarray:
+    """
+    Порядок выдачи: верифицированные, затем по коэффициенту приоритета, затем по совместимости
+
+    Совместимость сравнивается с точностью до 0.1, как она показывается в ленте.
+    Сортировка устойчивая: при равных ключах сохраняется исходный порядок кандидатов.
+    """
+    return np.lexsort((-np.round(scores, 1), -priority, -verified.astype(np.int8)))
+
+
+def tier_stages(verified: np.ndarray, priority: np.ndarray, first_chunk_size: Optional[int]) -> List[np.ndarray]:
+    """
+    Делит позиции кандидатов на части по группам (верификация, коэффициент приоритета)
+
+    Первая часть - верхние группы, в которых набирается first_chunk_size кандидатов,
+    вторая - все остальные. Без first_chunk_size возвращается одна часть.
+    """
+    order = np.lexsort((-priority, -verified.astype(np.int8)))
+    if not first_chunk_size or len(order) <= first_chunk_size:
+        return [order]
+
+    sorted_verified = verified[order]
+    sorted_priority = priority[order]
+    changes = (sorted_verified[1:] != sorted_verified[:-1]) | (sorted_priority[1:] != sorted_priority[:-1])
+    tier_ends = np.append(np.flatnonzero(changes) + 1, len(order))
+    cut = int(tier_ends[np.searchsorted(tier_ends, first_chunk_size)])
+    if cut == len(order):
+        return [order]
+    return [order[:cut], order[cut:]]
+
+
+class RankingFeatures:
+    """
+    Признаки ранжирования выдачи в памяти процесса: верификация и коэффициент приоритета
+
+    Загружается один раз из users и verifications и обновляется вместе с ними
+    (update_user_priority, update_verification, del_user), поэтому при сортировке
+    кандидатов поиск не обращается к таблице verifications.
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._rows: Dict[int, int] = {}
+        self._free_rows: List[int] = []
+        self._verified = np.zeros(initial_capacity, dtype=bool)
+        self._priority = np.full(initial_capacity, MISSING_PRIORITY, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def rebuild(self, records: Iterable) -> None:
+        """Пересобирает признаки из записей (telegramid, profileprioritycoefficient, is_verified)"""
+        records = list(records)
+        capacity = max(len(records), 1)
+        self._rows = {}
+        self._free_rows = []
+        self._verified = np.zeros(capacity, dtype=bool)
+        self._priority = np.full(capacity, MISSING_PRIORITY, dtype=np.float64)
+        for row, record in enumerate(records):
+            self._rows[record['telegramid']] = row
+            self._verified[row] = bool(record['is_verified'])
+            if record['profileprioritycoefficient'] is not None:
+                self._priority[row] = float(record['profileprioritycoefficient'])
+        logger.info(
+            f"Ranking features loaded: {len(self._rows)} users, "
+            f"{int(self._verified[:len(records)].sum())} verified"
+        )
+
+    def set_priority(self, user_id: int, priority: Optional[float]) -> None:
+        """Обновляет коэффициент приоритета пользователя"""
+        row = self._row(user_id)
+        self._priority[row] = MISSING_PRIORITY if priority is None else float(priority)
+
+    def set_verified(self, user_id: int, verified: bool) -> None:
+        """Обновляет статус верификации пользователя"""
+        row = self._row(user_id)
+        self._verified[row] = verified
+
+    def remove(self, user_id: int) -> None:
+        """Удаляет пользователя, освобождая строку для повторного использования"""
+        row = self._rows.pop(user_id, None)
+        if row is None:
+            return
+        self._verified[row] = False
+        self._priority[row] = MISSING_PRIORITY
+        self._free_rows.append(row)
+
+    def lookup(self, user_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Признаки пользователей в порядке user_ids
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: верификация и коэффициент приоритета
+            (MISSING_PRIORITY для неизвестных пользователей и пустых значений)
+        """
+        rows = np.fromiter((self._rows.get(user_id, -1) for user_id in user_ids.tolist()), dtype=np.int64, count=len(user_ids))
+        known = rows >= 0
+        verified = np.zeros(len(rows), dtype=bool)
+        priority = np.full(len(rows), MISSING_PRIORITY, dtype=np.float64)
+        verified[known] = self._verified[rows[known]]
+        priority[known] = self._priority[rows[known]]
+        return verified, priority
+
+    def memory_usage(self) -> int:
+        """Оценка занимаемой памяти в байтах"""
+        return self._verified.nbytes + self._priority.nbytes + sys.getsizeof(self._rows) + sys.getsizeof(self._free_rows)
+
+    def _row(self, user_id: int) -> int:
+        row = self._rows.get(user_id)
+        if row is not None:
+            return row
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = len(self._rows)
+            if row >= len(self._verified):
+                # Увеличиваем емкость в два раза, чтобы вставки были амортизированно O(1)
+                capacity = max(len(self._verified) * 2, 1)
+                verified = np.zeros(capacity, dtype=bool)
+                verified[:len(self._verified)] = self._verified
+                priority = np.full(capacity, MISSING_PRIORITY, dtype=np.float64)
+                priority[:len(self._priority)] = self._priority
+                self._verified, self._priority = verified, priority
+        self._rows[user_id] = row
+        return row
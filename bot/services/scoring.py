@@ -0,0 +1,122 @@
+import logging
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Баллы за совпадение ответа и за соседний вариант ответа
+EXACT_MATCH_SCORE = 3
+ADJACENT_MATCH_SCORE = 1
+
+# Значение ячейки матрицы, если пользователь не ответил на вопрос
+NO_ANSWER = 0
+
+
+def answer_dtype(max_answer_id: int) -> np.dtype:
+    """Подбирает минимальный целочисленный тип для хранения номеров ответов"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if max_answer_id <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def build_answer_vector(answers: Dict[int, int], question_ids: Sequence[int]) -> np.ndarray:
+    """Преобразует словарь ответов {questionid: номер ответа} в вектор по порядку question_ids"""
+    max_answer_id = max(answers.values(), default=NO_ANSWER)
+    vector = np.full(len(question_ids), NO_ANSWER, dtype=answer_dtype(max_answer_id))
+    for column, question_id in enumerate(question_ids):
+        answer_id = answers.get(question_id)
+        if answer_id is not None:
+            vector[column] = answer_id
+    return vector
+
+
+def build_answer_matrix(answers_list: Sequence[Dict[int, int]], question_ids: Sequence[int]) -> np.ndarray:
+    """Собирает матрицу ответов (пользователи × вопросы), NO_ANSWER - нет ответа"""
+    max_answer_id = max(
+        (max(answers.values(), default=NO_ANSWER) for answers in answers_list),
+        default=NO_ANSWER
+    )
+    matrix = np.full((len(answers_list), len(question_ids)), NO_ANSWER, dtype=answer_dtype(max_answer_id))
+    columns = {question_id: column for column, question_id in enumerate(question_ids)}
+    for row, answers in enumerate(answers_list):
+        for question_id, answer_id in answers.items():
+            column = columns.get(question_id)
+            if column is not None:
+                matrix[row, column] = answer_id
+    return matrix
+
+
+def match_points(user_vector: np.ndarray, candidate_matrix: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Сумма баллов за совпадения ответов пользователя с каждым кандидатом (симметрична без весов)
+
+    weights - веса вопросов, совместимые по форме с candidate_matrix (Q или N × Q);
+    без весов баллы считаются в целых числах.
+    """
+    # Разница считается в int32, чтобы не переполнить компактный тип матрицы
+    diff = np.abs(candidate_matrix.astype(np.int32) - user_vector.astype(np.int32))
+    answered = (candidate_matrix != NO_ANSWER) & (user_vector != NO_ANSWER)
+
+    if weights is None:
+        return (
+            ((diff == 0) & answered).sum(axis=1, dtype=np.int32) * EXACT_MATCH_SCORE
+            + ((diff == 1) & answered).sum(axis=1, dtype=np.int32) * ADJACENT_MATCH_SCORE
+        )
+
+    points = (
+        ((diff == 0) & answered) * EXACT_MATCH_SCORE
+        + ((diff == 1) & answered) * ADJACENT_MATCH_SCORE
+    )
+    return (points * weights).sum(axis=1)
+
+
+def score_candidates(user_vector: np.ndarray, candidate_matrix: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Вычисляет процент совместимости пользователя со всеми кандидатами за один проход
+
+    Совпадение ответа дает EXACT_MATCH_SCORE баллов, соседний вариант ответа -
+    ADJACENT_MATCH_SCORE. Векторы содержат номера ответов внутри вопроса (AnswerOrdinals),
+    поэтому соседство - это разница номеров, равная 1. Максимум считается по вопросам, на которые ответил пользователь.
+
+    Args:
+        user_vector: Вектор ответов пользователя длины Q
+        candidate_matrix: Матрица ответов кандидатов размера N × Q
+        weights: Веса ответов пользователя по вопросам длины Q (None - все веса 1)
+
+    Returns:
+        np.ndarray: Массив из N процентов совместимости (float64)
+    """
+    answered = user_vector != NO_ANSWER
+    if weights is None:
+        max_score = int(answered.sum()) * EXACT_MATCH_SCORE
+    else:
+        max_score = float(weights[answered].sum()) * EXACT_MATCH_SCORE
+    if max_score == 0 or candidate_matrix.shape[0] == 0:
+        return np.zeros(candidate_matrix.shape[0], dtype=np.float64)
+
+    return (match_points(user_vector, candidate_matrix, weights) / max_score) * 100
+
+
+def score_candidates_reverse(user_vector: np.ndarray, candidate_matrix: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Вычисляет совместимость с пользователем с точки зрения каждого кандидата
+
+    Баллы те же, что в score_candidates, но максимум считается по вопросам,
+    на которые ответил кандидат, а веса (N × Q) - веса ответов кандидатов.
+    Кандидаты без ответов получают 0.
+    """
+    if candidate_matrix.shape[0] == 0:
+        return np.zeros(0, dtype=np.float64)
+
+    answered = candidate_matrix != NO_ANSWER
+    if weights is None:
+        max_scores = answered.sum(axis=1, dtype=np.int32) * EXACT_MATCH_SCORE
+    else:
+        max_scores = (weights * answered).sum(axis=1) * EXACT_MATCH_SCORE
+
+    points = match_points(user_vector, candidate_matrix, weights)
+    scores = np.zeros(candidate_matrix.shape[0], dtype=np.float64)
+    np.divide(points, max_scores, out=scores, where=max_scores > 0)
+    return scores * 100
@@ -0,0 +1,139 @@
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from bot.services.answer_index import AnswerIndex
+from bot.services.scoring import (
+    NO_ANSWER, build_answer_vector, score_candidates, score_candidates_reverse
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ScoringEngine:
+    """
+    Единая точка подсчета совместимости для всех путей поиска
+
+    Поиск (CompatibilityService), Database.get_compatible_users и фоновый пересчет
+    compatibility_scores считают совместимость только через этот класс:
+        score(user_vector, candidate_matrix)          - с точки зрения пользователя
+        score_reverse(user_vector, candidate_matrix)  - с точки зрения кандидатов
+        await score_rows_async(user_vector, rows)     - то же, что score, по строкам индекса ответов,
+                                                        крупные пачки в пуле процессов
+        score_users(user_id, candidate_ids)           - пакетно по telegram id из индекса ответов
+        score_answers(user_answers, candidate_answers) - одна пара по словарям {questionid: answerid}
+
+    Веса ответов (answers.answerweight, NULL - 1.0) загружаются один раз через load_weights;
+    пока все веса равны 1, подсчет идет по целочисленной ветке без весов.
+    Пул процессов (ScoringPool) подключается атрибутом pool при запуске бота.
+    """
+
+    def __init__(self, answer_index: AnswerIndex, pool=None):
+        self.answer_index = answer_index
+        self.pool = pool
+        # Веса, отличные от 1.0: answerid -> вес
+        self._weights: Dict[int, float] = {}
+        # Таблица весов (вопрос × номер ответа) для текущего порядка вопросов индекса
+        self._weight_table: Optional[np.ndarray] = None
+        self._weight_table_questions: Tuple[int, ...] = ()
+
+    @property
+    def weighted(self) -> bool:
+        return bool(self._weights)
+
+    def load_weights(self, records: Iterable) -> None:
+        """Загружает веса из записей (answerid, answerweight)"""
+        self._weights = {
+            record['answerid']: float(record['answerweight'])
+            for record in records
+            if record['answerweight'] is not None and float(record['answerweight']) != 1.0
+        }
+        self._weight_table = None
+        self._weight_table_questions = ()
+        logger.info(f"Answer weights loaded: {len(self._weights)} non-default weights")
+
+    def user_weights(self, user_vector: np.ndarray) -> Optional[np.ndarray]:
+        """Веса ответов пользователя по вопросам (None - все веса 1)"""
+        table = self._table()
+        if table is None:
+            return None
+        return table[np.arange(len(user_vector)), user_vector.astype(np.intp)]
+
+    def candidate_weights(self, candidate_matrix: np.ndarray) -> Optional[np.ndarray]:
+        """Веса ответов кандидатов (N × Q, None - все веса 1)"""
+        table = self._table()
+        if table is None:
+            return None
+        return table[np.arange(candidate_matrix.shape[1]), candidate_matrix.astype(np.intp)]
+
+    def score(self, user_vector: np.ndarray, candidate_matrix: np.ndarray) -> np.ndarray:
+        """Процент совместимости пользователя с каждым кандидатом"""
+        return score_candidates(user_vector, candidate_matrix, self.user_weights(user_vector))
+
+    def score_reverse(self, user_vector: np.ndarray, candidate_matrix: np.ndarray) -> np.ndarray:
+        """Процент совместимости с пользователем с точки зрения каждого кандидата"""
+        return score_candidates_reverse(user_vector, candidate_matrix, self.candidate_weights(candidate_matrix))
+
+    async def score_rows_async(self, user_vector: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """
+        Совместимость с кандидатами по номерам строк индекса ответов (AnswerIndex.rows_for)
+
+        Пачки от pool.threshold кандидатов считаются в пуле процессов, не блокируя
+        цикл событий: воркеры читают матрицу индекса из разделяемой памяти.
+        """
+        weights = self.user_weights(user_vector)
+        if self.pool is not None and len(rows) >= self.pool.threshold:
+            return await self.pool.score_rows(user_vector, rows, weights)
+        return score_candidates(user_vector, self.answer_index.matrix_rows(rows), weights)
+
+    def score_users(self, user_id: int, candidate_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Совместимость пользователя с кандидатами из индекса ответов за один проход
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: telegram id кандидатов с ответами и их совместимость
+        """
+        user_vector = self.answer_index.vector(user_id)
+        found_ids, candidate_matrix = self.answer_index.matrix_for(candidate_ids)
+        if user_vector is None:
+            return found_ids, np.zeros(len(found_ids), dtype=np.float64)
+        return found_ids, self.score(user_vector, candidate_matrix)
+
+    def score_answers(self, user_answers: Dict[int, int], candidate_answers: Dict[int, int]) -> float:
+        """Совместимость одной пары по ответам {questionid: answerid}"""
+        ordinals = self.answer_index.ordinals
+        user_ordinals = ordinals.to_ordinals(user_answers)
+        candidate_ordinals = ordinals.to_ordinals(candidate_answers)
+        if not user_ordinals or not candidate_ordinals:
+            return 0.0
+
+        question_ids = self.answer_index.question_ids
+        if not set(user_ordinals) <= set(question_ids):
+            question_ids = sorted(set(question_ids) | set(user_ordinals))
+        user_vector = build_answer_vector(user_ordinals, question_ids)
+        candidate_vector = build_answer_vector(candidate_ordinals, question_ids)
+        weights = self._table_for(question_ids)
+        if weights is not None:
+            weights = weights[np.arange(len(question_ids)), user_vector.astype(np.intp)]
+        return float(score_candidates(user_vector, candidate_vector[np.newaxis, :], weights)[0])
+
+    def _table(self) -> Optional[np.ndarray]:
+        question_ids = tuple(self.answer_index.question_ids)
+        if self._weights and question_ids != self._weight_table_questions:
+            self._weight_table = self._table_for(question_ids)
+            self._weight_table_questions = question_ids
+        return self._weight_table if self._weights else None
+
+    def _table_for(self, question_ids) -> Optional[np.ndarray]:
+        """Таблица весов: строка - вопрос, столбец - номер ответа (столбец NO_ANSWER - вес 0)"""
+        if not self._weights:
+            return None
+        ordinals = self.answer_index.ordinals
+        max_ordinal = max((len(ordinals.answer_ids(q)) for q in question_ids), default=0)
+        table = np.ones((len(question_ids), max_ordinal + 1), dtype=np.float64)
+        table[:, NO_ANSWER] = 0.0
+        for row, question_id in enumerate(question_ids):
+            for ordinal, answer_id in enumerate(ordinals.answer_ids(question_id), start=1):
+                table[row, ordinal] = self._weights.get(answer_id, 1.0)
+        return table
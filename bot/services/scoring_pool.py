@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import sys
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Set, Tuple
+
+import numpy as np
+
+from bot.services.scoring import score_candidates
+
+logger = logging.getLogger(__name__)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Подключается к существующему блоку разделяемой памяти основного процесса"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # До Python 3.13 блок повторно регистрируется в resource_tracker. Воркеры пула
+    # используют трекер основного процесса, поэтому повторная регистрация ничего
+    # не меняет, а снимает ее unlink в основном процессе
+    return shared_memory.SharedMemory(name=name)
+
+
+def _score_rows(
+    matrix_name: str,
+    shape: Tuple[int, int],
+    dtype: str,
+    block_name: str,
+    count: int,
+    user_vector: np.ndarray,
+    weights: Optional[np.ndarray] = None
+) -> None:
+    """Считает совместимость в процессе-воркере по номерам строк общей матрицы ответов"""
+    matrix_shm = _attach(matrix_name)
+    block_shm = _attach(block_name)
+    try:
+        matrix = np.ndarray(shape, dtype=np.dtype(dtype), buffer=matrix_shm.buf)
+        rows = np.ndarray((count,), dtype=np.int64, buffer=block_shm.buf)
+        scores = np.ndarray((count,), dtype=np.float64, buffer=block_shm.buf, offset=rows.nbytes)
+        scores[:] = score_candidates(user_vector, matrix[rows], weights)
+        del matrix, rows, scores
+    finally:
+        matrix_shm.close()
+        block_shm.close()
+
+
+class SharedMatrix:
+    """
+    Матрица индекса ответов в разделяемой памяти
+
+    AnswerIndex создает в ней каждую новую матрицу (при загрузке, росте емкости,
+    новом вопросе или расширении типа ответов), а строки обновляет на месте, поэтому
+    воркеры пула видят изменения без копирования матрицы. Замененный блок удаляется,
+    когда закончатся подсчеты, которые его читают.
+    """
+
+    def __init__(self):
+        self._current: Optional[shared_memory.SharedMemory] = None
+        self._shape: Tuple[int, int] = (0, 0)
+        self._dtype = np.dtype(np.int8)
+        # Число подсчетов в пуле, читающих блок, по имени блока
+        self._readers: Dict[str, int] = {}
+        # Замененные блоки, которые еще не удалось закрыть, и ссылки на их массивы:
+        # numpy не удерживает отображение, поэтому блок закрывается только после
+        # удаления массива (и его срезов), иначе обращение к нему упадет
+        self._retired: Dict[str, shared_memory.SharedMemory] = {}
+        self._arrays: Dict[str, weakref.ref] = {}
+        self._unlinked: Set[str] = set()
+
+    def allocate(self, shape: Tuple[int, int], dtype, fill: int) -> np.ndarray:
+        """Создает новую текущую матрицу, заполненную значением fill"""
+        dtype = np.dtype(dtype)
+        shm = shared_memory.SharedMemory(create=True, size=max(shape[0] * shape[1] * dtype.itemsize, 1))
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        array.fill(fill)
+        self._arrays[shm.name] = weakref.ref(array)
+        if self._current is not None:
+            self._retired[self._current.name] = self._current
+        self._current, self._shape, self._dtype = shm, tuple(shape), dtype
+        self._collect()
+        return array
+
+    def acquire(self) -> Tuple[str, Tuple[int, int], str]:
+        """Отмечает подсчет по текущей матрице и возвращает ее имя, форму и тип"""
+        if self._current is None:
+            raise RuntimeError("Матрица ответов не размещена в разделяемой памяти")
+        name = self._current.name
+        self._readers[name] = self._readers.get(name, 0) + 1
+        return name, self._shape, self._dtype.str
+
+    def release(self, name: str):
+        """Завершает подсчет по блоку name"""
+        readers = self._readers.get(name, 0) - 1
+        if readers > 0:
+            self._readers[name] = readers
+        else:
+            self._readers.pop(name, None)
+        self._collect()
+
+    def close(self):
+        """Удаляет все блоки (матрица индекса к этому моменту должна быть скопирована)"""
+        if self._current is not None:
+            self._retired[self._current.name] = self._current
+            self._current = None
+        self._readers.clear()
+        self._collect()
+
+    def _collect(self):
+        for name, shm in list(self._retired.items()):
+            if name in self._readers:
+                continue
+            if name not in self._unlinked:
+                shm.unlink()
+                self._unlinked.add(name)
+            if self._arrays[name]() is not None:
+                # Старая матрица еще используется в основном процессе, закроем позже
+                continue
+            shm.close()
+            del self._retired[name]
+            del self._arrays[name]
+            self._unlinked.discard(name)
+
+
+class ScoringPool:
+    """
+    Пул процессов для подсчета совместимости с большим числом кандидатов
+
+    Подсчет для threshold и более кандидатов выполняется в отдельном процессе,
+    чтобы не блокировать цикл событий aiogram. Матрица индекса ответов лежит
+    в разделяемой памяти (matrix, подключается через AnswerIndex.share), воркеру
+    передаются только номера строк кандидатов, результат возвращается через тот же
+    временный блок. Строки, измененные во время подсчета, могут быть оценены по новым ответам.
+    """
+
+    def __init__(self, max_workers: int, threshold: int):
+        self.threshold = threshold
+        self.matrix = SharedMatrix()
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        logger.info(f"Scoring process pool started: {max_workers} workers, threshold {threshold} candidates")
+
+    async def score_rows(
+        self,
+        user_vector: np.ndarray,
+        rows: np.ndarray,
+        weights: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Совместимость с кандидатами по номерам строк общей матрицы, считается в воркере"""
+        count = len(rows)
+        matrix_name, shape, dtype = self.matrix.acquire()
+        block_shm = shared_memory.SharedMemory(create=True, size=max(count * 16, 1))
+        try:
+            np.ndarray((count,), dtype=np.int64, buffer=block_shm.buf)[:] = rows
+
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                self._executor,
+                _score_rows,
+                matrix_name,
+                shape,
+                dtype,
+                block_shm.name,
+                count,
+                user_vector,
+                weights
+            )
+            return np.ndarray((count,), dtype=np.float64, buffer=block_shm.buf, offset=count * 8).copy()
+        finally:
+            block_shm.close()
+            block_shm.unlink()
+            self.matrix.release(matrix_name)
+
+    def shutdown(self):
+        """Останавливает процессы пула и удаляет блоки разделяемой памяти"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.matrix.close()
+        logger.info("Scoring process pool stopped")
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Как часто (в обращениях к кэшу) писать статистику в лог
+STATS_LOG_INTERVAL = 100
+
+
+def filters_fingerprint(**filters) -> str:
+    """Хэш набора фильтров поиска, не зависящий от порядка аргументов"""
+    payload = json.dumps(filters, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class SearchCache:
+    """
+    LRU/TTL кэш результатов поиска: (пользователь, хэш фильтров) -> ID кандидатов и совместимость
+
+    Записи удаляются по истечении ttl секунд, при превышении max_entries
+    (давно не использованные) и при изменении данных участников через invalidate_user:
+    сбрасываются поиски самого пользователя и все результаты, в которых он присутствует.
+    Новые анкеты, подходящие под фильтры, появляются в выдаче после истечения ttl.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, Tuple[int, ...], Tuple[float, ...]]]" = OrderedDict()
+        # Обратный индекс: telegram id -> ключи записей, где он владелец или кандидат
+        self._keys_by_user: Dict[int, Set[Tuple[int, str]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: int, fingerprint: str) -> Optional[Tuple[List[int], List[float]]]:
+        """Возвращает (ID кандидатов, совместимость) или None, если записи нет или она устарела"""
+        key = (user_id, fingerprint)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            self._log_stats()
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self._log_stats()
+        return list(entry[1]), list(entry[2])
+
+    def contains(self, user_id: int, fingerprint: str) -> bool:
+        """Есть ли неустаревшая запись (без учета в статистике попаданий)"""
+        entry = self._entries.get((user_id, fingerprint))
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def put(self, user_id: int, fingerprint: str, ids: List[int], scores: List[float], ttl: Optional[float] = None):
+        """Сохраняет отранжированный результат поиска (ttl - время жизни записи, по умолчанию общее)"""
+        if self.max_entries <= 0:
+            return
+        key = (user_id, fingerprint)
+        if key in self._entries:
+            self._remove(key)
+
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._entries[key] = (time.monotonic() + ttl, tuple(ids), tuple(scores))
+        for member in (user_id, *ids):
+            self._keys_by_user.setdefault(member, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def invalidate_user(self, user_id: int):
+        """Сбрасывает поиски пользователя и результаты, в которых он присутствует"""
+        keys = self._keys_by_user.get(user_id)
+        if not keys:
+            return
+        for key in list(keys):
+            self._remove(key)
+            self.invalidations += 1
+        logger.debug(f"Search cache: invalidated {len(keys)} entries for user {user_id}")
+
+    def stats(self) -> Dict[str, float]:
+        """Метрики кэша"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations
+        }
+
+    def _remove(self, key: Tuple[int, str]):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for member in (key[0], *entry[1]):
+            keys = self._keys_by_user.get(member)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_user[member]
+
+    def _log_stats(self):
+        if (self.hits + self.misses) % STATS_LOG_INTERVAL == 0:
+            stats = self.stats()
+            logger.info(
+                f"Search cache: size={stats['size']}, hit_rate={stats['hit_rate']:.1%}, "
+                f"evictions={stats['evictions']}, expirations={stats['expirations']}, "
+                f"invalidations={stats['invalidations']}"
+            )
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from aiogram.fsm.context import FSMContext
+
+from bot.services.database import Database
+
+logger = logging.getLogger(__name__)
+
+# Количество анкет, которые подгружаются из БД за один раз
+FEED_PAGE_SIZE = 10
+
+# Сколько секунд ждать дозаполнения ленты, если пользователь дошел до ее конца
+FILL_WAIT_TIMEOUT = 5
+
+# Фоновые задачи дозаполнения лент: ключ FSM пользователя -> задача
+_fill_tasks: Dict[object, asyncio.Task] = {}
+
+
+class SearchFeed:
+    """
+    Лента результатов поиска совместимых пользователей
+
+    В FSM хранится только компактный курсор: ID кандидатов, их совместимость
+    и текущая позиция (current_compatible_index). Профили подгружаются
+    страницами по FEED_PAGE_SIZE анкет при переходе к следующей анкете.
+    Лента может дозаполняться в фоне, пока пользователь смотрит первые анкеты.
+    """
+
+    def __init__(self, state: FSMContext, db: Database):
+        self.state = state
+        self.db = db
+
+    async def start(self, results: List[Dict]):
+        """Сохраняет курсор по результатам поиска и сбрасывает позицию"""
+        await self.start_ids(
+            [result['profile']['telegramid'] for result in results],
+            [result['compatibility'] for result in results]
+        )
+
+    async def start_ids(self, ids: List[int], scores: List[float], complete: bool = True) -> str:
+        """
+        Сохраняет курсор по готовым спискам ID и совместимости и сбрасывает позицию
+
+        Returns:
+            str: Токен ленты, по которому фоновое дозаполнение узнает свою ленту
+        """
+        self._cancel_fill()
+        token = uuid.uuid4().hex
+        await self.state.update_data(
+            search_feed={'ids': list(ids), 'scores': list(scores), 'token': token, 'complete': complete},
+            search_feed_page=None,
+            current_compatible_index=0
+        )
+        logger.debug(f"Лента поиска инициализирована: {len(ids)} анкет")
+        return token
+
+    def fill_in_background(
+        self,
+        token: str,
+        chunks: AsyncIterator[List[Dict]],
+        on_complete: Optional[Callable[[List[int], List[float]], None]] = None
+    ):
+        """Дозаполняет ленту частями результатов поиска в фоновой задаче"""
+        self._cancel_fill()
+        key = self.state.key
+        task = asyncio.create_task(self._fill(token, chunks, on_complete))
+        _fill_tasks[key] = task
+
+        def forget(done: asyncio.Task):
+            if _fill_tasks.get(key) is done:
+                del _fill_tasks[key]
+
+        task.add_done_callback(forget)
+
+    async def length(self, min_length: int = None) -> int:
+        """
+        Количество анкет в ленте
+
+        Если задан min_length и лента еще дозаполняется, ждет (не дольше FILL_WAIT_TIMEOUT),
+        пока в ней не станет min_length анкет или пока поиск не завершится.
+        """
+        feed = await self._feed()
+        task = _fill_tasks.get(self.state.key)
+        if min_length is None or task is None:
+            return len(feed.get('ids', []))
+
+        # Дозаполнению ленты нужны соединения из пула, свое на время ожидания отдаем
+        await self.db.release_connection()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + FILL_WAIT_TIMEOUT
+        while len(feed.get('ids', [])) < min_length and not feed.get('complete', True) and not task.done():
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            await asyncio.wait({task}, timeout=min(timeout, 0.2))
+            feed = await self._feed()
+        return len(feed.get('ids', []))
+
+    async def get(self, index: int) -> Optional[Dict]:
+        """Возвращает анкету по позиции в ленте, подгружая страницу профилей при необходимости"""
+        data = await self.state.get_data()
+        feed = data.get('search_feed') or {}
+        ids = feed.get('ids', [])
+        if not 0 <= index < len(ids):
+            return None
+
+        page_start = index - index % FEED_PAGE_SIZE
+        page = data.get('search_feed_page')
+        # Страница могла быть загружена неполной до дозаполнения ленты
+        if not page or page['start'] != page_start or index - page_start >= len(page['profiles']):
+            page_ids = ids[page_start:page_start + FEED_PAGE_SIZE]
+            profiles = await self.db.get_profiles_by_ids(page_ids)
+            page = {'start': page_start, 'profiles': [profiles.get(user_id) for user_id in page_ids]}
+            await self.state.update_data(search_feed_page=page)
+            logger.debug(f"Загружена страница ленты с позиции {page_start}: {len(profiles)} анкет")
+
+        profile = page['profiles'][index - page_start]
+        if profile is None:
+            # Пользователь удалил анкету после поиска
+            return None
+
+        return {'profile': dict(profile), 'compatibility': feed['scores'][index]}
+
+    async def _feed(self) -> Dict:
+        data = await self.state.get_data()
+        return data.get('search_feed') or {}
+
+    async def _fill(self, token: str, chunks: AsyncIterator[List[Dict]], on_complete):
+        try:
+            async for chunk in chunks:
+                feed = await self._feed()
+                if feed.get('token') != token:
+                    # Пользователь начал новый поиск
+                    return
+                feed['ids'] = feed['ids'] + [result['profile']['telegramid'] for result in chunk]
+                feed['scores'] = feed['scores'] + [result['compatibility'] for result in chunk]
+                await self.state.update_data(search_feed=feed)
+
+            feed = await self._feed()
+            if feed.get('token') != token:
+                return
+            feed['complete'] = True
+            await self.state.update_data(search_feed=feed)
+            logger.debug(f"Лента поиска дозаполнена: {len(feed['ids'])} анкет")
+            if on_complete is not None:
+                on_complete(feed['ids'], feed['scores'])
+        except Exception as e:
+            logger.error(f"Ошибка дозаполнения ленты поиска: {e}")
+            logger.exception(e)
+            # Лента неполная: не отмечаем ее завершенной и не кладем в кэш (on_complete),
+            # навигация перестает ждать, так как задача дозаполнения завершилась
+            feed = await self._feed()
+            if feed.get('token') == token:
+                feed['failed'] = True
+                await self.state.update_data(search_feed=feed)
+        finally:
+            await chunks.aclose()
+
+    def _cancel_fill(self):
+        task = _fill_tasks.pop(self.state.key, None)
+        if task is not None and not task.done():
+            task.cancel()
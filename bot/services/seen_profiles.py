@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from bot.services.database import Database
+
+logger = logging.getLogger(__name__)
+
+EMPTY_IDS = np.zeros(0, dtype=np.int64)
+
+
+class SeenProfiles:
+    """
+    Анкеты, которые пользователь уже оценил в поиске (лайк, дизлайк, жалоба)
+
+    Анкеты, которые пользователь только пролистал, не отмечаются и снова попадут в поиск.
+
+    В памяти для недавно искавших пользователей (не больше max_users, LRU) хранится
+    отсортированный массив telegram id просмотренных анкет. Отметки пишутся в таблицу
+    profile_views отложенно: повторные отметки одной пары схлопываются, буфер
+    сбрасывается одним INSERT раз в flush_interval секунд или при накоплении batch_size строк.
+    """
+
+    def __init__(self, db: "Database", flush_interval: float = 5.0, batch_size: int = 500, max_users: int = 10000):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_users = max_users
+        self._seen: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        # Отметки, которых еще нет в _seen или в БД (для незагруженных пользователей)
+        self._recent: Dict[int, List[int]] = {}
+        # Буфер записи: (кто смотрел, чью анкету) -> действие
+        self._pending: Dict[Tuple[int, int], str] = {}
+        self._loading: Set[int] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запускает фоновый сброс буфера в БД"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info("Seen profiles writer started")
+
+    async def stop(self):
+        """Останавливает фоновый сброс и записывает оставшийся буфер"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        logger.info("Seen profiles writer stopped")
+
+    def mark(self, viewer_id: int, viewed_id: int, action: str):
+        """Отмечает анкету viewed_id просмотренной пользователем viewer_id"""
+        self._pending[(viewer_id, viewed_id)] = action
+        self._recent.setdefault(viewer_id, []).append(viewed_id)
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def forget(self, user_id: int):
+        """Удаляет из памяти просмотры пользователя (при удалении анкеты)"""
+        self._seen.pop(user_id, None)
+        self._recent.pop(user_id, None)
+        self._pending = {pair: action for pair, action in self._pending.items() if user_id not in pair}
+
+    async def seen_ids(self, viewer_id: int) -> np.ndarray:
+        """Отсортированный массив telegram id анкет, которые пользователь уже оценил"""
+        ids = self._seen.get(viewer_id)
+        if ids is None:
+            self._loading.add(viewer_id)
+            try:
+                ids = await self.db.get_seen_profile_ids(viewer_id)
+            finally:
+                self._loading.discard(viewer_id)
+        else:
+            self._seen.move_to_end(viewer_id)
+
+        recent = self._recent.pop(viewer_id, None)
+        if recent:
+            ids = np.union1d(ids, np.asarray(recent, dtype=np.int64))
+        self._seen[viewer_id] = ids
+        while len(self._seen) > self.max_users:
+            self._seen.popitem(last=False)
+        return ids
+
+    async def flush(self):
+        """Записывает накопленные отметки в БД одним запросом"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            await self.db.save_profile_views(
+                [viewer_id for viewer_id, _ in batch],
+                [viewed_id for _, viewed_id in batch],
+                list(batch.values())
+            )
+        except Exception as e:
+            logger.error(f"Ошибка записи просмотренных анкет: {e}")
+            logger.exception(e)
+            # Возвращаем строки в буфер, более новые отметки тех же пар важнее
+            for pair, action in batch.items():
+                self._pending.setdefault(pair, action)
+            return
+
+        # Записанные отметки незагруженных пользователей прочитаются из БД
+        for viewer_id in {viewer_id for viewer_id, _ in batch}:
+            if viewer_id in self._seen or viewer_id in self._loading:
+                continue
+            recent = [viewed_id for viewed_id in self._recent.get(viewer_id, []) if (viewer_id, viewed_id) not in batch]
+            if recent:
+                self._recent[viewer_id] = recent
+            else:
+                self._recent.pop(viewer_id, None)
+        logger.debug(f"Seen profiles: flushed {len(batch)} rows")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Единица работы текущего апдейта (или вызова Database.unit_of_work)
+current_unit_of_work: ContextVar[Optional["UnitOfWork"]] = ContextVar('db_unit_of_work', default=None)
+
+
+class UnitOfWork:
+    """
+    Одно соединение из пула на апдейт, общее для всех методов Database
+
+    Соединение берется из пула при первом запросе и возвращается при выходе из единицы
+    работы, поэтому вложенные вызовы методов Database (например, check_user_subscription
+    внутри транзакции update_user_photos) не занимают дополнительных соединений.
+    Перед долгим ожиданием (фоновый расчет ленты) соединение возвращается в пул
+    через release и при следующем запросе берется заново. Транзакция открывается
+    только явно (transaction), вложенные транзакции становятся точками сохранения.
+
+    Соединение переиспользует только задача, создавшая единицу работы: запросы
+    фоновых задач, запущенных из обработчика, идут через пул, так как asyncpg
+    не допускает параллельных запросов на одном соединении.
+    """
+
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+        self._task = asyncio.current_task()
+        self._conn: Optional[asyncpg.Connection] = None
+        self._transactions = 0
+        self._closed = False
+
+    def is_current(self) -> bool:
+        """Можно ли использовать соединение единицы работы в текущей задаче"""
+        return not self._closed and asyncio.current_task() is self._task
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[asyncpg.Connection]:
+        """Соединение единицы работы, а для других задач и после завершения - соединение из пула"""
+        if not self.is_current():
+            async with self.pool.acquire() as conn:
+                yield conn
+            return
+        if self._conn is None:
+            self._conn = await self.pool.acquire()
+        yield self._conn
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[asyncpg.Connection]:
+        """Транзакция на соединении единицы работы: фиксация при успехе, откат при исключении"""
+        async with self.acquire() as conn:
+            self._transactions += 1
+            try:
+                async with conn.transaction():
+                    yield conn
+            finally:
+                self._transactions -= 1
+
+    async def release(self):
+        """Возвращает соединение в пул, если внутри нет открытой транзакции"""
+        if self._conn is None or self._transactions:
+            return
+        conn, self._conn = self._conn, None
+        await self.pool.release(conn)
+
+    async def close(self):
+        """Завершает единицу работы и возвращает соединение в пул"""
+        self._closed = True
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await self.pool.release(conn)
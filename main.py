@@ -9,6 +9,10 @@ from bot.config import load_config
 from bot.handlers import routers
 from bot.services.database import Database
 from bot.services.encryption import CryptoService
+from bot.services.compatibility_refresher import CompatibilityRefresher
+from bot.services.feed_prewarmer import FeedPrewarmer
+from bot.services.priority_scheduler import PriorityScheduler
+from bot.services.scoring_pool import ScoringPool
 from bot.middlewares.basic import DependencyInjectionMiddleware
 from bot.services.s3storage import S3Service
 
@@ -41,6 +45,45 @@ async def main():
         await db.connect()
         crypto = CryptoService(config.cryptography_key)
         s3 = S3Service(config)
+
+        # Фоновый пересчет предрасчитанной совместимости
+        if config.compatibility_backend == 'precomputed':
+            db.compatibility_refresher = CompatibilityRefresher(
+                db,
+                crypto,
+                batch_size=config.compatibility_refresh_batch_size,
+                throttle=config.compatibility_refresh_throttle
+            )
+            db.compatibility_refresher.start()
+            await db.compatibility_refresher.enqueue_missing()
+
+        # Подсчет совместимости с большим числом кандидатов в отдельных процессах
+        if config.compatibility_process_pool_workers > 0:
+            db.scoring_engine.pool = ScoringPool(
+                max_workers=config.compatibility_process_pool_workers,
+                threshold=config.compatibility_process_pool_threshold
+            )
+            # Матрица ответов переносится в разделяемую память один раз, воркерам передаются номера строк
+            db.answer_index.share(db.scoring_engine.pool.matrix)
+        # Отложенная запись просмотренных в поиске анкет и времени последнего действия
+        db.seen_profiles.start()
+        db.last_actions.start()
+        # Блокировки из других процессов бота приходят через LISTEN/NOTIFY
+        if config.blocked_users_listen:
+            await db.blocked_users.start()
+        # Пересчет коэффициента приоритета при окончании услуг
+        db.priority_scheduler = PriorityScheduler(db, max_sleep=config.priority_sweep_max_sleep)
+        await db.priority_scheduler.start()
+        # Фоновый расчет ленты поиска после теста и при показе главного меню
+        if config.feed_prewarm_workers > 0:
+            db.feed_prewarmer = FeedPrewarmer(
+                db,
+                crypto,
+                workers=config.feed_prewarm_workers,
+                ttl=config.feed_prewarm_ttl,
+                max_queue=config.feed_prewarm_queue_size
+            )
+            db.feed_prewarmer.start()
         logger.info("Services initialized")
 
         # Создаем сессию с таймаутом в секундах (целое число)
@@ -83,6 +126,19 @@ async def main():
     except Exception as e:
         logger.exception(f"Fatal error during bot initialization: {e}")
     finally:
+        if 'db' in locals() and db.feed_prewarmer is not None:
+            await db.feed_prewarmer.stop()
+        if 'db' in locals():
+            await db.seen_profiles.stop()
+            await db.last_actions.stop()
+            await db.blocked_users.stop()
+        if 'db' in locals() and db.priority_scheduler is not None:
+            await db.priority_scheduler.stop()
+        if 'db' in locals() and db.compatibility_refresher is not None:
+            await db.compatibility_refresher.stop()
+        if 'db' in locals() and db.scoring_engine.pool is not None:
+            db.answer_index.share(None)
+            db.scoring_engine.pool.shutdown()
         if 'bot' in locals():
             await bot.session.close()
         logger.info("Bot stopped gracefully")